@@ -0,0 +1,58 @@
+# Benchmark_Dashboard.py
+#
+# Renders the Manager or Receptionist dashboard headlessly (streamlit AppTest)
+# against the configured Supabase project and reports the HTTP round trips and
+# wall time of each render, with the per-query breakdown from Repository.
+#
+#   python Benchmark_Dashboard.py [--page manager|receptionist] [--renders 3] [--user-id ID]
+
+import argparse
+import time
+from collections import Counter
+from streamlit.testing.v1 import AppTest
+from Repository import RoundTrips, query_report
+
+PAGES = {
+    "manager": "Manager.Dashboard",
+    "receptionist": "Receptionist.Dashboard",
+}
+
+
+def render_dashboard():
+    import importlib
+    import streamlit as st
+
+    module = importlib.import_module(st.session_state["benchmark_module"])
+    module.Dashboard(is_light=True)
+
+
+def benchmark(page="manager", renders=3, user_id=None):
+    app = AppTest.from_function(render_dashboard, default_timeout=60)
+    app.session_state["benchmark_module"] = PAGES[page]
+    app.session_state["privacy_shown_once"] = True  # keep the privacy dialog out of the timings
+    if user_id is not None:
+        app.session_state["USER_ID"] = user_id
+
+    print(f"{'render':<8}{'round trips':>12}{'ms':>10}  tables")
+    for render in range(1, renders + 1):
+        with RoundTrips() as trips:
+            start = time.perf_counter()
+            app.run()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        tables = ", ".join(f"{table}×{n}" for table, n in Counter(trips.paths).most_common())
+        print(f"{render:<8}{trips.count:>12}{elapsed_ms:>10.0f}  {tables}")
+        for exception in app.exception:
+            print(f"    exception: {exception.message}")
+
+    print(f"\n{'query':<40}{'calls':>7}{'rows':>7}{'avg ms':>9}")
+    for row in query_report():
+        print(f"{row['query']:<40}{row['calls']:>7}{row['rows']:>7}{row['avg_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count Supabase round trips per dashboard render.")
+    parser.add_argument("--page", choices=PAGES, default="manager")
+    parser.add_argument("--renders", type=int, default=3)
+    parser.add_argument("--user-id", type=int, help="USER_ID to render as (enables the privacy lookup)")
+    args = parser.parse_args()
+    benchmark(args.page, args.renders, args.user_id)
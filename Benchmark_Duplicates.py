@@ -0,0 +1,120 @@
+# Benchmark_Duplicates.py
+#
+# Times the registration duplicate-patient check against a synthetic patient
+# table in the SQLite stand-in (Local_Database.py): the previous two sequential
+# case-insensitive scans (full match, then near match) against the single
+# indexed find_duplicate_patients lookup of sql/patient_duplicates.sql.
+#
+#   python Benchmark_Duplicates.py [--patients 100000] [--checks 500] [--seed 0]
+
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from Local_Database import LocalDatabase
+from Repository import find_duplicate_patients, use_local_database
+
+FIRST_NAMES = [
+    "Juan", "Jose", "Maria", "Ana", "Rosario", "Felipe", "Vicente", "Cristina", "Jhon", "Mark", "Janette",
+    "Ricardo", "Carmelita", "Rogelio", "Teresita", "Virgilio", "Josefina", "Eduardo", "Lourdes", "Francisco",
+]
+LAST_NAMES = [
+    "Dela Cruz", "Santos", "Reyes", "Garcia", "Mendoza", "Villanueva", "Castillo", "Flores", "Ramos", "Bautista",
+    "Cabahug", "Ouano", "Seno", "Alcoseba", "Cuizon", "Yap", "Go", "Pepito", "Quijano", "Sanchez",
+]
+# Spellings a receptionist might type for the same person
+VARIANTS = [("ph", "f"), ("v", "b"), ("c", "k"), ("o", "u"), ("e", "i"), ("z", "s"), ("tt", "t"), ("Jhon", "John")]
+
+# The previous check: two PostgREST ilike queries, i.e. unindexed lower() comparisons
+FULL_MATCH = """
+select "PT_ID" from "PATIENT_Table" not indexed
+where lower("PT_FNAME") = lower(:fname) and lower("PT_LNAME") = lower(:lname)
+  and "PT_DOB" = :dob and lower(coalesce("PT_MNAME", '')) = lower(:mname)
+"""
+NEAR_MATCH = """
+select "PT_ID", "PT_FNAME", "PT_MNAME", "PT_LNAME" from "PATIENT_Table" not indexed
+where lower("PT_FNAME") = lower(:fname) and lower("PT_LNAME") = lower(:lname) and "PT_DOB" = :dob
+"""
+
+
+def synthetic_patients(patients, rng):
+    start = date(1940, 1, 1)
+    return [{
+        "PT_ID": pt_id,
+        "PT_FNAME": rng.choice(FIRST_NAMES),
+        "PT_MNAME": rng.choice(LAST_NAMES + [""]),
+        "PT_LNAME": rng.choice(LAST_NAMES),
+        "PT_DOB": (start + timedelta(days=rng.randrange(80 * 365))).isoformat(),
+    } for pt_id in range(1, patients + 1)]
+
+
+def misspell(name, rng):
+    applicable = [(old, new) for old, new in VARIANTS if old in name]
+    if not applicable:
+        return name
+    old, new = rng.choice(applicable)
+    return name.replace(old, new, 1)
+
+
+def registrations(rows, checks, rng):
+    """Re-registrations of existing patients (as typed, with another middle name, misspelt) and new ones."""
+    for _ in range(checks):
+        row = rng.choice(rows)
+        kind = rng.choice(["same", "middle", "misspelt", "new"])
+        fname, mname, lname, dob = row["PT_FNAME"], row["PT_MNAME"], row["PT_LNAME"], row["PT_DOB"]
+        if kind == "middle":
+            mname = rng.choice(LAST_NAMES)
+        elif kind == "misspelt":
+            fname, lname = misspell(fname, rng), misspell(lname, rng)
+        elif kind == "new":
+            dob = (date.fromisoformat(dob) + timedelta(days=1)).isoformat()
+        yield fname.upper() if kind == "same" else fname, mname, lname, dob
+
+
+def legacy_check(connection, fname, mname, lname, dob):
+    params = {"fname": fname, "lname": lname, "dob": dob, "mname": mname if len(mname) > 1 else ""}
+    if connection.execute(FULL_MATCH, params).fetchall():
+        return "exact", 1
+    if connection.execute(NEAR_MATCH, params).fetchall():
+        return "near", 2
+    return None, 2
+
+
+def indexed_check(fname, mname, lname, dob):
+    kinds = [match.match for match in find_duplicate_patients(fname, mname, lname, dob)]
+    return (kinds[0] if kinds else None), 1
+
+
+def benchmark(patients=100000, checks=500, seed=0):
+    rng = random.Random(seed)
+    rows = synthetic_patients(patients, rng)
+    database = LocalDatabase().insert("PATIENT_Table", rows)
+    use_local_database(database)
+    cases = list(registrations(rows, checks, rng))
+
+    print(f"{patients} patients, {checks} checks\n")
+    print(f"{'check':<10}{'queries':>9}{'avg ms':>9}{'exact':>7}{'near':>6}{'similar':>9}")
+    for label, check in (
+        ("legacy", lambda *case: legacy_check(database.connection, *case)),
+        ("indexed", indexed_check),
+    ):
+        found = {"exact": 0, "near": 0, "similar": 0}
+        queries = 0
+        start = time.perf_counter()
+        for case in cases:
+            kind, count = check(*case)
+            queries += count
+            if kind:
+                found[kind] += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"{label:<10}{queries / checks:>9.2f}{elapsed_ms / checks:>9.3f}"
+              f"{found['exact']:>7}{found['near']:>6}{found['similar']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the duplicate-patient check on a synthetic patient table.")
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--checks", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark(args.patients, args.checks, args.seed)
@@ -0,0 +1,103 @@
+# Benchmark_Heatmap.py
+#
+# Times the Heatmap risk computation on synthetic confirmed cases, one row per
+# case: the per-record Python loops the page used before (counts, the risk loop
+# over the barangays, heat points, and a scan of every case per barangay for its
+# marker) against the column-wise HeatmapRisk engine, and checks they agree on
+# the risk levels, the marked barangays and the total heat intensity.
+#
+#   python Benchmark_Heatmap.py [--sizes 10000,100000,1000000] [--monthly] [--seed 0]
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from Manager.Heatmap import HeatmapRisk, incidence_rate, mandaue_barangay_population_2025, risk_weights
+from Manager.Manage_Cases import mandaue_barangay_coordinates
+from Repository import HeatmapCell
+
+
+def synthetic_cases(size, rng):
+    """
+        One confirmed case per row at its barangay's coordinates, as Manage
+        Cases places them; a few are in no known barangay or have none.
+    """
+    barangays = list(mandaue_barangay_population_2025) + ["Unknown"]
+    coordinates = np.array([mandaue_barangay_coordinates.get(name, (10.32, 123.94)) for name in barangays])
+    picks = rng.integers(len(barangays), size=size)
+    brgy = np.array(barangays)[picks]
+    lat, lng = coordinates[picks, 0], coordinates[picks, 1]
+    lat[rng.random(size) < 0.01] = np.nan
+    return pd.DataFrame({
+        "brgy": pd.Series(brgy, dtype="string[pyarrow]"),
+        "year": 2025,
+        "month": rng.integers(1, 13, size=size),
+        "age_group": pd.Series(np.array(["0-14", "15-24", "25-64", "65+"])[rng.integers(4, size=size)], dtype="string[pyarrow]"),
+        "sex": pd.Series(np.array(["Male", "Female"])[rng.integers(2, size=size)], dtype="string[pyarrow]"),
+        "cases": 1,
+        "lat": lat,
+        "lng": lng,
+    })
+
+
+def loop_risk(records, monthly):
+    """The previous page logic, one Python iteration per record."""
+    confirmed_counts = {}
+    for record in records:
+        confirmed_counts[record.brgy] = confirmed_counts.get(record.brgy, 0) + 1
+
+    risk_levels = {}
+    for brgy, pop in mandaue_barangay_population_2025.items():
+        target = int(round(pop * incidence_rate / (12 if monthly else 1)))
+        risk_percent = min(round((confirmed_counts.get(brgy, 0) / target if target > 0 else 0) * 100), 100)
+        if risk_percent >= 75:
+            risk_levels[brgy] = ("High Risk", "red")
+        elif risk_percent >= 55:
+            risk_levels[brgy] = ("Moderate Risk", "orange")
+        else:
+            risk_levels[brgy] = ("Low Risk", "green")
+
+    confirmed_records = [record for record in records if record.lat == record.lat]  # not NaN
+    heat_data = [[record.lat, record.lng, risk_weights.get(risk_levels.get(record.brgy, ("", "gray"))[1], 1)]
+                 for record in confirmed_records]
+
+    markers = {}
+    for brgy in risk_levels:
+        if confirmed_counts.get(brgy, 0) == 0:
+            continue
+        brgy_confirmed_records = [record for record in confirmed_records if record.brgy == brgy]
+        if brgy_confirmed_records:
+            markers[brgy] = (brgy_confirmed_records[0].lat, brgy_confirmed_records[0].lng)
+    return risk_levels, heat_data, markers
+
+
+def benchmark(sizes=(10000, 100000, 1000000), monthly=False, seed=0):
+    rng = np.random.default_rng(seed)
+    print(f"{'cases':>10}{'loop ms':>11}{'engine ms':>11}{'speed-up':>10}  agree")
+    for size in sizes:
+        frame = synthetic_cases(size, rng)
+        records = [HeatmapCell(*row) for row in frame.itertuples(index=False)]
+
+        start = time.perf_counter()
+        risk_levels, heat_data, markers = loop_risk(records, monthly)
+        loop_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        risk = HeatmapRisk(frame, monthly)
+        engine_heat_data = risk.heat_data()
+        engine_markers = risk.markers()
+        engine_ms = (time.perf_counter() - start) * 1000
+
+        agree = (risk.risk_levels == risk_levels
+                 and sorted(engine_markers.index) == sorted(markers)
+                 and sum(point[2] for point in engine_heat_data) == sum(point[2] for point in heat_data))
+        print(f"{size:>10}{loop_ms:>11.0f}{engine_ms:>11.0f}{loop_ms / engine_ms:>9.1f}x  {'yes' if agree else 'NO'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the Heatmap risk computation on synthetic cases.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated case counts")
+    parser.add_argument("--monthly", action="store_true", help="use monthly instead of annual targets")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark([int(size) for size in args.sizes.split(",")], args.monthly, args.seed)
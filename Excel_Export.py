@@ -0,0 +1,127 @@
+# Excel_Export.py
+#
+# Streaming .xlsx exports for the Heatmap and Reports pages. Workbooks are
+# opened write-only, so each row goes to the file as it is appended instead of
+# a cell grid held in memory until save, and cells take one of the named styles
+# registered on the workbook up front rather than their own Font/Fill/Alignment
+# objects. Write-only sheets fix their column widths before the first row, so
+# widths are either constants or measured while the rows are laid out.
+#
+# Exports are built on demand: export_button() only runs the generator once the
+# user asks for the file, not on every rerun of the page.
+
+import io
+import streamlit as st
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def solid_fill(color):
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+# Styles every export uses; pages add their own (row fills, risk colours) by name
+BASE_STYLES = {
+    "title": {"font": Font(bold=True, size=14)},
+    "subtitle": {"font": Font(bold=True, size=12)},
+    "bold": {"font": Font(bold=True)},
+    "italic": {"font": Font(italic=True)},
+    "note": {"font": Font(italic=True, color="808080")},
+    "header": {"font": Font(bold=True), "fill": solid_fill("CCCCCC"), "alignment": Alignment(horizontal="center")},
+    "center": {"alignment": Alignment(horizontal="center")},
+    "left": {"alignment": Alignment(horizontal="left")},
+}
+
+
+# Class wrapping a write-only workbook and its named styles
+class ExcelExport:
+    def __init__(self, styles=None):
+        self.workbook = Workbook(write_only=True)
+        # Fresh NamedStyle objects per workbook: a style is bound to the workbook it is added to.
+        # Styles without a font keep the workbook default rather than an empty one
+        for name, attributes in {**BASE_STYLES, **(styles or {})}.items():
+            self.workbook.add_named_style(NamedStyle(name=name, **{"font": DEFAULT_FONT, **attributes}))
+
+    def sheet(self, title, widths=()):
+        return ExcelSheet(self.workbook.create_sheet(title), widths)
+
+    def to_bytes(self):
+        stream = io.BytesIO()
+        self.workbook.save(stream)
+        return stream.getvalue()
+
+
+# Class appending styled rows to one write-only worksheet
+class ExcelSheet:
+    def __init__(self, worksheet, widths=()):
+        self.worksheet = worksheet
+        self.row = 0
+        # Column widths go in the sheet header, ahead of the rows
+        for column, width in enumerate(widths, start=1):
+            if width:
+                worksheet.column_dimensions[get_column_letter(column)].width = width
+
+    def append(self, values=(), style=None, merge=0):
+        """
+            Write the next row and return its number. `style` names the style
+            of every cell in the row, or is a list with one name per column
+            (None leaves a cell unstyled); None values are left empty. `merge`
+            spans the first cell over that many columns.
+        """
+        styles = style if isinstance(style, (list, tuple)) else [style] * len(values)
+        cells = []
+        for value, name in zip(values, styles):
+            if value is None or name is None:
+                cells.append(value)
+                continue
+            cell = WriteOnlyCell(self.worksheet, value)
+            cell.style = name
+            cells.append(cell)
+        self.worksheet.append(cells)
+
+        self.row += 1
+        if merge > 1:
+            self.worksheet.merged_cells.add(f"A{self.row}:{get_column_letter(merge)}{self.row}")
+        return self.row
+
+    def letterhead(self, span):
+        """The City Health Office header of rows 1 to 6, each line merged over `span` columns."""
+        self.append(["Mandaue City Health Office"], "title", merge=span)
+        self.append(["S.B. Cabahug, Mandaue City, Philippines."], merge=span)
+        self.append(["Call us on: +63 (032) 230 4500 | FB: Mandaue City Public Affairs Office | Email: cmo@mandauecity.gov.ph"], merge=span)
+        self.append()
+        self.append(["DeteXTB: AI-Assisted Presumptive Tuberculosis Detection and Mapping System"], "subtitle", merge=span)
+        self.append()
+
+
+def fitted_widths(rows, padding=5):
+    """Widths of the columns of `rows` fitted to their longest value, in one pass (None where a column is empty)."""
+    widths = []
+    for row in rows:
+        if len(row) > len(widths):
+            widths += [0] * (len(row) - len(widths))
+        for column, value in enumerate(row):
+            if value is not None:
+                widths[column] = max(widths[column], len(str(value)))
+    return [width + padding if width else None for width in widths]
+
+
+def export_button(label, build, file_name, key, source, mime=XLSX_MIME):
+    """
+        A button that calls build() only when clicked, then offers the bytes
+        it returned for download. `source` identifies what the file was built
+        from (filters, fetched data); once it changes the prepared file is
+        dropped and the button asks again, so a stale export is never served.
+    """
+    prepared = st.session_state.get(key)
+    if prepared is not None and prepared[0] == source:
+        st.download_button(label, data=prepared[1], file_name=file_name, mime=mime,
+                           key=f"{key}-file", icon=":material/download:", type="primary")
+    elif st.button(label, key=f"{key}-build"):
+        st.session_state[key] = (source, build())
+        st.rerun()
@@ -0,0 +1,136 @@
+# Export_Model.py
+#
+# One-time export of the Keras model to TFLite for CPU-only clinic servers,
+# and an accuracy-parity check of the exported models against the Keras model
+# on DATASET_Table-labelled X-rays stored locally.
+#
+#   python Export_Model.py export [--int8 --calibration-dir DATASET_DIR]
+#   python Export_Model.py check --dataset-dir DATASET_DIR [--download]
+#
+# Select the exported model at runtime with DETEXTB_BACKEND=tflite or tflite-int8.
+
+import argparse
+import os
+import sys
+import numpy as np
+import requests
+import tensorflow as tf
+from Repository import fetch_dataset_labels
+from Inference import MODEL_FILE, TFLITE_MODEL_FILE, TFLITE_INT8_MODEL_FILE, get_model_server, interpret_prediction
+from Xray import preprocess_xray
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+PARITY_BATCH_SIZE = 16
+
+
+def list_images(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def export_tflite(int8=False, calibration_dir=None, calibration_samples=100):
+    model = get_model_server(MODEL_FILE).load().model
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    output_file = TFLITE_MODEL_FILE
+
+    if int8:
+        if not calibration_dir:
+            sys.exit("--calibration-dir is required for --int8 (a folder of representative X-rays).")
+        calibration_paths = list_images(calibration_dir)[:calibration_samples]
+        if not calibration_paths:
+            sys.exit(f"No images found in {calibration_dir}.")
+
+        def representative_dataset():
+            for path in calibration_paths:
+                yield [preprocess_xray(path).astype(np.float32)]
+
+        # Weights and activations are int8; input/output stay float32 so predict_tb is unchanged
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        output_file = TFLITE_INT8_MODEL_FILE
+
+    with open(output_file, "wb") as f:
+        f.write(converter.convert())
+    print(f"Wrote {output_file} ({os.path.getsize(output_file) / 1e6:.1f} MB)")
+
+
+def fetch_labelled_images(dataset_dir, download=False):
+    """Return [(local_path, 1 for Confirmed Positive else 0)] for DATASET_Table rows found in dataset_dir."""
+    os.makedirs(dataset_dir, exist_ok=True)
+
+    labelled = []
+    for row in fetch_dataset_labels():
+        local_path = os.path.join(dataset_dir, os.path.basename(row.file_path))
+        if not os.path.exists(local_path) and download:
+            response = requests.get(row.file_path, timeout=30)
+            if response.ok:
+                with open(local_path, "wb") as f:
+                    f.write(response.content)
+        if os.path.exists(local_path):
+            labelled.append((local_path, 1 if row.label == "Confirmed Positive" else 0))
+    return labelled
+
+
+def predict_probabilities(model_file, paths):
+    server = get_model_server(model_file)
+    probabilities = []
+    for start in range(0, len(paths), PARITY_BATCH_SIZE):
+        batch = np.concatenate([preprocess_xray(path) for path in paths[start:start + PARITY_BATCH_SIZE]], axis=0)
+        probabilities.extend(float(pred[0]) for pred in server.predict(batch))
+    return np.array(probabilities)
+
+
+def check_parity(dataset_dir, download=False, min_agreement=0.99):
+    labelled = fetch_labelled_images(dataset_dir, download)
+    if not labelled:
+        sys.exit(f"No DATASET_Table images found in {dataset_dir}. Use --download to fetch them.")
+
+    paths = [path for path, _ in labelled]
+    labels = np.array([label for _, label in labelled])
+    reference = predict_probabilities(MODEL_FILE, paths)
+    reference_labels = reference > 0.5
+
+    print(f"{len(paths)} labelled X-rays")
+    print(f"{'model':<45}{'accuracy':>10}{'agreement':>11}{'max |Δp|':>10}")
+    print(f"{MODEL_FILE:<45}{(reference_labels == labels).mean():>10.3f}{1.0:>11.3f}{0.0:>10.4f}")
+
+    passed = True
+    for model_file in (TFLITE_MODEL_FILE, TFLITE_INT8_MODEL_FILE):
+        if not os.path.exists(model_file):
+            continue
+        candidate = predict_probabilities(model_file, paths)
+        agreement = ((candidate > 0.5) == reference_labels).mean()
+        accuracy = ((candidate > 0.5) == labels).mean()
+        print(f"{model_file:<45}{accuracy:>10.3f}{agreement:>11.3f}{np.abs(candidate - reference).max():>10.4f}")
+
+        disagreements = [(path, interpret_prediction(k), interpret_prediction(c))
+                         for path, k, c in zip(paths, reference, candidate) if (k > 0.5) != (c > 0.5)]
+        for path, keras_result, candidate_result in disagreements:
+            print(f"    {os.path.basename(path)}: keras={keras_result} {model_file}={candidate_result}")
+        passed = passed and agreement >= min_agreement
+
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the DeteXTB model to TFLite and check accuracy parity.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--int8", action="store_true", help="post-training int8 quantization")
+    export_parser.add_argument("--calibration-dir", help="folder of representative X-rays for int8 calibration")
+    export_parser.add_argument("--calibration-samples", type=int, default=100)
+
+    check_parser = subparsers.add_parser("check")
+    check_parser.add_argument("--dataset-dir", required=True, help="folder holding DATASET_Table images by file name")
+    check_parser.add_argument("--download", action="store_true", help="download missing DATASET_Table images")
+    check_parser.add_argument("--min-agreement", type=float, default=0.99)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_tflite(args.int8, args.calibration_dir, args.calibration_samples)
+    else:
+        sys.exit(0 if check_parity(args.dataset_dir, args.download, args.min_agreement) else 1)
@@ -0,0 +1,528 @@
+# Inference.py
+
+import os
+import io
+import sys
+import queue
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+
+# TensorFlow is imported on first use (see load_tensorflow) so pages that never
+# run inference, such as Login and every Manager page, do not pay for it
+
+# --- Model Configuration ---
+MODEL_FILE = "deteXTB_final_mandaue_model.keras"
+MODEL_URL = "https://drive.google.com/uc?id=19Qi6uLhoTAz6QrH9cQC9oRR9rkSe5T91"
+
+# --- CPU Backend Selection ---
+# The .tflite files are produced once by Export_Model.py
+TFLITE_MODEL_FILE = "deteXTB_final_mandaue_model.tflite"
+TFLITE_INT8_MODEL_FILE = "deteXTB_final_mandaue_model_int8.tflite"
+# Tiny stand-in model for exercising the inference plumbing without TensorFlow
+DUMMY_MODEL = "dummy"
+MODEL_FILES = {
+    "keras": MODEL_FILE,
+    "tflite": TFLITE_MODEL_FILE,
+    "tflite-int8": TFLITE_INT8_MODEL_FILE,
+    "dummy": DUMMY_MODEL,
+}
+BACKEND = os.getenv("DETEXTB_BACKEND", "keras")
+TFLITE_THREADS = int(os.getenv("DETEXTB_TFLITE_THREADS", str(os.cpu_count() or 1)))
+
+# --- Micro-batching Configuration ---
+# Requests arriving within MAX_WAIT_MS of each other share one forward pass
+MAX_BATCH_SIZE = int(os.getenv("DETEXTB_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("DETEXTB_MAX_WAIT_MS", "25"))
+# Seconds a caller waits for its result, in-process or from the worker pool
+REQUEST_TIMEOUT = float(os.getenv("DETEXTB_INFERENCE_TIMEOUT", "30"))
+
+# --- Result Cache Configuration ---
+# Each cached 512x512 tensor is ~3 MB, so the cache is bounded by entries and bytes
+CACHE_MAX_ENTRIES = int(os.getenv("DETEXTB_CACHE_MAX_ENTRIES", "128"))
+CACHE_MAX_MB = float(os.getenv("DETEXTB_CACHE_MAX_MB", "256"))
+
+# --- Worker Pool Configuration ---
+# 0 keeps inference inside the Streamlit process; N > 0 runs it in N worker
+# processes (see InferenceWorker.py)
+INFERENCE_WORKERS = int(os.getenv("DETEXTB_INFERENCE_WORKERS", "0"))
+
+# --- Background Analysis Configuration ---
+# Threads that run submitted analyses; finished jobs are forgotten after
+# ANALYSIS_JOB_TTL seconds (their results stay in the inference cache)
+ANALYSIS_THREADS = int(os.getenv("DETEXTB_ANALYSIS_THREADS", "4"))
+ANALYSIS_JOB_TTL = float(os.getenv("DETEXTB_ANALYSIS_JOB_TTL", "900"))
+
+
+# --- Lazy ML Runtime ---
+# Seconds spent importing the runtime and loading each model, for startup reporting
+runtime_timings = {}
+
+
+def load_tensorflow():
+    if "tensorflow" not in sys.modules:
+        start = time.perf_counter()
+        import tensorflow
+        runtime_timings["tensorflow_import"] = time.perf_counter() - start
+    return sys.modules["tensorflow"]
+
+
+class KerasBackend:
+    def __init__(self, model_file):
+        tf = load_tensorflow()
+        self.model = tf.keras.models.load_model(model_file)
+
+    def predict(self, xray_batch):
+        return self.model.predict(xray_batch, verbose=0)
+
+    def memory_bytes(self):
+        return sum(weight.nbytes for weight in self.model.get_weights())
+
+
+class TFLiteBackend:
+    """
+        TFLite flatbuffer (float32 or int8-quantized) run by the TFLite interpreter,
+        which applies the XNNPACK delegate on CPU by default. Uses the standalone
+        tflite_runtime package when installed, otherwise tf.lite.
+    """
+
+    def __init__(self, model_file, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = load_tensorflow().lite.Interpreter
+        self.model_file = model_file
+        self.interpreter = Interpreter(model_path=model_file, num_threads=num_threads or TFLITE_THREADS)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+
+    def _resize(self, batch_size):
+        if self.input_detail["shape"][0] != batch_size:
+            shape = list(self.input_detail["shape"])
+            shape[0] = batch_size
+            self.interpreter.resize_tensor_input(self.input_detail["index"], shape)
+            self.interpreter.allocate_tensors()
+            self.input_detail = self.interpreter.get_input_details()[0]
+            self.output_detail = self.interpreter.get_output_details()[0]
+
+    def predict(self, xray_batch):
+        self._resize(len(xray_batch))
+
+        # Fully-integer models take quantized input and return quantized output
+        scale, zero_point = self.input_detail["quantization"]
+        if self.input_detail["dtype"] != np.float32 and scale:
+            xray_batch = np.round(xray_batch / scale + zero_point)
+        self.interpreter.set_tensor(self.input_detail["index"], xray_batch.astype(self.input_detail["dtype"]))
+        self.interpreter.invoke()
+
+        preds = self.interpreter.get_tensor(self.output_detail["index"])
+        scale, zero_point = self.output_detail["quantization"]
+        if self.output_detail["dtype"] != np.float32 and scale:
+            preds = (preds.astype(np.float32) - zero_point) * scale
+        return preds
+
+    def memory_bytes(self):
+        return os.path.getsize(self.model_file)
+
+
+class DummyBackend:
+    """Scores an X-ray by its mean intensity. Only for local testing of the inference path."""
+
+    def predict(self, xray_batch):
+        return xray_batch.reshape(len(xray_batch), -1).mean(axis=1, keepdims=True).astype(np.float32)
+
+    def memory_bytes(self):
+        return 0
+
+
+def load_backend(model_file):
+    if model_file == DUMMY_MODEL:
+        return DummyBackend()
+    if model_file.endswith(".tflite"):
+        return TFLiteBackend(model_file)
+    return KerasBackend(model_file)
+
+
+class ModelServer:
+    """
+        Holds one loaded model backend for the whole Streamlit process.
+        Every browser session shares the same weights; predict calls are
+        serialized with a lock because neither Keras models nor TFLite
+        interpreters are thread-safe.
+    """
+
+    def __init__(self, model_file, model_url=None):
+        self.model_file = model_file
+        self.model_url = model_url
+        self.model = None
+        self.version = None
+        self.load_seconds = None
+        self._file_signature = None
+        self._load_lock = threading.Lock()
+        self._predict_lock = threading.Lock()
+
+    def _is_stale(self):
+        return self.model is None or disk_signature(self.model_file) != self._file_signature
+
+    def load(self):
+        # Double-checked so concurrent sessions only load the weights once;
+        # replacing the .keras file on disk triggers a reload and a new version
+        if self._is_stale():
+            with self._load_lock:
+                if self._is_stale():
+                    if not os.path.exists(self.model_file) and self.model_url:
+                        import gdown
+                        gdown.download(self.model_url, self.model_file, quiet=False)
+                    start = time.perf_counter()
+                    model = load_backend(self.model_file)
+                    with self._predict_lock:
+                        self.model = model
+                    self.load_seconds = time.perf_counter() - start
+                    runtime_timings[f"load {self.model_file}"] = self.load_seconds
+                    print(f"⏱️ Loaded {self.model_file} in {self.load_seconds:.2f}s, "
+                          f"{self.memory_bytes() / (1024 * 1024):.1f} MiB of weights "
+                          f"(TensorFlow import: {runtime_timings.get('tensorflow_import', 0.0):.2f}s)")
+                    self.version = model_version(self.model_file)
+                    self._file_signature = disk_signature(self.model_file)
+        return self.model
+
+    def predict(self, xray_batch):
+        model = self.load()
+        with self._predict_lock:
+            return model.predict(xray_batch)
+
+    def memory_bytes(self):
+        if self.model is None:
+            return 0
+        return self.model.memory_bytes()
+
+
+def disk_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_versions = {}
+
+
+def model_version(model_file):
+    """Short SHA-256 of the model file, recomputed only when the file on disk changes."""
+    signature = disk_signature(model_file)
+    cached = _versions.get(model_file)
+    if cached is None or cached[0] != signature:
+        version = file_sha256(model_file)[:16] if signature else model_file
+        cached = _versions[model_file] = (signature, version)
+    return cached[1]
+
+
+# --- Process-wide Registry ---
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_model_server(model_file=None):
+    """Shared server for model_file, defaulting to the file of the DETEXTB_BACKEND backend."""
+    model_file = model_file or MODEL_FILES[BACKEND]
+    with _servers_lock:
+        server = _servers.get(model_file)
+        if server is None:
+            # Only the Keras model is downloadable; .tflite files come from Export_Model.py
+            server = ModelServer(model_file, MODEL_URL if model_file == MODEL_FILE else None)
+            _servers[model_file] = server
+    return server
+
+
+def warm_up(model_file=None):
+    """Start loading the model in the background so the first prediction does not wait for it."""
+    if INFERENCE_WORKERS:
+        from InferenceWorker import get_worker_pool
+        return get_worker_pool()
+
+    server = get_model_server(model_file)
+    if server.model is None and not server._load_lock.locked():
+        threading.Thread(target=server.load, name="detextb-model-warmup", daemon=True).start()
+    return server
+
+
+def model_memory_report():
+    """Return {model_file: bytes held by its weights} for every loaded model."""
+    with _servers_lock:
+        servers = list(_servers.values())
+    return {server.model_file: server.memory_bytes() for server in servers}
+
+
+def interpret_prediction(preds):
+    confidence = int((preds if preds > 0.5 else 1 - preds) * 100)
+    label = "Positive" if preds > 0.5 else "Negative"
+    return label, confidence
+
+
+class MicroBatcher:
+    """
+        Collects X-rays submitted by concurrent sessions and runs them through
+        the model as one batch. A batch is flushed when it reaches
+        max_batch_size or when max_wait_ms has passed since its first image.
+    """
+
+    def __init__(self, server, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.server = server
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.batches_run = 0
+        self.images_run = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="detextb-microbatcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, xray_array):
+        """Queue one preprocessed (1, 512, 512, 3) X-ray; the Future resolves to (label, confidence)."""
+        future = Future()
+        self._queue.put((xray_array, future))
+        self._ensure_thread()
+        return future
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                preds = self.server.predict(np.concatenate([xray for xray, _ in batch], axis=0))
+                if len(preds) != len(batch):
+                    raise ValueError(f"Model returned {len(preds)} predictions for {len(batch)} X-rays.")
+                self.batches_run += 1
+                self.images_run += len(batch)
+                for (_, future), pred in zip(batch, preds):
+                    future.set_result(interpret_prediction(pred[0]))
+            except Exception as e:
+                # Whatever failed (predict, an unexpected output shape), no caller is left waiting
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self):
+        return {
+            "batches_run": self.batches_run,
+            "images_run": self.images_run,
+            "avg_batch_size": self.images_run / self.batches_run if self.batches_run else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+
+_batchers = {}
+
+
+def get_batcher(model_file=None):
+    model_file = model_file or MODEL_FILES[BACKEND]
+    with _servers_lock:
+        batcher = _batchers.get(model_file)
+    if batcher is None:
+        server = get_model_server(model_file)
+        with _servers_lock:
+            batcher = _batchers.setdefault(model_file, MicroBatcher(server))
+    return batcher
+
+
+def classify_xray(xray_array, timeout=REQUEST_TIMEOUT):
+    """Run a preprocessed (1, 512, 512, 3) X-ray through the worker pool, or the in-process micro-batcher."""
+    if INFERENCE_WORKERS:
+        from InferenceWorker import get_worker_pool
+        if timeout is None:
+            return get_worker_pool().classify(xray_array)
+        return get_worker_pool().classify(xray_array, timeout=timeout)
+    return get_batcher().submit(xray_array).result(timeout=timeout)
+
+
+def classify_batch(xray_arrays, batch_size=MAX_BATCH_SIZE):
+    """Run many preprocessed X-rays straight through the shared model, batch_size at a time."""
+    if INFERENCE_WORKERS:
+        from InferenceWorker import get_worker_pool
+        return get_worker_pool().classify_many(xray_arrays)
+
+    server = get_model_server()
+    results = []
+    for start in range(0, len(xray_arrays), batch_size):
+        preds = server.predict(np.concatenate(xray_arrays[start:start + batch_size], axis=0))
+        results.extend(interpret_prediction(pred[0]) for pred in preds)
+    return results
+
+
+class InferenceCache:
+    """
+        LRU cache keyed on the SHA-256 of the uploaded X-ray bytes.
+        The preprocessed tensor does not depend on the model, so it survives a
+        model swap; the (label, confidence) result is only returned when its
+        model version tag matches the currently loaded model.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_mb=CACHE_MAX_MB):
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, digest, model_version):
+        """The entry for `digest` or None, counted as a hit only when its result is from `model_version`."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+            if entry is not None and entry["model_version"] == model_version:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def put(self, digest, xray_array, model_version, result):
+        with self._lock:
+            old = self._entries.pop(digest, None)
+            if old is not None:
+                self._bytes -= old["xray_array"].nbytes
+            self._entries[digest] = {"xray_array": xray_array, "model_version": model_version, "result": result}
+            self._bytes += xray_array.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["xray_array"].nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+inference_cache = InferenceCache()
+
+
+def classify_xray_bytes(image_bytes, preprocess):
+    """
+        Cached classify_xray for raw upload bytes. `preprocess` turns a file-like
+        object into the (1, 512, 512, 3) model input and only runs on a cache miss.
+    """
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    version = model_version(MODEL_FILES[BACKEND])
+
+    entry = inference_cache.get(digest, version)
+    if entry is not None and entry["model_version"] == version:
+        return entry["result"]
+
+    xray_array = entry["xray_array"] if entry is not None else preprocess(io.BytesIO(image_bytes))
+    result = classify_xray(xray_array)
+    inference_cache.put(digest, xray_array, version, result)
+    return result
+
+
+class AnalysisJobs:
+    """
+        Runs classify_xray_bytes in the background so a page can submit an
+        upload and poll for the result on later reruns. The job ID is derived
+        from the upload bytes and model version, so submitting the same X-ray
+        again returns the existing job instead of starting a second inference.
+    """
+
+    def __init__(self, max_workers=ANALYSIS_THREADS, ttl=ANALYSIS_JOB_TTL):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.submitted = 0
+        self.deduplicated = 0
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job["future"].done() and now - job["submitted_at"] > self.ttl]:
+            del self._jobs[job_id]
+
+    def submit(self, image_bytes, preprocess):
+        job_id = f"{hashlib.sha256(image_bytes).hexdigest()[:32]}-{model_version(MODEL_FILES[BACKEND])}"
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            # Failed jobs are retried on resubmission; pending and finished ones are reused
+            if job is not None and not (job["future"].done() and job["future"].exception() is not None):
+                self.deduplicated += 1
+                return job_id
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="detextb-analysis")
+            self._jobs[job_id] = {
+                "future": self._executor.submit(classify_xray_bytes, image_bytes, preprocess),
+                "submitted_at": time.monotonic(),
+            }
+            self.submitted += 1
+        return job_id
+
+    def status(self, job_id):
+        """Return {"status": "pending" | "done" | "failed" | "unknown", "result", "error", "elapsed"}."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return {"status": "unknown", "result": None, "error": None, "elapsed": 0.0}
+
+        future = job["future"]
+        status = {"status": "pending", "result": None, "error": None,
+                  "elapsed": time.monotonic() - job["submitted_at"]}
+        if future.done():
+            error = future.exception()
+            if error is not None:
+                status.update(status="failed", error=str(error) or type(error).__name__)
+            else:
+                status.update(status="done", result=future.result())
+        return status
+
+    def stats(self):
+        with self._lock:
+            pending = sum(not job["future"].done() for job in self._jobs.values())
+            return {"jobs": len(self._jobs), "pending": pending,
+                    "submitted": self.submitted, "deduplicated": self.deduplicated}
+
+
+analysis_jobs = AnalysisJobs()
+
+
+def submit_analysis(image_bytes, preprocess):
+    """Start (or reuse) a background analysis of the upload and return its job ID."""
+    return analysis_jobs.submit(image_bytes, preprocess)
+
+
+def analysis_status(job_id):
+    return analysis_jobs.status(job_id)
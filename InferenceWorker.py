@@ -0,0 +1,324 @@
+# InferenceWorker.py
+#
+# Out-of-process inference: N worker processes each load the model once, are
+# pinned to their own CPU cores and pull X-rays from a shared multiprocessing
+# queue. The Streamlit process only submits requests and waits for replies, so
+# model.predict never runs on a session's script thread or competes with
+# Streamlit's tornado loop for cores.
+#
+# Enable with DETEXTB_INFERENCE_WORKERS=N. Smoke-test locally with the dummy model:
+#   python InferenceWorker.py --workers 2 --requests 64
+
+import os
+import atexit
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import numpy as np
+from Inference import MODEL_FILES, BACKEND, DUMMY_MODEL, INFERENCE_WORKERS, MAX_BATCH_SIZE, REQUEST_TIMEOUT
+
+# --- Worker Pool Configuration ---
+CORES_PER_WORKER = int(os.getenv("DETEXTB_CORES_PER_WORKER", "2"))
+REQUEST_RETRIES = int(os.getenv("DETEXTB_INFERENCE_RETRIES", "1"))
+# Requests in flight before new submissions are refused
+MAX_PENDING = int(os.getenv("DETEXTB_INFERENCE_MAX_PENDING", "64"))
+# Times in a row a worker may exit before it is ready (e.g. the model fails to
+# load) before the pool stops restarting it
+MAX_LOAD_FAILURES = int(os.getenv("DETEXTB_WORKER_LOAD_FAILURES", "3"))
+
+
+class InferenceBusy(Exception):
+    """Raised when the worker pool already has MAX_PENDING requests in flight."""
+
+
+class InferenceWorkerError(Exception):
+    """Raised when a worker process failed to run a request."""
+
+
+def worker_main(worker_index, model_file, cores, request_queue, response_queue, max_batch_size):
+    # Pin before the ML runtime starts so its thread pools size themselves to these cores
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    threads = max(1, len(cores))
+    for var in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    import Inference
+    from Inference import get_model_server, interpret_prediction
+    Inference.TFLITE_THREADS = threads
+
+    server = get_model_server(model_file)
+    try:
+        server.load()
+    except Exception as e:
+        response_queue.put(("failed", worker_index, f"{type(e).__name__}: {e}"))
+        return
+    response_queue.put(("ready", worker_index, None))
+
+    while True:
+        request = request_queue.get()
+        if request is None:
+            break
+
+        # Drain whatever else is already queued into the same forward pass
+        batch = [request]
+        while len(batch) < max_batch_size:
+            try:
+                request = request_queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                request_queue.put(None)  # leave the stop signal for the next loop
+                break
+            batch.append(request)
+
+        # Tell the pool which requests this process holds, so they fail fast if it dies
+        response_queue.put(("taken", worker_index, [request_id for request_id, _ in batch]))
+        try:
+            preds = server.predict(np.concatenate([xray_array for _, xray_array in batch], axis=0))
+            for (request_id, _), pred in zip(batch, preds):
+                response_queue.put((request_id, interpret_prediction(float(pred[0])), None))
+        except Exception as e:
+            for request_id, _ in batch:
+                response_queue.put((request_id, None, f"{type(e).__name__}: {e}"))
+
+
+class WorkerPool:
+    """
+        Client side of the worker pool. submit() returns a Future; classify()
+        adds a timeout and retries, and refuses work with InferenceBusy once
+        max_pending requests are waiting (backpressure).
+    """
+
+    def __init__(self, model_file=None, workers=None, cores_per_worker=CORES_PER_WORKER,
+                 max_pending=MAX_PENDING, max_batch_size=MAX_BATCH_SIZE):
+        self.model_file = model_file or MODEL_FILES[BACKEND]
+        self.workers = workers or max(1, INFERENCE_WORKERS)
+        self.cores_per_worker = cores_per_worker
+        self.max_batch_size = max_batch_size
+        self.ready_workers = set()
+        self.restarts = 0
+        # Consecutive exits of each worker before it became ready, and the last load error reported
+        self.load_failures = [0] * self.workers
+        self.load_error = None
+        self.failure = None  # set once no worker can load the model; fails every request
+
+        # spawn, not fork: forking a process that already holds threads is unsafe
+        self._context = multiprocessing.get_context("spawn")
+        self._requests = self._context.Queue()
+        self._responses = self._context.Queue()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # Request ids each worker process has taken off the queue and not yet answered
+        self._in_flight = {index: set() for index in range(self.workers)}
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._ids = itertools.count()
+        self._closing = False
+
+        self._processes = [self._start_worker(index) for index in range(self.workers)]
+        self._dispatcher = threading.Thread(target=self._dispatch, name="detextb-inference-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def _core_set(self, worker_index):
+        if hasattr(os, "sched_getaffinity"):
+            available = sorted(os.sched_getaffinity(0))
+        else:
+            available = list(range(os.cpu_count() or 1))
+        start = (worker_index * self.cores_per_worker) % len(available)
+        return {available[(start + i) % len(available)] for i in range(min(self.cores_per_worker, len(available)))}
+
+    def _start_worker(self, worker_index):
+        process = self._context.Process(
+            target=worker_main,
+            args=(worker_index, self.model_file, self._core_set(worker_index),
+                  self._requests, self._responses, self.max_batch_size),
+            name=f"detextb-inference-{worker_index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def _finish(self, request_id):
+        with self._pending_lock:
+            future = self._pending.pop(request_id, None)
+        if future is not None:
+            self._slots.release()
+        return future
+
+    def _dispatch(self):
+        last_health_check = time.monotonic()
+        while not self._closing:
+            if time.monotonic() - last_health_check >= 1.0:
+                self._restart_dead_workers()
+                last_health_check = time.monotonic()
+            try:
+                request_id, result, error = self._responses.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if request_id == "ready":
+                self.ready_workers.add(result)
+                self.load_failures[result] = 0
+                continue
+            if request_id == "failed":
+                self.load_error = error
+                continue
+            if request_id == "taken":
+                self._in_flight[result].update(error)
+                continue
+            for in_flight in self._in_flight.values():
+                in_flight.discard(request_id)
+
+            # Replies to requests that already timed out are dropped here
+            future = self._finish(request_id)
+            if future is None:
+                continue
+            if error:
+                future.set_exception(InferenceWorkerError(error))
+            else:
+                future.set_result(result)
+
+    def _restart_dead_workers(self):
+        for index, process in enumerate(self._processes):
+            if not self._closing and not process.is_alive() and self.load_failures[index] < MAX_LOAD_FAILURES:
+                if index not in self.ready_workers:
+                    self.load_failures[index] += 1
+                self.ready_workers.discard(index)
+                # Its requests will never be answered: fail them now instead of at their timeout
+                for request_id in self._in_flight[index]:
+                    future = self._finish(request_id)
+                    if future is not None:
+                        future.set_exception(InferenceWorkerError(f"Inference worker {index} exited."))
+                self._in_flight[index] = set()
+
+                if self.load_failures[index] >= MAX_LOAD_FAILURES:
+                    print(f"Inference worker {index} stopped after {MAX_LOAD_FAILURES} failed starts: {self.load_error}")
+                    if all(failures >= MAX_LOAD_FAILURES for failures in self.load_failures):
+                        self._fail_all()
+                    continue
+                self.restarts += 1
+                self._processes[index] = self._start_worker(index)
+
+    def _fail_all(self):
+        """No worker can load the model: fail the waiting requests and refuse new ones."""
+        self.failure = f"Inference workers could not load {self.model_file}: {self.load_error or 'they exited before loading it'}"
+        with self._pending_lock:
+            request_ids = list(self._pending)
+        for request_id in request_ids:
+            future = self._finish(request_id)
+            if future is not None:
+                future.set_exception(InferenceWorkerError(self.failure))
+
+    def submit(self, xray_array, timeout=REQUEST_TIMEOUT):
+        if self.failure:
+            raise InferenceWorkerError(self.failure)
+        if not self._slots.acquire(timeout=timeout):
+            raise InferenceBusy(f"{len(self._pending)} X-rays are already waiting for analysis.")
+        request_id = next(self._ids)
+        future = Future()
+        future.request_id = request_id
+        with self._pending_lock:
+            self._pending[request_id] = future
+        self._requests.put((request_id, np.ascontiguousarray(xray_array, dtype=np.float32)))
+        return future
+
+    def classify(self, xray_array, timeout=REQUEST_TIMEOUT, retries=REQUEST_RETRIES):
+        """Return (label, confidence), retrying on timeouts and worker failures."""
+        last_error = None
+        for _ in range(retries + 1):
+            future = self.submit(xray_array, timeout)
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                self._finish(future.request_id)
+                last_error = TimeoutError(f"X-ray analysis took longer than {timeout:.0f}s.")
+            except InferenceWorkerError as e:
+                last_error = e
+        raise last_error
+
+    def classify_many(self, xray_arrays, timeout=REQUEST_TIMEOUT):
+        futures = []
+        try:
+            for xray_array in xray_arrays:
+                futures.append(self.submit(xray_array, timeout))
+            return [future.result(timeout=timeout) for future in futures]
+        except BaseException:
+            # Release the slots of every request left unanswered, as classify() does on a timeout
+            for future in futures:
+                if not future.done():
+                    self._finish(future.request_id)
+            raise
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "ready_workers": len(self.ready_workers),
+            "pending": len(self._pending),
+            "restarts": self.restarts,
+            "load_error": self.load_error,
+        }
+
+    def close(self):
+        self._closing = True
+        for _ in self._processes:
+            self._requests.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+            atexit.register(_pool.close)
+    return _pool
+
+
+if __name__ == "__main__":
+    import argparse
+    from Inference import DummyBackend, interpret_prediction
+
+    parser = argparse.ArgumentParser(description="Smoke-test the inference worker pool with the dummy model.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--cores-per-worker", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=64)
+    args = parser.parse_args()
+
+    pool = WorkerPool(DUMMY_MODEL, workers=args.workers, cores_per_worker=args.cores_per_worker)
+    rng = np.random.default_rng(0)
+    xrays = [rng.random((1, 512, 512, 3), dtype=np.float32) for _ in range(args.requests)]
+    expected = [interpret_prediction(float(pred[0])) for pred in DummyBackend().predict(np.concatenate(xrays))]
+
+    while len(pool.ready_workers) < args.workers:
+        time.sleep(0.05)
+
+    start = time.perf_counter()
+    results = [None] * len(xrays)
+
+    def client(index):
+        results[index] = pool.classify(xrays[index])
+
+    clients = [threading.Thread(target=client, args=(index,)) for index in range(len(xrays))]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    pool.close()
+    assert results == expected, "worker results differ from the in-process dummy model"
+    print(f"{len(xrays)} requests on {args.workers} workers in {elapsed:.2f}s "
+          f"({len(xrays) / elapsed:.1f} X-rays/s), results match")
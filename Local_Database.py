@@ -0,0 +1,240 @@
+# Local_Database.py
+#
+# In-memory SQLite stand-in for the Postgres views and functions in sql/, so the
+# aggregate queries can be checked without a Supabase project. Load rows shaped
+# like the Supabase tables, then either call rpc() directly or route Repository
+# RPCs here with Repository.use_local_database(db).
+#
+#   python Local_Database.py                  metrics for a small synthetic data set
+#   python Local_Database.py --snapshot       metrics for a copy of the live tables
+#   python Local_Database.py --snapshot --compare   ...and diff against the deployed RPC
+
+import re
+import sqlite3
+from Repository import QueryResult
+
+TABLES = {
+    "PATIENT_Table": ["PT_ID", "PT_FNAME", "PT_MNAME", "PT_LNAME", "PT_DOB", "PT_AGE", "PT_SEX", "PT_BRGY"],
+    "CHEST_XRAY_Table": ["CXR_ID", "PT_ID", "CXR_FILE_PATH", "CXR_UPL_DATE"],
+    "RESULT_Table": ["RES_ID", "CXR_ID", "RES_PRESUMPTIVE", "RES_CONF_SCORE", "RES_DATE", "RES_STATUS"],
+    "DIAGNOSIS_Table": ["DX_ID", "CXR_ID", "USER_ID", "DX_STATUS", "DX_NOTES", "DX_UPDATED_AT"],
+}
+
+
+# Mirror the key functions of sql/patient_duplicates.sql
+def patient_name_key(name):
+    return re.sub(r"[^a-z]", "", (name or "").lower().replace("ñ", "n"))
+
+
+def patient_phonetic_key(name):
+    key = patient_name_key(name).replace("ph", "f").replace("ck", "k").replace("ny", "n")
+    key = re.sub(r"(.)h", r"\1", key)
+    key = key.translate(str.maketrans("cqzvfyeo", "kksbpiiu"))
+    return re.sub(r"(.)\1+", r"\1", key)
+
+
+# Mirrors sql/ai_metrics.sql (SQLite has no extract(), so dates go through strftime)
+# and the index of sql/patient_duplicates.sql
+SCHEMA = """
+create view ai_result_outcomes as
+with latest_diagnosis as (
+    select
+        "CXR_ID",
+        "DX_STATUS",
+        row_number() over (partition by "CXR_ID" order by "DX_UPDATED_AT" desc nulls last) as recency
+    from "DIAGNOSIS_Table"
+)
+select
+    r."RES_ID",
+    r."CXR_ID",
+    x."PT_ID",
+    cast(strftime('%Y', r."RES_DATE") as integer) as res_year,
+    cast(strftime('%m', r."RES_DATE") as integer) as res_month,
+    lower(trim(r."RES_PRESUMPTIVE")) as predicted,
+    case
+        when lower(d."DX_STATUS") like '%confirmed positive%' then 'positive'
+        when lower(d."DX_STATUS") like '%confirmed negative%' then 'negative'
+        when lower(trim(d."DX_STATUS")) = 'pending' then 'pending'
+    end as confirmed,
+    d."CXR_ID" is null as undiagnosed
+from "RESULT_Table" r
+left join "CHEST_XRAY_Table" x on x."CXR_ID" = r."CXR_ID"
+left join latest_diagnosis d on d."CXR_ID" = r."CXR_ID" and d.recency = 1;
+
+create index patient_table_duplicate_key on "PATIENT_Table"
+    ("PT_DOB", patient_phonetic_key("PT_LNAME"), patient_phonetic_key("PT_FNAME"));
+"""
+
+AI_PERFORMANCE_METRICS = """
+with counts as (
+    select
+        case when :p_by_month then res_year else :p_year end as period_year,
+        case when :p_by_month then res_month else :p_month end as period_month,
+        count(*) as total_results,
+        count(distinct "PT_ID") filter (where predicted = 'positive') as flagged_patients,
+        count(*) filter (where predicted = 'positive' and (undiagnosed or confirmed = 'pending')) as pending_confirmations,
+        count(*) filter (where predicted = 'positive' and confirmed = 'positive') as tp,
+        count(*) filter (where predicted = 'negative' and confirmed = 'negative') as tn,
+        count(*) filter (where predicted = 'positive' and confirmed = 'negative') as fp,
+        count(*) filter (where predicted = 'negative' and confirmed = 'positive') as fn,
+        count(*) filter (where confirmed in ('positive', 'negative')) as evaluated,
+        count(*) filter (where confirmed in ('positive', 'negative') and predicted = confirmed) as correct
+    from ai_result_outcomes
+    where (:p_year is null or res_year = :p_year)
+      and (:p_month is null or res_month = :p_month)
+    group by 1, 2
+)
+select
+    period_year,
+    period_month,
+    total_results,
+    flagged_patients,
+    pending_confirmations,
+    tp, tn, fp, fn,
+    evaluated,
+    correct,
+    round(100.0 * correct / nullif(evaluated, 0), 2) as accuracy,
+    round(100.0 * tp / nullif(tp + fn, 0), 2) as sensitivity,
+    round(100.0 * tn / nullif(tn + fp, 0), 2) as specificity
+from counts
+order by period_year, period_month
+"""
+
+FIND_DUPLICATE_PATIENTS = """
+select "PT_ID", "PT_FNAME", "PT_MNAME", "PT_LNAME", "MATCH"
+from (
+    select
+        "PT_ID",
+        "PT_FNAME",
+        "PT_MNAME",
+        "PT_LNAME",
+        case
+            when patient_name_key("PT_FNAME") <> patient_name_key(:p_fname)
+              or patient_name_key("PT_LNAME") <> patient_name_key(:p_lname) then 'similar'
+            when patient_name_key("PT_MNAME") = case
+                when length(patient_name_key(:p_mname)) > 1 then patient_name_key(:p_mname)
+                else ''
+            end then 'exact'
+            else 'near'
+        end as "MATCH"
+    from "PATIENT_Table"
+    where "PT_DOB" = :p_dob
+      and patient_phonetic_key("PT_LNAME") = patient_phonetic_key(:p_lname)
+      and patient_phonetic_key("PT_FNAME") = patient_phonetic_key(:p_fname)
+)
+order by case "MATCH" when 'exact' then 0 when 'near' then 1 else 2 end
+limit 20
+"""
+
+FUNCTIONS = {
+    "ai_performance_metrics": (AI_PERFORMANCE_METRICS, {"p_year": None, "p_month": None, "p_by_month": False}),
+    "find_duplicate_patients": (FIND_DUPLICATE_PATIENTS, {"p_mname": None}),
+}
+
+
+class LocalQuery:
+    """Deferred rpc() call with the execute() interface Repository.run_query expects."""
+
+    def __init__(self, database, name, params):
+        self.database = database
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        sql, defaults = FUNCTIONS[self.name]
+        cursor = self.database.connection.execute(sql, {**defaults, **self.params})
+        columns = [column[0] for column in cursor.description]
+        data = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return QueryResult(data, len(data))
+
+
+class LocalDatabase:
+    def __init__(self):
+        # check_same_thread=False: Streamlit may call in from its script threads
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        for function in (patient_name_key, patient_phonetic_key):
+            self.connection.create_function(function.__name__, 1, function, deterministic=True)
+        for table, columns in TABLES.items():
+            quoted = ", ".join('"' + column + '"' for column in columns)
+            self.connection.execute(f'create table "{table}" ({quoted})')
+        self.connection.executescript(SCHEMA)
+
+    def insert(self, table, rows):
+        columns = TABLES[table]
+        placeholders = ", ".join("?" for _ in columns)
+        self.connection.executemany(
+            f'insert into "{table}" values ({placeholders})',
+            [tuple(row.get(column) for column in columns) for row in rows],
+        )
+        return self
+
+    def rpc(self, name, params=None):
+        return LocalQuery(self, name, params or {})
+
+    @classmethod
+    def from_supabase(cls, page_size=1000):
+        """Copy the live tables (the columns in TABLES) into a new local database."""
+        from Supabase import supabase
+
+        database = cls()
+        for table, columns in TABLES.items():
+            start = 0
+            while True:
+                rows = supabase.table(table).select(", ".join(columns)).range(start, start + page_size - 1).execute().data
+                database.insert(table, rows)
+                if len(rows) < page_size:
+                    break
+                start += page_size
+        return database
+
+
+def synthetic_database(patients=40, seed=0):
+    import random
+    from datetime import datetime, timedelta
+
+    rng = random.Random(seed)
+    database = LocalDatabase()
+    database.insert("PATIENT_Table", [{"PT_ID": pt_id} for pt_id in range(1, patients + 1)])
+
+    xrays, results, diagnoses = [], [], []
+    for cxr_id in range(1, patients * 3 + 1):
+        res_date = datetime(2024, 1, 1) + timedelta(days=rng.randrange(540), hours=rng.randrange(24))
+        xrays.append({"CXR_ID": cxr_id, "PT_ID": rng.randint(1, patients)})
+        results.append({"RES_ID": cxr_id, "CXR_ID": cxr_id, "RES_DATE": res_date.isoformat(),
+                        "RES_PRESUMPTIVE": rng.choice(["Positive", "Negative"]), "RES_CONF_SCORE": rng.random()})
+        # Some X-rays are undiagnosed, some were reviewed twice (the later review wins)
+        for review in range(rng.choice([0, 1, 1, 1, 2])):
+            diagnoses.append({"DX_ID": len(diagnoses) + 1, "CXR_ID": cxr_id,
+                              "DX_STATUS": rng.choice(["Confirmed Positive", "Confirmed Negative", "Pending"]),
+                              "DX_UPDATED_AT": (res_date + timedelta(days=review + 1)).isoformat()})
+    return database.insert("CHEST_XRAY_Table", xrays).insert("RESULT_Table", results).insert("DIAGNOSIS_Table", diagnoses)
+
+
+if __name__ == "__main__":
+    import argparse
+    from Repository import fetch_ai_metrics, use_local_database
+
+    parser = argparse.ArgumentParser(description="Run the sql/ aggregate functions against a local SQLite copy.")
+    parser.add_argument("--snapshot", action="store_true", help="copy the live tables instead of synthetic data")
+    parser.add_argument("--compare", action="store_true", help="diff against the deployed RPCs (with --snapshot)")
+    parser.add_argument("--year", type=int)
+    args = parser.parse_args()
+
+    database = LocalDatabase.from_supabase() if args.snapshot else synthetic_database()
+    remote = fetch_ai_metrics(args.year, by_month=True) if args.compare else None
+
+    use_local_database(database)
+    local = fetch_ai_metrics(args.year, by_month=True) + [fetch_ai_metrics(args.year)]
+
+    print(f"{'period':<10}{'results':>8}{'TP':>5}{'TN':>5}{'FP':>5}{'FN':>5}{'acc %':>8}{'sens %':>8}{'spec %':>8}")
+    for row in local:
+        period = f"{row.period_year or 'all'}-{row.period_month or 'all'}"
+        print(f"{period:<10}{row.total_results:>8}{row.tp:>5}{row.tn:>5}{row.fp:>5}{row.fn:>5}"
+              f"{row.accuracy if row.accuracy is not None else '-':>8}"
+              f"{row.sensitivity if row.sensitivity is not None else '-':>8}"
+              f"{row.specificity if row.specificity is not None else '-':>8}")
+
+    if remote is not None:
+        mismatches = local[:-1] != remote
+        print(f"\nDeployed RPC {'matches' if not mismatches else 'differs from'} the local stand-in")
+        raise SystemExit(1 if mismatches else 0)
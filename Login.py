@@ -9,6 +9,7 @@ from PIL import Image
 from io import BytesIO
 from datetime import datetime, timezone
 from Supabase import supabase
+from Repository import get_user_by
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
@@ -375,8 +376,7 @@ def Login(is_light=True):
     def send_reset_code(email: str):
         """Send 4-digit reset code to email"""
         try:
-            response = supabase.table("USER_Table").select("*").eq("USER_EMAIL", email).execute()
-            if not response.data:
+            if not get_user_by("USER_EMAIL", email):
                 st.session_state.reset_data['notification'] = {
                     'message': "Email not found in our system",
                     'type': "error"
@@ -611,8 +611,7 @@ def Login(is_light=True):
                     
                     # Fetch user from Supabase
                     try:
-                        response = supabase.table("USER_Table").select("*").eq("USER_USERNAME", username).execute()
-                        user = response.data[0] if response.data else None
+                        user = get_user_by("USER_USERNAME", username)
                     except Exception as e:
                         show_notification(f"Login error: {e}", "error")
                         st.stop()
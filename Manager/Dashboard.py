@@ -4,6 +4,7 @@ import streamlit as st
 import time
 from datetime import datetime, timedelta
 from Supabase import supabase  # Your Supabase client
+from Repository import count_rows, fetch_recent_diagnoses, fetch_ai_metrics, gather
 
 
 def Dashboard(is_light=True):
@@ -178,125 +179,53 @@ def Dashboard(is_light=True):
             # fallback
             return "Manager"
 
-    # Function to normalize DX_STATUS values
-    def normalize_dx_status(dx_status):
-        if not dx_status:
-            return None
-        dx_status = str(dx_status).strip().lower()
-        if "confirmed positive" in dx_status:
-            return "positive"
-        elif "confirmed negative" in dx_status:
-            return "negative"
-        elif dx_status == "pending":
-            return "pending"
-        return None
-
     # Function to fetch Dashboard Data
     def fetch_dashboard_data():
         try:
-            # 1. Total Confirmed TB Cases
-            confirmed_res = supabase.table("DIAGNOSIS_Table") \
-                .select("count", count="exact") \
-                .eq("DX_STATUS", "Confirmed Positive") \
-                .execute()
-            total_confirmed = confirmed_res.count or 0
-
-            # 2. Total Pending Results
-            pending_res = supabase.table("RESULT_Table") \
-                .select("count", count="exact") \
-                .eq("RES_STATUS", "Pending") \
-                .execute()
-            total_pending = pending_res.count or 0
-
-            # 3. Recently Updated Diagnoses (latest 5)
-            diagnoses = supabase.table("DIAGNOSIS_Table") \
-                .select("DX_STATUS, DX_UPDATED_AT, CXR_ID") \
-                .order("DX_UPDATED_AT", desc=True) \
-                .limit(5) \
-                .execute()
+            # Sent together; the page waits for the slowest query instead of their sum
+            total_confirmed, total_pending, recent_diagnoses, metrics = gather(
+                # 1. Total Confirmed TB Cases
+                count_rows.aio("DIAGNOSIS_Table", "DX_STATUS", "Confirmed Positive"),
+                # 2. Total Pending Results
+                count_rows.aio("RESULT_Table", "RES_STATUS", "Pending"),
+                # 3. Recently Updated Diagnoses (latest 5), joined to patient and AI result in one request
+                fetch_recent_diagnoses.aio(limit=5),
+                # 4. AI metrics for the accuracy rate
+                fetch_ai_metrics.aio(),
+            )
 
             recent_cases = []
-            for diag in diagnoses.data or []:
-                cxr_id = diag["CXR_ID"]
-
-                # Get result data using CXR_ID
-                result_resp = supabase.table("RESULT_Table") \
-                    .select("RES_PRESUMPTIVE, RES_CONF_SCORE, RES_DATE") \
-                    .eq("CXR_ID", cxr_id) \
-                    .maybe_single() \
-                    .execute()
-                result = result_resp.data
-
-                # Get patient data from x-ray table
-                chest_resp = supabase.table("CHEST_XRAY_Table") \
-                    .select("PT_ID, PATIENT_Table(PT_FNAME, PT_MNAME, PT_LNAME)") \
-                    .eq("CXR_ID", cxr_id) \
-                    .maybe_single() \
-                    .execute()
-                chest = chest_resp.data
-
-                if chest and chest.get("PATIENT_Table") and result:
-                    patient = chest["PATIENT_Table"]
-                    full_name = f"{patient['PT_FNAME']} {patient['PT_MNAME']} {patient['PT_LNAME']}".strip()
-                    confidence = int(float(result.get("RES_CONF_SCORE", 0)) * 100)
-                    ai_result = f"{result['RES_PRESUMPTIVE']} ({confidence}%)"
-
-                    recent_cases.append({
-                        "pt_id": chest["PT_ID"],
-                        "name": full_name,
-                        "ai_result": ai_result,
-                        "status": diag["DX_STATUS"],
-                        "updated": diag["DX_UPDATED_AT"][:10]  # date only
-                    })
-
-            return total_confirmed, total_pending, recent_cases
+            for diag in recent_diagnoses:
+                confidence = int(float(diag.conf_score) * 100)
+                recent_cases.append({
+                    "pt_id": diag.pt_id,
+                    "name": diag.full_name,
+                    "ai_result": f"{diag.presumptive} ({confidence}%)",
+                    "status": diag.dx_status,
+                    "updated": diag.dx_updated_at[:10]  # date only
+                })
+
+            return total_confirmed, total_pending, recent_cases, metrics
 
         except Exception as e:
             show_notification(" Failed to fetch dashboard data.", "error")
             st.exception(e)
-            return 0, 0, []
+            return 0, 0, [], None
 
-    # Function to fetch the AI Accuracy Rate
-    def fetch_ai_accuracy_rate():
+    # Function to compute the AI Accuracy Rate
+    def fetch_ai_accuracy_rate(metrics):
         try:
-            # Get all AI prediction results
-            ai_results_resp = supabase.table("RESULT_Table").select("CXR_ID", "RES_PRESUMPTIVE").execute()
-            ai_results = ai_results_resp.data or []
+            # Aggregated in Postgres (sql/ai_metrics.sql) instead of downloading every result
+            if metrics is None:
+                return "Error"
 
-            if not ai_results:
+            if not metrics.total_results:
                 return "No Data"
 
-            # Extract all CXR_IDs from AI results
-            cxr_ids = [item["CXR_ID"] for item in ai_results]
-
-            # Fetch diagnosis for these CXR_IDs
-            dx_resp = supabase.table("DIAGNOSIS_Table") \
-                .select("CXR_ID", "DX_STATUS") \
-                .in_("CXR_ID", cxr_ids) \
-                .execute()
-            diagnosis_list = dx_resp.data or []
-
-            # Create lookup dict: CXR_ID -> normalized DX_STATUS
-            diagnosis_dict = {item["CXR_ID"]: normalize_dx_status(item["DX_STATUS"]) for item in diagnosis_list}
-
-            correct = 0
-            evaluated = 0
-
-            for ai_item in ai_results:
-                cxr_id = ai_item["CXR_ID"]
-                ai_pred = str(ai_item.get("RES_PRESUMPTIVE", "")).strip().lower()
-                dx_status = diagnosis_dict.get(cxr_id)
-
-                # Skip if diagnosis is pending or missing
-                if dx_status and dx_status != "pending":
-                    evaluated += 1
-                    if ai_pred == dx_status:
-                        correct += 1
-
-            if evaluated == 0:
+            if metrics.evaluated == 0:
                 return "No Confirmed Cases"
             else:
-                accuracy_percent = (correct / evaluated) * 100
+                accuracy_percent = (metrics.correct / metrics.evaluated) * 100
                 return f"{int(round(accuracy_percent))}%"
         except Exception as e:
             show_notification("Failed to fetch AI accuracy rate.", "error")
@@ -304,8 +233,8 @@ def Dashboard(is_light=True):
             return "Error"
 
     # --- Fetch all data ---
-    total_confirmed, total_pending, recent_cases = fetch_dashboard_data()
-    ai_accuracy = fetch_ai_accuracy_rate()
+    total_confirmed, total_pending, recent_cases, ai_metrics = fetch_dashboard_data()
+    ai_accuracy = fetch_ai_accuracy_rate(ai_metrics)
     username = get_current_username()
 
     # --- Custom CSS ---
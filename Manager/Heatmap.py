@@ -1,18 +1,183 @@
 import streamlit as st
-import folium
 import pandas as pd
 import streamlit.components.v1 as components
-import io
+import json
+import os
+import threading
 import numpy as np
-from Supabase import supabase
-from folium import Element
-from folium.plugins import HeatMap
-from datetime import datetime, timedelta
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill
-from openpyxl.styles import Alignment
-from collections import defaultdict
-from dateutil.parser import parse
+from Repository import HeatmapCell, fetch_heatmap_cells
+from Excel_Export import ExcelExport, export_button, solid_fill
+from datetime import datetime
+from openpyxl.styles import Font
+from collections import defaultdict, OrderedDict
+from typing import NamedTuple
+
+
+# --- Constants Initialization ---
+
+# Incidence Rate -> Incidence Rate = (Number of New Cases / Population) * Multiplier
+incidence_rate = 0.00539
+
+# Mandaue City Population Data (2025 Census) = 388,002
+mandaue_barangay_population_2025 = {
+    "Alang-Alang": 12251, "Bakilid": 4671, "Banilad": 19594, "Basak": 12554,
+    "Cabancalan": 15818, "Cambaro": 9581, "Canduman": 24995, "Casili": 5756,
+    "Casuntingan": 17956, "Centro (Poblacion)": 3171, "Cubacub": 14738, "Guizo": 7728,
+    "Ibabao-Estancia": 7449, "Jagobiao": 12937, "Labogon": 21811, "Looc": 18536,
+    "Maguikay": 15931, "Mantuyong": 5846, "Opao": 12798, "Pagsabungan": 21603,
+    "Pakna-an": 32540, "Subangdaku": 18219, "Tabok": 20767, "Tawason": 7440,
+    "Tingub": 6479, "Tipolo": 16822, "Umapad": 20011
+}
+
+# Heat intensity of a case by the risk colour of its barangay (1 for any other)
+risk_weights = {"red": 3, "orange": 2}
+
+# Named styles of the Excel summary, on top of Excel_Export.BASE_STYLES
+HEATMAP_EXCEL_STYLES = {
+    "total": {"fill": solid_fill("F8B6B8")},  # pastel red
+    "table header": {"font": Font(bold=True), "fill": solid_fill("FECEAB")},
+    # Risk level font colors
+    "Low risk": {"font": Font(color="008000", bold=True)},  # Green
+    "Moderate risk": {"font": Font(color="FF8C00", bold=True)},  # Orange
+    "High risk": {"font": Font(color="DC143C", bold=True)},  # Red
+}
+
+
+# --- Map Component ---
+# Static Leaflet shell, loaded once per page; reruns only send it the layer data (HeatmapRisk.map_payload)
+HEATMAP_COMPONENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "heatmap_component")
+heatmap_map = components.declare_component("heatmap_map", path=HEATMAP_COMPONENT_PATH)
+
+with open(os.path.join(HEATMAP_COMPONENT_PATH, "index.html"), encoding="utf-8") as shell:
+    heatmap_map_shell = shell.read()
+
+
+def standalone_map_html(payload):
+    """The map shell with `payload` inlined, a self-contained page for the Export Map download."""
+    data = json.dumps(payload).replace("</", "<\\/")
+    return heatmap_map_shell.replace("<!-- map data -->", f"<script>window.DETEXTB_MAP = {data};</script>")
+
+
+# --- Rendered Map Cache ---
+# Rendered maps kept across reruns and sessions; the least recently used are evicted first
+MAP_CACHE_SIZE = int(os.getenv("DETEXTB_MAP_CACHE_SIZE", "32"))
+_map_cache = OrderedDict()
+_map_cache_lock = threading.Lock()
+
+
+class RenderedMap(NamedTuple):
+    payload: dict  # layer data for the map component
+    html: str  # standalone copy for the Export Map download
+    mapped_cases: int
+    risk_levels: dict  # for the Excel summary, built only when exported
+
+
+def cached_map(key, render):
+    """The RenderedMap for `key`, calling render() only when it is not cached."""
+    with _map_cache_lock:
+        if key in _map_cache:
+            _map_cache.move_to_end(key)
+            return _map_cache[key]
+
+    rendered = render()
+    with _map_cache_lock:
+        _map_cache[key] = rendered
+        _map_cache.move_to_end(key)
+        while len(_map_cache) > MAP_CACHE_SIZE:
+            _map_cache.popitem(last=False)
+    return rendered
+
+
+# --- Risk Engine ---
+
+# Class computing the barangay risk levels and heat points of one filter selection
+class HeatmapRisk:
+    """
+        Column-wise over heatmap cells (sql/heatmap_cube.sql) or individual
+        cases, one per row with cases=1: confirmed counts, targets, risk
+        levels, case-weighted centroids and heat points per barangay from
+        bincounts over the factorized barangay names, with no per-row Python.
+    """
+
+    def __init__(self, cells, monthly=False):
+        frame = cells if isinstance(cells, pd.DataFrame) else pd.DataFrame(cells, columns=HeatmapCell._fields)
+        codes, names = pd.factorize(frame["brgy"], use_na_sentinel=False)
+        cases = frame["cases"].to_numpy(dtype=float)
+        lat = frame["lat"].to_numpy(dtype=float)
+        lng = frame["lng"].to_numpy(dtype=float)
+        located = ~(np.isnan(lat) | np.isnan(lng))
+
+        # Per-barangay sums over the factorized codes: cases, and case-weighted coordinates
+        def per_barangay(weights, rows=slice(None)):
+            return pd.Series(np.bincount(codes[rows], weights=weights, minlength=len(names)), index=names)
+
+        located_cases = per_barangay(cases[located], located)
+        centroids = pd.DataFrame({
+            "lat": per_barangay(lat[located] * cases[located], located) / located_cases,
+            "lng": per_barangay(lng[located] * cases[located], located) / located_cases,
+        })
+
+        barangays = pd.DataFrame({"population": pd.Series(mandaue_barangay_population_2025)})
+        barangays["cases"] = per_barangay(cases).reindex(barangays.index, fill_value=0).astype(int)
+
+        # Annual target, or monthly when a single month is selected; rounded for display & risk calculation
+        targets = barangays["population"] * incidence_rate / (12 if monthly else 1)
+        barangays["target"] = targets.round().astype(int)
+
+        # How many cases were observed relative to the target, as a percentage capped at 100%
+        ratio = (barangays["cases"] / barangays["target"].where(barangays["target"] > 0)).fillna(0)
+        barangays["risk_percent"] = (ratio * 100).round().clip(upper=100).astype(int)
+
+        high = barangays["risk_percent"] >= 75
+        moderate = barangays["risk_percent"] >= 55
+        barangays["risk_level"] = np.select([high, moderate], ["High", "Moderate"], "Low")
+        barangays["color"] = np.select([high, moderate], ["red", "orange"], "green")
+        self.barangays = barangays.join(centroids)
+
+        # One heat point per barangay at its centroid, carrying all of its located cases (cases are
+        # placed at their barangay's coordinates, and the heat layer adds up intensities anyway)
+        weights = barangays["color"].map(risk_weights).reindex(names).fillna(1)
+        self.heat_points = centroids.assign(weight=weights * located_cases)[located_cases > 0]
+        self.monthly = monthly
+        self.mapped_cases = int(cases[located].sum())
+
+    @property
+    def target_label(self):
+        return "Monthly Target" if self.monthly else "Annual Target"
+
+    @property
+    def risk_levels(self):
+        """Barangay → ("<Level> Risk", colour), as the Excel summary reads it."""
+        labels = self.barangays["risk_level"] + " Risk"
+        return dict(zip(self.barangays.index, zip(labels, self.barangays["color"])))
+
+    def heat_data(self):
+        """[lat, lng, weight] of every heat point."""
+        return self.heat_points.to_numpy().tolist()
+
+    def markers(self):
+        """Barangays with located confirmed cases, for the summary markers."""
+        return self.barangays[(self.barangays["cases"] > 0) & self.barangays["lat"].notna()]
+
+    def map_payload(self):
+        """The compact layer data the map component draws: heat points, barangay summaries and badge count."""
+        markers = self.markers()
+        risk_levels = self.risk_levels
+        return {
+            "points": self.heat_points.round(6).to_numpy().tolist(),
+            "barangays": [{
+                "name": brgy,
+                "lat": round(float(marker["lat"]), 6),
+                "lng": round(float(marker["lng"]), 6),
+                "population": int(marker["population"]),
+                "cases": int(marker["cases"]),
+                "target": int(marker["target"]),
+                "risk": risk_levels[brgy][0],
+                "color": risk_levels[brgy][1],
+            } for brgy, marker in markers.iterrows()],
+            "target_label": self.target_label,
+            "cases": self.mapped_cases,
+        }
 
 
 # Define the page as a function to be used by sidebar.py
@@ -61,49 +226,24 @@ def Heatmap(is_light=True):
     heatmap_sex_filter = st.session_state["heatmap_sex_filter"]
 
 
-    # --- Constants Initialization ---
-
-    # Incidence Rate -> Incidence Rate = (Number of New Cases / Population) * Multiplier
-    incidence_rate = 0.00539
-
-    # Mandaue City Population Data (2025 Census) = 388,002
-    mandaue_barangay_population_2025 = {
-        "Alang-Alang": 12251, "Bakilid": 4671, "Banilad": 19594, "Basak": 12554,
-        "Cabancalan": 15818, "Cambaro": 9581, "Canduman": 24995, "Casili": 5756,
-        "Casuntingan": 17956, "Centro (Poblacion)": 3171, "Cubacub": 14738, "Guizo": 7728,
-        "Ibabao-Estancia": 7449, "Jagobiao": 12937, "Labogon": 21811, "Looc": 18536,
-        "Maguikay": 15931, "Mantuyong": 5846, "Opao": 12798, "Pagsabungan": 21603,
-        "Pakna-an": 32540, "Subangdaku": 18219, "Tabok": 20767, "Tawason": 7440,
-        "Tingub": 6479, "Tipolo": 16822, "Umapad": 20011
+    # Report labels of the MAP_AGE_GROUP values
+    age_group_labels = {
+        "0-14": "Children (0-14)",
+        "15-24": "Youth/Young Adults (15-24)",
+        "25-64": "Adults (25-64)",
+        "65+": "Elderly (65+)",
     }
 
 
     # --- Helper functions ---
 
-    # Function to generate heatmap summary report in Excel format
-    def generate_heatmap_excel(data, risk_levels, selected_month, selected_year):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Report"
+    # Function to generate heatmap summary report in Excel format from the case cube cells
+    def generate_heatmap_excel(cells, risk_levels, selected_month, selected_year):
+        book = ExcelExport(HEATMAP_EXCEL_STYLES)
+        ws = book.sheet("Report", [20, 10, 12, 2, 10, 10, 2, 28, 10])
 
         # Header Info
-        ws.merge_cells('A1:J1')
-        ws['A1'] = "Mandaue City Health Office"
-        ws['A1'].font = Font(bold=True, size=14)
-        ws['A1'].alignment = Alignment(horizontal='left')
-
-        ws.merge_cells('A2:J2')
-        ws['A2'] = "S.B. Cabahug, Mandaue City, Philippines."
-        ws['A2'].alignment = Alignment(horizontal='left')
-
-        ws.merge_cells('A3:J3')
-        ws['A3'] = "Call us on: +63 (032) 230 4500 | FB: Mandaue City Public Affairs Office | Email: cmo@mandauecity.gov.ph"
-        ws['A3'].alignment = Alignment(horizontal='left')
-
-        ws.merge_cells('A5:J5')
-        ws['A5'] = "DeteXTB: AI-Assisted Presumptive Tuberculosis Detection and Mapping System"
-        ws['A5'].font = Font(bold=True, size=12)
-        ws['A5'].alignment = Alignment(horizontal='left')
+        ws.letterhead(span=10)
 
         # Reporting Period
         if selected_month == "All":
@@ -111,17 +251,13 @@ def Heatmap(is_light=True):
         else:
             month_name = datetime(2000, selected_month, 1).strftime('%B')
             reporting_period = f"{month_name} {selected_year}"
-        
-        ws.merge_cells('A7:J7')
-        ws['A7'] = f"Reporting Period: {reporting_period}"
-        ws['A7'].font = Font(italic=True, size=11)
-        ws['A7'].alignment = Alignment(horizontal='left')
+
+        ws.append([f"Reporting Period: {reporting_period}"], "italic", merge=10)
+        ws.append()
 
         # Total Record with pastel red fill for emphasis
-        ws['A9'] = "Total Records"
-        ws['A9'].fill = PatternFill(start_color="F8B6B8", end_color="F8B6B8", fill_type="solid")
-        ws['B9'] = len(data)
-        ws['B9'].fill = PatternFill(start_color="F8B6B8", end_color="F8B6B8", fill_type="solid")
+        ws.append(["Total Records", sum(cell.cases for cell in cells)], "total")
+        ws.append()
 
         # Prepare/Initialize counts
         barangay_data = defaultdict(lambda: {"count": 0})
@@ -134,122 +270,61 @@ def Heatmap(is_light=True):
             "Unknown": 0
         }
 
-        for record in data:
+        for cell in cells:
             # Barangay
-            brgy = record.get("MAP_BRGY", "Unknown")
-            barangay_data[brgy]["count"] += 1
+            barangay_data[cell.brgy]["count"] += cell.cases
 
             # Sex
-            sex = record.get("MAP_SEX", "Unknown")
-            if sex not in sex_counts:
-                sex_counts[sex] = 0
-            sex_counts[sex] += 1
+            if cell.sex not in sex_counts:
+                sex_counts[cell.sex] = 0
+            sex_counts[cell.sex] += cell.cases
 
             # Age group
-            age_group_str = record.get("MAP_AGE_GROUP", "Unknown")
-            if age_group_str == "0-14":
-                age_groups["Children (0-14)"] += 1
-            elif age_group_str == "15-24":
-                age_groups["Youth/Young Adults (15-24)"] += 1
-            elif age_group_str == "25-64":
-                age_groups["Adults (25-64)"] += 1
-            elif age_group_str == "65+":
-                age_groups["Elderly (65+)"] += 1
-            else:
-                age_groups["Unknown"] += 1
+            age_groups[age_group_labels.get(cell.age_group, "Unknown")] += cell.cases
 
         # Table Headers
-        ws['A11'] = "Barangay"
-        ws['B11'] = "Count"
-        ws['C11'] = "Risk Level"
-        ws['E11'] = "Sex"
-        ws['F11'] = "Count"
-        ws['H11'] = "Age Group"
-        ws['I11'] = "Count"
-
-        header_cells = ['A11','B11','C11','E11','F11','H11','I11']
-        for cell in header_cells:
-            ws[cell].font = Font(bold=True)
-            ws[cell].fill = PatternFill(start_color="FECEAB", end_color="FECEAB", fill_type="solid")
-
-        # Risk level font colors
-        risk_text_colors = {
-            "Low": "008000",      # Green
-            "Moderate": "FF8C00", # Orange
-            "High": "DC143C"      # Red
-        }
+        ws.append(["Barangay", "Count", "Risk Level", None, "Sex", "Count", None, "Age Group", "Count"], "table header")
 
-        # Fill data rows
+        # Fill data rows, the three tables side by side
         max_len = max(len(barangay_data), len(sex_counts), len(age_groups))
         barangay_list = list(barangay_data.items())
         sex_list = list(sex_counts.items())
         age_list = list(age_groups.items())
 
         for i in range(max_len):
-            row = i + 12
+            row = [None] * 9
+            risk_style = None
             if i < len(barangay_list):
                 brgy, info = barangay_list[i]
-                ws[f'A{row}'] = brgy
-                ws[f'B{row}'] = info["count"]
-                ws[f'B{row}'].alignment = Alignment(horizontal="left")
-
                 risk_label, risk_color_name = risk_levels.get(brgy, ("Low Risk", "green"))
                 risk_level = risk_label.replace(" Risk", "") if " Risk" in risk_label else risk_label
-                ws[f'C{row}'] = risk_level
-                if risk_level in risk_text_colors:
-                    ws[f'C{row}'].font = Font(color=risk_text_colors[risk_level], bold=True)
+                row[0:3] = [brgy, info["count"], risk_level]
+                if f"{risk_level} risk" in HEATMAP_EXCEL_STYLES:
+                    risk_style = f"{risk_level} risk"
 
             if i < len(sex_list):
-                sex, count = sex_list[i]
-                ws[f'E{row}'] = sex
-                ws[f'F{row}'] = count
-                ws[f'F{row}'].alignment = Alignment(horizontal="left")
+                row[4:6] = sex_list[i]
 
             if i < len(age_list):
-                age_group, count = age_list[i]
-                ws[f'H{row}'] = age_group
-                ws[f'I{row}'] = count
-                ws[f'I{row}'].alignment = Alignment(horizontal="left")
-
-        # Disclaimer section
-        disclaimer_row_1 = max_len + 14
-        disclaimer_row_2 = disclaimer_row_1 + 1
+                row[7:9] = age_list[i]
 
-        ws.merge_cells(f"A{disclaimer_row_1}:J{disclaimer_row_1}")
-        ws[f"A{disclaimer_row_1}"] = (
-            "The heatmap and targets are based on estimated TB incidence (0.539%)."
-        )
-        ws[f"A{disclaimer_row_1}"].font = Font(italic=True, color="808080")
-        ws[f"A{disclaimer_row_1}"].alignment = Alignment(horizontal='left')
+            ws.append(row, [None, "left", risk_style, None, None, "left", None, None, "left"])
 
-        ws.merge_cells(f"A{disclaimer_row_2}:J{disclaimer_row_2}")
-        ws[f"A{disclaimer_row_2}"] = (
-            "These may not be real-time counts and should be verified with local surveillance before operational use."
+        # Disclaimer section
+        ws.append()
+        ws.append()
+        ws.append(["The heatmap and targets are based on estimated TB incidence (0.539%)."], "note", merge=10)
+        ws.append(
+            ["These may not be real-time counts and should be verified with local surveillance before operational use."],
+            "note", merge=10
         )
-        ws[f"A{disclaimer_row_2}"].font = Font(italic=True, color="808080")
-        ws[f"A{disclaimer_row_2}"].alignment = Alignment(horizontal='left')
 
         # Timestamp
-        timestamp_row = disclaimer_row_2 + 3
-        ws.merge_cells(f'A{timestamp_row}:I{timestamp_row}')
-        ws[f'A{timestamp_row}'] = f"Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        ws[f'A{timestamp_row}'].font = Font(italic=True)
-        ws[f'A{timestamp_row}'].alignment = Alignment(horizontal='left')
-
-        # Column Widths
-        column_widths = {
-            "A": 20, "B": 10, "C": 12, "D": 2,
-            "E": 10, "F": 10, "G": 2,
-            "H": 28, "I": 10
-        }
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
+        ws.append()
+        ws.append()
+        ws.append([f"Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"], "italic", merge=9)
 
-        # Save to buffer
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return output.read()
+        return book.to_bytes()
 
 
 # ---------- Main Content ----------
@@ -420,8 +495,8 @@ def Heatmap(is_light=True):
             box-shadow: 0 2px 5px rgba(0, 0, 0, 0.2) !important;
         }}
 
-        /* Full cleanup of folium iframe borders & background */
-        iframe, .folium-map {{
+        /* Full cleanup of map iframe borders & background */
+        iframe {{
             background-color: transparent !important;
             margin: 0 !important;
             padding: 0 !important;
@@ -456,15 +531,6 @@ def Heatmap(is_light=True):
             overflow-x: hidden !important;
             background: transparent !important;
         }}
-        .folium-map {{
-        animation: fadeInMap 0.1s ease-in;
-    }}
-
-    @keyframes fadeInMap {{
-        from {{ opacity: 0; }}
-        to {{ opacity: 1; }}
-    }}
-
     </style>
     """, unsafe_allow_html=True)
 
@@ -583,334 +649,64 @@ def Heatmap(is_light=True):
     heatmap_barangay_filter = st.session_state.heatmap_filters["barangay"]
     heatmap_sex_filter = st.session_state.heatmap_filters["sex"]
 
-    # --- Fetch and Filter Records from Supabase ---
-    query = supabase.table("HEATMAP_Table")\
-    .select("*, DIAGNOSIS_Table(DX_ID, DX_STATUS)")
-
-    # Apply filters only if they're not set to "All" or None
-    if heatmap_barangay_filter != "All":
-        query = query.ilike("MAP_BRGY", f"%{heatmap_barangay_filter}%")
-
-    if heatmap_sex_filter != "All":
-        query = query.eq("MAP_SEX", heatmap_sex_filter)
-
     # Handle month/year filter
     selected_month_value = st.session_state.heatmap_filters.get("selected_month", "All")
     selected_year = st.session_state.heatmap_filters.get("selected_year", datetime.today().year)
 
-    if selected_month_value != "All":
-        # First and last day of chosen month
-        start_date = datetime(selected_year, selected_month_value, 1)
-        if selected_month_value == 12:
-            end_date = datetime(selected_year + 1, 1, 1) - timedelta(seconds=1)
-        else:
-            end_date = datetime(selected_year, selected_month_value + 1, 1) - timedelta(seconds=1)
-        
-        query = query.gte("MAP_GENERATED_AT", start_date.isoformat())
-        query = query.lte("MAP_GENERATED_AT", end_date.isoformat())
-    else:
-        # If month is "All", filter by year only
-        start_date = datetime(selected_year, 1, 1)
-        end_date = datetime(selected_year + 1, 1, 1) - timedelta(seconds=1)
-        query = query.gte("MAP_GENERATED_AT", start_date.isoformat())
-        query = query.lte("MAP_GENERATED_AT", end_date.isoformat())
-
     # Get age group filter
     age_group_filter = st.session_state.heatmap_filters.get("age_group", "All")
 
-    # Execute query
+    # --- Fetch confirmed case counts from the pre-aggregated cube (sql/heatmap_cube.sql) ---
     try:
-        res = query.execute()
-        heatmap_records = res.get("data", []) if isinstance(res, dict) else getattr(res, "data", [])
-        
-        confirmed_counts = defaultdict(int)
-
-        for record in heatmap_records:
-            brgy = record.get("MAP_BRGY", "")
-            date = record.get("MAP_GENERATED_AT", "")
-            
-            try:
-                dt = parse(date)
-                # Check if the record should be processed based on month filter
-                if selected_month_value == "All":
-                    if dt.year == selected_year:
-                        process_record = True
-                    else:
-                        continue
-                else:
-                    if dt.month == selected_month_value and dt.year == selected_year:
-                        process_record = True
-                    else:
-                        continue
-                
-                if process_record:
-                    diagnosis_info = record.get("DIAGNOSIS_Table", {})
-                    if isinstance(diagnosis_info, list):
-                        diagnosis_info = diagnosis_info[0] if diagnosis_info else {}
-                    
-                    dx_status = diagnosis_info.get("DX_STATUS")
-
-                    if dx_status == "Confirmed Positive":
-                        if age_group_filter != "All":
-                            try:
-                                age_group = record.get("MAP_AGE_GROUP", "")
-                                # Convert age group string to numeric range for easier comparison
-                                if age_group == "0-14":
-                                    age_match = age_group_filter == "0-14"
-                                elif age_group == "15-24":
-                                    age_match = age_group_filter == "15-24"
-                                elif age_group == "25-64":
-                                    age_match = age_group_filter == "25-64"
-                                elif age_group == "65+":
-                                    age_match = age_group_filter == "65+"
-                                else:
-                                    age_match = False
-                            except:
-                                age_match = False
-                            
-                            if not age_match:
-                                continue  # Skip this record if age group doesn't match
-                        
-                        # Only count if it passed all filters
-                        confirmed_counts[brgy] += 1
-
-            except Exception as e:
-                print(f"Error processing record: {e}")
-                continue
-
-        # --- Compute Target & Identify High Risk ---
-
-        risk_levels = {}
-        targets = {}
-
-        for brgy, pop in mandaue_barangay_population_2025.items():
-            count = confirmed_counts.get(brgy, 0)
-
-            # Determine if user selected full year or a specific month
-            month_index = 0 if selected_month_value == "All" else 1
-
-            # --- Target calculation ---
-            if month_index == 0:
-                target = pop * incidence_rate  # Annual target
-                target_label = "Annual Target"
-            else:
-                target = (pop * incidence_rate) / 12  # Monthly target
-                target_label = "Monthly Target"
-
-            # Round target for display & risk calculation
-            target_display = int(round(target))
-            targets[brgy] = target_display  # store for popup
-            target = target_display
-
-            # How many cases were observed relative to the target
-            risk_ratio = count / target if target > 0 else 0
-
-            # Converts the ratio into a percentage, avoids decimals, caps at 100%
-            risk_percent = min(round(risk_ratio * 100), 100)
-
-            # Risk level classification based on risk_percent
-            if risk_percent >= 75:
-                color = "red"
-                risk_level = "High"
-            elif risk_percent >= 55:
-                color = "orange"
-                risk_level = "Moderate"
-            else:
-                color = "green"
-                risk_level = "Low"
-
-            risk_levels[brgy] = (risk_level + " Risk", color)
-
+        heatmap_cells = fetch_heatmap_cells(
+            selected_year,
+            month=selected_month_value,
+            barangay=heatmap_barangay_filter,
+            age_group=age_group_filter,
+            sex=heatmap_sex_filter,
+        )
     except Exception as e:
         st.error(f"Failed to fetch heatmap data: {e}")
-        heatmap_records = []
-        risk_levels = {}
-
-   # --- Prepare Heatmap ---
-    heat_data = []
-    confirmed_records = []  # Store only confirmed records for mapping
-
-    for record in heatmap_records:
-        # Check if this record represents a confirmed case
-        diagnosis_info = record.get("DIAGNOSIS_Table", {})
-        if isinstance(diagnosis_info, list):
-            diagnosis_info = diagnosis_info[0] if diagnosis_info else {}
-        
-        dx_status = diagnosis_info.get("DX_STATUS")
-        
-        # Only process confirmed positive cases
-        if dx_status == "Confirmed Positive":
-            if age_group_filter != "All":
-                try:
-                    age_group = record.get("MAP_AGE_GROUP", "")
-                    if age_group == "0-14":
-                        age_match = age_group_filter == "0-14"
-                    elif age_group == "15-24":
-                        age_match = age_group_filter == "15-24"
-                    elif age_group == "25-64":
-                        age_match = age_group_filter == "25-64"
-                    elif age_group == "65+":
-                        age_match = age_group_filter == "65+"
-                    else:
-                        age_match = False
-                except:
-                    age_match = False
-                
-                if not age_match:
-                    continue
-            
-            lat = record.get("MAP_LAT")
-            lon = record.get("MAP_LANG")
-            brgy = record.get("MAP_BRGY", "")
-            
-            if lat is None or lon is None:
-                continue
-            
-            confirmed_records.append(record)  # Add to confirmed records list
-            
-            # Get the risk level and assign a weight
-            risk_label, risk_color = risk_levels.get(brgy, ("Unknown", "gray"))
-            if risk_color == "red":
-                weight = 3  # Highest intensity for high risk
-            elif risk_color == "orange":
-                weight = 2  # Medium intensity for moderate risk
-            else:
-                weight = 1  # Lowest intensity for low risk
-            
-            heat_data.append([lat, lon, weight])
-
-    m = folium.Map(location=[10.3200, 123.9000], zoom_start=13, tiles='OpenStreetMap')
-
-    if heat_data:
-        custom_gradient = {
-            0.3: 'green',   # Low risk
-            0.6: 'orange',  # Moderate risk
-            1.0: 'red'     # High risk
-        }
-        
-        HeatMap(
-            heat_data,
-            radius=20, 
-            blur=15,   
-            min_opacity=0.5,
-            max_zoom=18,
-            gradient=custom_gradient
-        ).add_to(m)
-
-    # Add barangay-level summary markers (larger and more opaque)
-    for brgy, (risk_label, risk_color) in risk_levels.items():
-        # Only show barangays that have confirmed cases
-        if confirmed_counts.get(brgy, 0) == 0:
-            continue
-            
-        # Find first confirmed record for this barangay to get coordinates
-        brgy_confirmed_records = [r for r in confirmed_records if r.get("MAP_BRGY", "") == brgy]
-        if not brgy_confirmed_records:
-            continue
-            
-        lat = brgy_confirmed_records[0].get("MAP_LAT")
-        lon = brgy_confirmed_records[0].get("MAP_LANG")
-        if lat is None or lon is None:
-            continue
-            
-        target_value = int(round(targets.get(brgy, 0)))
-        confirmed_cases = confirmed_counts.get(brgy, 0)
-        population = mandaue_barangay_population_2025.get(brgy, 0)
-        
-        popup_content = f"""
-        <div style="font-family: Arial; min-width: 200px">
-            <h4>{brgy} Summary</h4>
-            <hr style="margin: 5px 0;">
-            <b>Population:</b> {population}<br>
-            <b>Confirmed Cases:</b> {confirmed_cases}<br>
-            <b>{target_label}:</b> {target_value}<br>
-            <b>Risk Level:</b> <span style="color:{risk_color}; font-weight:bold;">{risk_label}</span>
-        </div>
-        """
-        
-        folium.CircleMarker(
-            location=[lat, lon],
-            radius=10,
-            color=risk_color,
-            weight=2,
-            fill=True,
-            fill_color=risk_color,
-            fill_opacity=0.7,
-            popup=folium.Popup(popup_content, max_width=300)
-        ).add_to(m)
-
-    # --- Floating Match Count Badge ---
-    confirmed_count = len(confirmed_records)
-    badge_html = f"""
-    <div style="
-        position: absolute;
-        top: 10px;
-        left: 50%;
-        transform: translateX(-50%);
-        background-color: {'#ee5a5a' if confirmed_count > 0 else '#58a83e'};
-        color: white;
-        border-radius: 35px;
-        height: 45px;
-        padding: 12px 20px 10px 22px;
-        font-weight: bold;
-        font-size: 15px;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-        z-index: 9999;
-        text-align: center;
-    ">
-        🔍 {confirmed_count} case{'s' if confirmed_count != 1 or 0 else ''} found
-    </div>
-    """
+        heatmap_cells = []
 
-    # Inject into the Folium map so it's included in HTML export
-    m.get_root().html.add_child(Element(badge_html))
+    # Function to build the map layers of the fetched cells
+    def render_map():
+        # --- Compute Target & Identify High Risk ---
+        risk = HeatmapRisk(heatmap_cells, monthly=selected_month_value != "All")
+        payload = risk.map_payload()
+        return RenderedMap(payload, standalone_map_html(payload), risk.mapped_cases, risk.risk_levels)
+
+    # Reruns with the same filters and cells (theme toggles, other widgets) reuse the rendered map
+    map_key = ((selected_year, selected_month_value, heatmap_barangay_filter, age_group_filter, heatmap_sex_filter),
+               tuple(heatmap_cells))
+    rendered = cached_map(map_key, render_map)
 
     # --- Display Map ---
-    map_html = m.get_root().render()
-    safe_map_html = map_html.replace('"', '&quot;')
-
-    components.html(
-        f"""
-        <div style="display: flex; justify-content: center; align-items: center; width: 100%; margin: 0 auto; padding: 0;">
-            <iframe srcdoc="{safe_map_html}" width="1200" height="650" style="
-                border: none;
-                margin: 0;
-                padding: 0;
-                background: transparent;
-                overflow: hidden;
-                border-radius: 15px;
-            "></iframe>
-        </div>
-        """,
-        height=660,
-    )
+    # The shell stays mounted across reruns; filter changes only replace its layers
+    heatmap_map(data=rendered.payload, key="heatmap_map", default=None)
 
     # --- Downloads ---
-    if confirmed_records: # Only show if there are records
-        selected_month_value = st.session_state.heatmap_filters.get("selected_month", "All")
-        selected_year_value = st.session_state.heatmap_filters.get("selected_year", datetime.today().year)
-        excel_bytes = generate_heatmap_excel(confirmed_records, risk_levels, selected_month_value, selected_year_value)
-        
+    if rendered.mapped_cases: # Only show if there are records
         col_left, btn_col1, spacer_col, btn_col2 = st.columns([8, 1, 0.3, 1])
         with col_left:
             st.write("")
         with btn_col1: # HTML download button
             st.download_button(
                 "Export Map", 
-                map_html, 
+                rendered.html, 
                 f"TB_Cases_Heatmap_{datetime.now().strftime('%Y-%m-%d')}.html", 
                 "text/html", 
                 key="download-image"
             )
         with spacer_col:
             st.write("")
-        with btn_col2: # Excel download button
-            st.download_button(
-                "Export Excel", 
-                data=excel_bytes, 
+        with btn_col2: # Excel download button, the workbook is built once asked for
+            export_button(
+                "Export Excel",
+                lambda: generate_heatmap_excel(heatmap_cells, rendered.risk_levels, selected_month_value, selected_year),
                 file_name=f"TB_Cases_Heatmap_{datetime.now().strftime('%Y-%m-%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
-                key="download-excel"
+                key="download-excel",
+                source=map_key,
             )
 
     st.markdown('<div style="height:10px;"></div>', unsafe_allow_html=True)
\ No newline at end of file
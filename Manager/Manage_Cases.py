@@ -6,6 +6,7 @@ import uuid
 from datetime import datetime
 from datetime import date
 from Supabase import supabase
+from Repository import PREFETCH_CASE_PAGES, fetch_case_page, invalidate_tables
 from PIL import Image, ImageOps
 import requests
 from io import BytesIO
@@ -54,98 +55,41 @@ def Manage_Cases(is_light=True):
         is_light = st.session_state["light_mode"]
 
 
-    # Load cases from Supabase
+    # Load the current page of cases from Supabase, filtered and paginated on the server
     def fetch_cases():
         try:
-            # Step 1: Fetch all necessary result entries
-            result = (
-                supabase.table("RESULT_Table")
-                .select("""
-                    RES_ID,
-                    RES_DATE,
-                    RES_PRESUMPTIVE,
-                    RES_CONF_SCORE,
-                    RES_STATUS,
-                    CHEST_XRAY_Table!inner(
-                        CXR_ID,
-                        PT_ID,
-                        CXR_FILE_PATH,
-                        PATIENT_Table(
-                            PT_FNAME,
-                            PT_MNAME,
-                            PT_LNAME,
-                            PT_SEX,
-                            PT_AGE,
-                            PT_PHONE,
-                            PT_HOUSENO,
-                            PT_STREET,
-                            PT_BRGY,
-                            PT_CITY
-                        )
-                    )
-                """)
-                .order("RES_DATE", desc=True)
-                .limit(1000)
-                .execute()
+            page = fetch_case_page(
+                case_filters(),
+                st.session_state.manage_cases_page_num,
+                cases_per_page,
+                cursors=st.session_state.setdefault("manage_cases_page_cursors", {}),
+                prefetch=PREFETCH_CASE_PAGES,
             )
-
-            seen_patients = set()
             latest_cases = []
 
-            for entry in result.data:
-                cxr_data = entry["CHEST_XRAY_Table"]
-                patient_data = cxr_data["PATIENT_Table"]
-                pt_id = cxr_data["PT_ID"]
-                cxr_id = cxr_data["CXR_ID"]
-
-                # Avoid duplicate patients
-                if pt_id in seen_patients:
-                    continue
-                seen_patients.add(pt_id)
-
-                full_name = f"{patient_data['PT_FNAME']} {patient_data['PT_MNAME']} {patient_data['PT_LNAME']}".strip()
-                confidence_percent = f"{int(float(entry['RES_CONF_SCORE']) * 100)}%"
-                address_parts = [
-                    patient_data.get('PT_HOUSENO', ''),
-                    patient_data.get('PT_STREET', ''),
-                    patient_data.get('PT_BRGY', ''),
-                    patient_data.get('PT_CITY', '')
-                ]
-                full_address = ', '.join([part.strip() for part in address_parts if part and part.strip()])
-
+            # Latest case per patient
+            for case in page.cases:
                 latest_cases.append({
-                    "res_id": entry["RES_ID"],
-                    "cxr_id": cxr_id,
-                    "pt_id": pt_id,
-                    "name": full_name,
-                    "date": entry["RES_DATE"],
-                    "result": entry["RES_PRESUMPTIVE"],
-                    "confidence": confidence_percent,
-                    "diagnosis": entry["RES_STATUS"],
-                    "age": patient_data.get("PT_AGE", "N/A"),
-                    "sex": patient_data.get("PT_SEX", "N/A"),
-                    "barangay": patient_data.get("PT_BRGY", "N/A"),
-                    "phone": patient_data.get("PT_PHONE", "N/A"),
-                    "address": full_address,
-                    "image_path": cxr_data.get("CXR_FILE_PATH", None)  # ✅ add image path
+                    "res_id": case.res_id,
+                    "cxr_id": case.cxr_id,
+                    "pt_id": case.pt_id,
+                    "name": case.full_name,
+                    "date": case.res_date,
+                    "result": case.presumptive,
+                    "confidence": case.confidence_percent,
+                    "diagnosis": case.res_status,
+                    "age": case.age,
+                    "sex": case.sex,
+                    "barangay": case.brgy,
+                    "phone": case.phone,
+                    "address": case.address,
+                    "image_path": case.cxr_file_path
                 })
-            return latest_cases
+            return latest_cases, page.total
 
         except Exception as e:
             show_notification(f"Error loading patient results: {e}", "error")
-            return []
-
-    cases = fetch_cases()
-
-    # Remove oldest_date logic, set default date to None
-    if "diagnoses" not in st.session_state:
-        st.session_state.diagnoses = {f"diagnosis_{i}": case["diagnosis"] for i, case in enumerate(cases)}
-
-    if "show_note_input" not in st.session_state:
-        st.session_state.show_note_input = {f"note_input_{i}": False for i in range(len(cases))}
-
-    if "notes" not in st.session_state:
-        st.session_state.notes = {f"note_{i}": "" for i in range(len(cases))}
+            return [], 0
 
     if 'manage_cases_page_num' not in st.session_state:
         st.session_state.manage_cases_page_num = 1
@@ -183,40 +127,22 @@ def Manage_Cases(is_light=True):
 
     # Helper for pagination controls
     cases_per_page = 10
-    total_cases = len(cases)
-    total_pages = (total_cases - 1) // cases_per_page + 1
-
-    def apply_filters():
-        filtered = cases
-        query = st.session_state["search_bar"].strip().lower()
-
-        if query:
-            filtered = [c for c in filtered if query in c["name"].lower()]
-
-        if st.session_state["manage_cases_barangay_filter"] != "All":
-            filtered = [c for c in filtered if c["barangay"] == st.session_state["manage_cases_barangay_filter"]]
-
-        if st.session_state["manage_cases_sex_filter"] != "All":
-            filtered = [c for c in filtered if c["sex"] == st.session_state["manage_cases_sex_filter"]]
-
-        if st.session_state["manage_cases_status_filter"] != "All":
-            filtered = [c for c in filtered if c["diagnosis"] == st.session_state["manage_cases_status_filter"]]
-
-        # Only filter by date if a date is selected
-        if st.session_state["date"]:
-            filtered = [
-                c for c in filtered
-                if datetime.fromisoformat(c["date"]).date() == st.session_state["date"]
-            ]
 
+    def case_filters():
+        barangay = st.session_state["manage_cases_barangay_filter"]
+        sex = st.session_state["manage_cases_sex_filter"]
+        status = st.session_state["manage_cases_status_filter"]
         age_filter = st.session_state["manage_cases_age_filter"]
-        if age_filter > 0:
-            filtered = [
-                c for c in filtered
-                if c["age"] is not None and int(c["age"]) == age_filter
-            ]
-
-        return filtered
+        return {
+            "name": st.session_state["search_bar"].strip() or None,
+            "barangay": None if barangay == "All" else barangay,
+            "sex": None if sex == "All" else sex,
+            "status": None if status == "All" else status,
+            # Only filter by date if a date is selected
+            "date_from": st.session_state["date"],
+            "date_to": st.session_state["date"],
+            "age": age_filter if age_filter > 0 else None,
+        }
     
 
     def pagination_controls(position):
@@ -651,12 +577,13 @@ def Manage_Cases(is_light=True):
                 st.rerun()
             st.markdown('</div>', unsafe_allow_html=True)
 
-        filtered_cases = apply_filters()
-        total_cases = len(filtered_cases)
+        cases_to_display, total_cases = fetch_cases()
         total_pages = (total_cases - 1) // cases_per_page + 1
-        start_idx = (st.session_state.manage_cases_page_num - 1) * cases_per_page
-        end_idx = start_idx + cases_per_page
-        cases_to_display = filtered_cases[start_idx:end_idx]
+
+        # Step back if the page no longer exists (fewer matches than when it was opened)
+        if total_cases and st.session_state.manage_cases_page_num > total_pages:
+            st.session_state.manage_cases_page_num = total_pages
+            cases_to_display, total_cases = fetch_cases()
 
         # Determine if any filters are active
         filters_active = (
@@ -690,7 +617,7 @@ def Manage_Cases(is_light=True):
                     margin-top: 10px;       
                 ">
                     <span style="margin-right: -2px;"></span>
-                    Filtered Cases: {len(filtered_cases)}
+                    Filtered Cases: {total_cases}
                 </div>
                 """, unsafe_allow_html=True)
             else:
@@ -711,7 +638,7 @@ def Manage_Cases(is_light=True):
                     margin-top: 10px;
                 ">
                     <span style="margin-right: -2px;"></span>
-                    Total Cases: {len(cases)}
+                    Total Cases: {total_cases}
                 </div>
                 """, unsafe_allow_html=True)
 
@@ -977,6 +904,7 @@ def Manage_Cases(is_light=True):
 def update_result(res_id, status, show_notification, is_light=True):
     try:
         supabase.table("RESULT_Table").update({"RES_STATUS": status}).eq("RES_ID", res_id).execute()
+        invalidate_tables("RESULT_Table")
     except Exception as e:
         show_notification(f"Error updating RESULT_Table: {e}", "error", is_light=is_light)
 
@@ -1132,4 +1060,7 @@ def insert_or_update_diagnosis_dataset_or_heatmap(case, status, note, show_notif
                 show_notification("Case removed from dataset (status set to Pending)", "success", is_light)
 
     except Exception as e:
-        show_notification(f"Error managing diagnosis and dataset: {e}", "error", is_light=is_light)
\ No newline at end of file
+        show_notification(f"Error managing diagnosis and dataset: {e}", "error", is_light=is_light)
+    finally:
+        # Drop cached reads even after a partial save, some of the writes may have gone through
+        invalidate_tables("DIAGNOSIS_Table", "HEATMAP_Table", "DATASET_Table")
@@ -1,425 +1,169 @@
 # Reports.py
 
 import streamlit as st
-import io
-from Supabase import supabase
+import pandas as pd
+from Repository import ReportRow, fetch_ai_metrics, fetch_report_rows, gather
+from Excel_Export import ExcelExport, export_button, fitted_widths, solid_fill
 from datetime import datetime
-from collections import Counter
 from fpdf import FPDF
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.styles import Font, Alignment
 from openpyxl.chart import PieChart, Reference
 import matplotlib.pyplot as plt
 from io import BytesIO
 
 
-# --- Data Fetching Helper Function Logic + Constant ---
+# --- Report Dataset ---
 
 # Get today's date in YYYY-MM-DD format
 today_str = datetime.now().strftime("%Y-%m-%d")
 
-# Function to fetch the logic for the AI Presumptive TB Report block
-def fetch_ai_report_data(selected_month=None, selected_year=None):
-    # Fetch AI-predicted results with associated chest X-ray IDs (CXR_ID)
-    ai_results_resp = supabase.table("RESULT_Table").select("CXR_ID", "RES_PRESUMPTIVE", "RES_DATE", "RES_CONF_SCORE").execute()
-    ai_results = ai_results_resp.data or []
+# Text columns of the report frame, held as Arrow strings
+REPORT_TEXT_COLUMNS = ["res_date", "presumptive", "res_status", "sex", "brgy", "dx_status", "dx_notes", "dx_updated_at"]
+
+# Confirmation method keywords looked for in the diagnosis notes, first match wins
+CONFIRMATION_METHODS = [
+    ("genexpert|xpert", "GeneXpert"),
+    ("smear", "Smear Test"),
+    ("culture", "Culture"),
+    ("x-ray|xray", "X-Ray Finding"),
+]
+
+# Class holding every row the AI and Confirmed TB Cases reports of one period need
+class ReportDataset:
+    """
+        Built once per (month, year) from one embedded query and the metrics
+        RPC, then shared by the report cards and the PDF/Excel exports, which
+        read it without going back to the database.
+    """
+
+    def __init__(self, rows, metrics):
+        frame = pd.DataFrame(rows, columns=ReportRow._fields, dtype=object)
+        self.frame = frame.astype({column: "string[pyarrow]" for column in REPORT_TEXT_COLUMNS})
+        self.metrics = metrics
+        # Same for datasets built from the same rows, so a prepared export survives reruns until the data changes
+        self.fingerprint = hash((tuple(rows), metrics))
+
+    @classmethod
+    def build(cls, selected_month=None, selected_year=None):
+        # Rows and metrics are independent, so both requests are in flight at once
+        return cls(*gather(fetch_report_rows.aio(selected_year, selected_month),
+                           fetch_ai_metrics.aio(selected_year, selected_month)))
+
+    # Function to derive the patient columns shared by both detail tables
+    @staticmethod
+    def _patient_columns(frame):
+        # Normalize sex to 'M' or 'F' to save space
+        sex = frame["sex"].fillna("").str.strip().str.lower().str[:1].map({"m": "M", "f": "F"})
+        return pd.DataFrame({
+            "Patient ID": frame["pt_id"].where(frame["pt_id"].notna(), "Unknown"),
+            "Age": frame["age"].where(frame["age"].notna(), "N/A"),
+            "Sex": sex.astype(object).fillna("N/A"),
+            "Barangay": frame["brgy"].astype(object).fillna("N/A"),
+        }, index=frame.index)
+
+    # Function to map a status column to Confirmed Positive / Confirmed Negative, else `default`
+    @staticmethod
+    def _final_status(status, default):
+        status = status.str.lower()
+        final_status = default.astype(object)
+        final_status = final_status.mask(status.str.contains("confirmed negative", na=False), "Confirmed Negative")
+        return final_status.mask(status.str.contains("confirmed positive", na=False), "Confirmed Positive")
+
+    # Function to fetch the logic for the AI Presumptive TB Report block
+    def ai_report_data(self):
+        # Flagged patients, pending confirmations and accuracy are aggregated in Postgres (sql/ai_metrics.sql)
+        metrics = self.metrics
+
+        if not metrics.total_results:
+            return {
+                "Total Flagged Patients": "0",
+                "AI Accuracy Rate": "No Presumptive Cases",
+                "Pending Confirmations": "0"
+            }
+
+        accuracy = f"{(metrics.correct / metrics.evaluated) * 100:.2f}%" if metrics.evaluated else "No Presumptive Cases"
 
-    if not ai_results:
         return {
-            "Total Flagged Patients": "0",
-            "AI Accuracy Rate": "No Presumptive Cases",
-            "Pending Confirmations": "0"
+            "Total Flagged Patients": str(metrics.flagged_patients),
+            "AI Accuracy Rate": str(accuracy),
+            "Pending Confirmations": str(metrics.pending_confirmations)
         }
 
-    # Filter by month/year if provided
-    if selected_month != "All" or selected_year:
-        filtered_results = []
-        for item in ai_results:
-            if item.get('RES_DATE'):
-                try:
-                    result_date = datetime.fromisoformat(item['RES_DATE'].replace('Z', '+00:00'))
-                    if selected_year and result_date.year != selected_year:
-                        continue
-                    if selected_month != "All" and result_date.month != selected_month:
-                        continue
-                    filtered_results.append(item)
-                except (ValueError, TypeError):
-                    continue
-        ai_results = filtered_results
-
-    if not ai_results:
+    # Function to calculate AI performance metrics (TP, TN, FP, FN)
+    def ai_performance_metrics(self):
+        metrics = self.metrics
+
         return {
-            "Total Flagged Patients": "0",
-            "AI Accuracy Rate": "No Presumptive Cases",
-            "Pending Confirmations": "0"
+            "True Positives (TP)": metrics.tp,
+            "True Negatives (TN)": metrics.tn,
+            "False Positives (FP)": metrics.fp,
+            "False Negatives (FN)": metrics.fn,
+            "Total Evaluated": metrics.tp + metrics.tn + metrics.fp + metrics.fn
         }
 
-    flagged_cxr_ids = [item['CXR_ID'] for item in ai_results if str(item['RES_PRESUMPTIVE']).lower() == "positive"]
-
-    # Get unique patient IDs
-    total_flagged = "0"
-    if flagged_cxr_ids:
-        cxr_resp = supabase.table("CHEST_XRAY_Table").select("CXR_ID", "PT_ID").in_("CXR_ID", flagged_cxr_ids).execute()
-        pt_ids = [item['PT_ID'] for item in cxr_resp.data or []]
-        total_flagged = str(len(set(pt_ids)))
-
-    # Fetch diagnosis statuses
-    cxr_ids_all = [item['CXR_ID'] for item in ai_results]
-    diagnosis_dict = {}
-    if cxr_ids_all:
-        dx_resp = supabase.table("DIAGNOSIS_Table").select("CXR_ID", "DX_STATUS", "DX_UPDATED_AT").in_("CXR_ID", cxr_ids_all).execute()
-        diagnosis_dict = {item['CXR_ID']: {"status": item['DX_STATUS'], "updated_at": item.get('DX_UPDATED_AT')} for item in dx_resp.data or []}
-
-    # Pending confirmations
-    pending_count = str(sum(
-        1 for cxr_id in flagged_cxr_ids
-        if diagnosis_dict.get(cxr_id) is None or str(diagnosis_dict[cxr_id]["status"]).strip().lower() == "pending"
-    ))
-
-    # Normalize and calculate AI accuracy
-    def normalize_dx_status(dx_status):
-        if not dx_status:
-            return None
-        dx_status = str(dx_status).lower()
-        if "confirmed positive" in dx_status:
-            return "positive"
-        elif "confirmed negative" in dx_status:
-            return "negative"
-        elif dx_status == "pending":
-            return "pending"
-        return None
-
-    correct = 0
-    evaluated = 0
-    for item in ai_results:
-        cxr_id = item['CXR_ID']
-        ai_pred = str(item['RES_PRESUMPTIVE']).lower()
-        dx_info = diagnosis_dict.get(cxr_id)
-        dx_status = normalize_dx_status(dx_info["status"]) if dx_info else None
-
-        if dx_status and dx_status != "pending":
-            evaluated += 1
-            if ai_pred == dx_status:
-                correct += 1
-
-    accuracy = f"{(correct / evaluated) * 100:.2f}%" if evaluated else "No Presumptive Cases"
-
-    return {
-        "Total Flagged Patients": total_flagged,
-        "AI Accuracy Rate": str(accuracy),
-        "Pending Confirmations": pending_count
-    }
-
-# Function to fetch detailed flagged patient data for AI report exports
-def fetch_flagged_patient_details(selected_month=None, selected_year=None):
-    # Fetch AI results with confidence scores (level is used)
-    ai_results_resp = supabase.table("RESULT_Table").select("CXR_ID", "RES_PRESUMPTIVE", "RES_DATE", "RES_CONF_SCORE").execute()
-    ai_results = ai_results_resp.data or []
-    
-    # Filter by date
-    if selected_month != "All" or selected_year:
-        filtered_results = []
-        for item in ai_results:
-            if item.get('RES_DATE'):
-                try:
-                    result_date = datetime.fromisoformat(item['RES_DATE'].replace('Z', '+00:00'))
-                    if selected_year and result_date.year != selected_year:
-                        continue
-                    if selected_month != "All" and result_date.month != selected_month:
-                        continue
-                    filtered_results.append(item)
-                except (ValueError, TypeError):
-                    continue
-        ai_results = filtered_results
-    
-    # Get only flagged (positive) cases
-    flagged_results = [item for item in ai_results if str(item['RES_PRESUMPTIVE']).lower() == "positive"]
-    
-    if not flagged_results:
-        return []
-    
-    # Get CXR IDs
-    flagged_cxr_ids = [item['CXR_ID'] for item in flagged_results]
-    
-    # Fetch patient info with additional fields
-    cxr_resp = supabase.table("CHEST_XRAY_Table").select("CXR_ID", "PT_ID").in_("CXR_ID", flagged_cxr_ids).execute()
-    cxr_to_patient = {item['CXR_ID']: item['PT_ID'] for item in cxr_resp.data or []}
-    
-    # Fetch patient details with Age, Sex, and Barangay
-    patient_ids = list(set(cxr_to_patient.values()))
-    patient_details_dict = {}
-    if patient_ids:
-        patient_resp = supabase.table("PATIENT_Table").select("PT_ID", "PT_AGE", "PT_SEX", "PT_BRGY").in_("PT_ID", patient_ids).execute()
-        for patient in patient_resp.data or []:
-            # Normalize sex to 'M' or 'F' to save space
-            raw_sex = str(patient.get('PT_SEX', '')).strip().lower()
-            if raw_sex.startswith('m'):
-                sex_value = 'M'
-            elif raw_sex.startswith('f'):
-                sex_value = 'F'
-            else:
-                sex_value = 'N/A'
-
-            patient_details_dict[patient['PT_ID']] = {
-                "age": patient.get('PT_AGE', 'N/A'),
-                "sex": sex_value,
-                "barangay": patient.get('PT_BRGY', 'N/A')
-            }
-    
-    # Fetch diagnosis info
-    dx_resp = supabase.table("DIAGNOSIS_Table").select("CXR_ID", "DX_STATUS", "DX_UPDATED_AT").in_("CXR_ID", flagged_cxr_ids).execute()
-    diagnosis_dict = {item['CXR_ID']: {"status": item['DX_STATUS'], "updated_at": item.get('DX_UPDATED_AT')} for item in dx_resp.data or []}
-    
-    # Build detailed patient list with additional fields
-    patient_details = []
-    for result in flagged_results:
-        cxr_id = result['CXR_ID']
-        pt_id = cxr_to_patient.get(cxr_id, "Unknown")
-        dx_info = diagnosis_dict.get(cxr_id)
-        patient_info = patient_details_dict.get(pt_id, {})
-        
-        # Format final status
-        final_status = "Pending"
-        confirmation_date = "N/A"
-        if dx_info:
-            status_raw = str(dx_info["status"]).lower()
-            if "confirmed positive" in status_raw:
-                final_status = "Confirmed Positive"
-            elif "confirmed negative" in status_raw:
-                final_status = "Confirmed Negative"
-            elif "pending" in status_raw:
-                final_status = "Pending"
-            
-            if dx_info["updated_at"]:
-                try:
-                    confirmation_date = datetime.fromisoformat(dx_info["updated_at"].replace('Z', '+00:00')).strftime("%Y-%m-%d")
-                except:
-                    confirmation_date = "N/A"
-        
-        patient_details.append({
-            "Patient ID": pt_id,
-            "Age": patient_info.get('age', 'N/A'),
-            "Sex": patient_info.get('sex', 'N/A'),
-            "Barangay": patient_info.get('barangay', 'N/A'),
-            "AI Flagged Date": result.get('RES_DATE', 'N/A'),
-            "AI Confidence Score": f"{float(result.get('RES_CONF_SCORE', 0)) * 100:.1f}%" if result.get('RES_CONF_SCORE') else "N/A",
-            "Final Status": final_status,
-            "Confirmation Date": confirmation_date
+    # Function to list the flagged (positive) patients for AI report exports
+    def flagged_patient_details(self):
+        frame = self.frame
+        flagged = frame[(frame["presumptive"].str.lower() == "positive").fillna(False)]
+
+        # Confidence scores are shown as percentages (a missing or zero score is N/A)
+        confidence = pd.to_numeric(flagged["conf_score"], errors="coerce")
+        confidence_text = (confidence * 100).map("{:.1f}%".format).where(confidence.fillna(0) != 0, "N/A")
+
+        # Confirmation date is the date part of the latest diagnosis update
+        updated_at = flagged["dx_updated_at"]
+        valid_date = pd.to_datetime(updated_at, errors="coerce", utc=True, format="ISO8601").notna()
+        confirmation_date = updated_at.str[:10].astype(object).where(valid_date, "N/A")
+
+        details = self._patient_columns(flagged).assign(**{
+            "AI Flagged Date": flagged["res_date"].astype(object).where(flagged["res_date"].notna(), None),
+            "AI Confidence Score": confidence_text,
+            "Final Status": self._final_status(flagged["dx_status"], pd.Series("Pending", index=flagged.index)),
+            "Confirmation Date": confirmation_date,
         })
-    
-    return patient_details
+        return details.to_dict("records")
 
-# Function to calculate AI performance metrics (TP, TN, FP, FN)
-def calculate_ai_performance_metrics(selected_month=None, selected_year=None):
-    # Fetch all AI results
-    ai_results_resp = supabase.table("RESULT_Table").select("CXR_ID", "RES_PRESUMPTIVE", "RES_DATE").execute()
-    ai_results = ai_results_resp.data or []
-    
-    # Filter by date
-    if selected_month != "All" or selected_year:
-        filtered_results = []
-        for item in ai_results:
-            if item.get('RES_DATE'):
-                try:
-                    result_date = datetime.fromisoformat(item['RES_DATE'].replace('Z', '+00:00'))
-                    if selected_year and result_date.year != selected_year:
-                        continue
-                    if selected_month != "All" and result_date.month != selected_month:
-                        continue
-                    filtered_results.append(item)
-                except (ValueError, TypeError):
-                    continue
-        ai_results = filtered_results
-    
-    # Fetch diagnosis statuses
-    cxr_ids_all = [item['CXR_ID'] for item in ai_results]
-    diagnosis_dict = {}
-    if cxr_ids_all:
-        dx_resp = supabase.table("DIAGNOSIS_Table").select("CXR_ID", "DX_STATUS").in_("CXR_ID", cxr_ids_all).execute()
-        diagnosis_dict = {item['CXR_ID']: item['DX_STATUS'] for item in dx_resp.data or []}
-    
-    # Normalize diagnosis status
-    def normalize_dx_status(dx_status):
-        if not dx_status:
-            return None
-        dx_status = str(dx_status).lower()
-        if "confirmed positive" in dx_status:
-            return "positive"
-        elif "confirmed negative" in dx_status:
-            return "negative"
-        elif dx_status == "pending":
-            return "pending"
-        return None
-    
-    # Calculate metrics
-    tp = tn = fp = fn = 0
-    for item in ai_results:
-        cxr_id = item['CXR_ID']
-        ai_pred = str(item['RES_PRESUMPTIVE']).lower()
-        dx_status = normalize_dx_status(diagnosis_dict.get(cxr_id))
-        
-        if dx_status and dx_status != "pending":
-            if ai_pred == "positive" and dx_status == "positive":
-                tp += 1
-            elif ai_pred == "negative" and dx_status == "negative":
-                tn += 1
-            elif ai_pred == "positive" and dx_status == "negative":
-                fp += 1
-            elif ai_pred == "negative" and dx_status == "positive":
-                fn += 1
-    
-    return {
-        "True Positives (TP)": tp,
-        "True Negatives (TN)": tn,
-        "False Positives (FP)": fp,
-        "False Negatives (FN)": fn,
-        "Total Evaluated": tp + tn + fp + fn
-    }
-
-# Function to fetch the logic for the Confirmed TB Cases Report block
-def fetch_confirmed_cases_data(selected_month=None, selected_year=None):
-    # Fetch all confirmed status entries from RESULT_Table with dates
-    result_resp = supabase.table("RESULT_Table").select("RES_STATUS", "RES_DATE").execute()
-    result_data = result_resp.data or []
-
-    # Filter by month/year
-    if selected_month != "All" or selected_year:
-        filtered_results = []
-        for item in result_data:
-            if item.get('RES_DATE'):
-                try:
-                    result_date = datetime.fromisoformat(item['RES_DATE'].replace('Z', '+00:00'))
-                    if selected_year and result_date.year != selected_year:
-                        continue
-                    if selected_month != "All" and result_date.month != selected_month:
-                        continue
-                    filtered_results.append(item)
-                except (ValueError, TypeError):
-                    continue
-        result_data = filtered_results
-
-    # Normalize statuses
-    statuses = [str(item['RES_STATUS']).strip().title() for item in result_data if item['RES_STATUS']]
-    counter = Counter(statuses)
-
-    positive = counter.get("Confirmed Positive", 0)
-    negative = counter.get("Confirmed Negative", 0)
-    total = positive + negative
-
-    pos_percent = f"{(positive / total) * 100:.0f}%" if total else "0%"
-    neg_percent = f"{(negative / total) * 100:.0f}%" if total else "0%"
-
-    return {
-        "Total Confirmed Cases": f"{total} Confirmed TB Cases",
-        "Positive Cases": f"{positive} {pos_percent} of Total",
-        "Negative Cases": f"{negative} {neg_percent} of Total"
-    }
-
-# Function to fetch detailed confirmed case data for exports
-def fetch_confirmed_case_details(selected_month=None, selected_year=None):
-    # Fetch confirmed results with dates
-    result_resp = supabase.table("RESULT_Table").select("CXR_ID", "RES_STATUS", "RES_DATE").execute()
-    result_data = result_resp.data or []
-    
-    # Filter by date and confirmed status
-    confirmed_results = []
-    for item in result_data:
-        if not item.get('RES_STATUS') or 'confirmed' not in str(item['RES_STATUS']).lower():
-            continue
-        
-        if item.get('RES_DATE'):
-            try:
-                result_date = datetime.fromisoformat(item['RES_DATE'].replace('Z', '+00:00'))
-                if selected_year and result_date.year != selected_year:
-                    continue
-                if selected_month != "All" and result_date.month != selected_month:
-                    continue
-                confirmed_results.append(item)
-            except (ValueError, TypeError):
-                continue
-    
-    if not confirmed_results:
-        return []
-    
-    # Get CXR IDs
-    cxr_ids = [item['CXR_ID'] for item in confirmed_results]
-    
-    # Fetch patient info
-    cxr_resp = supabase.table("CHEST_XRAY_Table").select("CXR_ID", "PT_ID").in_("CXR_ID", cxr_ids).execute()
-    cxr_to_patient = {item['CXR_ID']: item['PT_ID'] for item in cxr_resp.data or []}
-    
-    # Fetch patient details with Age, Sex, and Barangay
-    patient_ids = list(set(cxr_to_patient.values()))
-    patient_details_dict = {}
-    if patient_ids:
-        patient_resp = supabase.table("PATIENT_Table").select("PT_ID", "PT_AGE", "PT_SEX", "PT_BRGY").in_("PT_ID", patient_ids).execute()
-        for patient in patient_resp.data or []:
-            # Normalize sex to 'M' or 'F' to save space
-            raw_sex = str(patient.get('PT_SEX', '')).strip().lower()
-            if raw_sex.startswith('m'):
-                sex_value = 'M'
-            elif raw_sex.startswith('f'):
-                sex_value = 'F'
-            else:
-                sex_value = 'N/A'
+    # Function to count the confirmed cases for the Confirmed TB Cases Report block
+    def confirmed_cases_data(self):
+        status = self.frame["res_status"]
+        confirmed = status[status.str.contains("confirmed", case=False, na=False)]
 
-            patient_details_dict[patient['PT_ID']] = {
-                "age": patient.get('PT_AGE', 'N/A'),
-                "sex": sex_value,
-                "barangay": patient.get('PT_BRGY', 'N/A')
-            }
-    
-    # Fetch diagnosis info (for confirmation method notes)
-    dx_resp = supabase.table("DIAGNOSIS_Table").select("CXR_ID", "DX_NOTES").in_("CXR_ID", cxr_ids).execute()
-    diagnosis_notes = {item['CXR_ID']: item.get('DX_NOTES', 'N/A') for item in dx_resp.data or []}
-    
-    # Fetch AI flagging info
-    ai_resp = supabase.table("RESULT_Table").select("CXR_ID", "RES_PRESUMPTIVE").in_("CXR_ID", cxr_ids).execute()
-    ai_flagged = {item['CXR_ID']: str(item.get('RES_PRESUMPTIVE', '')).lower() == "positive" for item in ai_resp.data or []}
-    
-    # Build detailed case list with additional fields
-    case_details = []
-    for result in confirmed_results:
-        cxr_id = result['CXR_ID']
-        pt_id = cxr_to_patient.get(cxr_id, "Unknown")
-        patient_info = patient_details_dict.get(pt_id, {})
-        
-        # Determine final status
-        status_raw = str(result['RES_STATUS']).lower()
-        if "confirmed positive" in status_raw:
-            final_status = "Confirmed Positive"
-        elif "confirmed negative" in status_raw:
-            final_status = "Confirmed Negative"
-        else:
-            final_status = result['RES_STATUS']
-        
-        # Extract confirmation method from notes
-        notes = diagnosis_notes.get(cxr_id, 'N/A')
-        confirmation_method = "Clinical Assessment"  # Default
-        if notes and notes != 'N/A':
-            # Look for keywords in notes
-            notes_lower = notes.lower()
-            if 'genexpert' in notes_lower or 'xpert' in notes_lower:
-                confirmation_method = "GeneXpert"
-            elif 'smear' in notes_lower:
-                confirmation_method = "Smear Test"
-            elif 'culture' in notes_lower:
-                confirmation_method = "Culture"
-            elif 'x-ray' in notes_lower or 'xray' in notes_lower:
-                confirmation_method = "X-Ray Finding"
-        
-        case_details.append({
-            "Patient ID": pt_id,
-            "Age": patient_info.get('age', 'N/A'),
-            "Sex": patient_info.get('sex', 'N/A'),
-            "Barangay": patient_info.get('barangay', 'N/A'),
-            "Final Status": final_status,
-            "Confirmation Date": result.get('RES_DATE', 'N/A'),
+        # Normalize statuses
+        counter = confirmed.str.strip().str.title().value_counts()
+
+        positive = int(counter.get("Confirmed Positive", 0))
+        negative = int(counter.get("Confirmed Negative", 0))
+        total = positive + negative
+
+        pos_percent = f"{(positive / total) * 100:.0f}%" if total else "0%"
+        neg_percent = f"{(negative / total) * 100:.0f}%" if total else "0%"
+
+        return {
+            "Total Confirmed Cases": f"{total} Confirmed TB Cases",
+            "Positive Cases": f"{positive} {pos_percent} of Total",
+            "Negative Cases": f"{negative} {neg_percent} of Total"
+        }
+
+    # Function to list the confirmed cases for exports
+    def confirmed_case_details(self):
+        frame = self.frame
+        confirmed = frame[frame["res_status"].str.contains("confirmed", case=False, na=False) & frame["res_date"].fillna("").ne("")]
+
+        # Extract confirmation method from the diagnosis notes
+        notes = confirmed["dx_notes"].fillna("").str.lower()
+        confirmation_method = pd.Series("Clinical Assessment", index=confirmed.index, dtype=object)
+        for keywords, method in reversed(CONFIRMATION_METHODS):
+            confirmation_method = confirmation_method.mask(notes.str.contains(keywords, regex=True), method)
+
+        ai_flagged = (confirmed["presumptive"].str.lower() == "positive").fillna(False)
+
+        details = self._patient_columns(confirmed).assign(**{
+            "Final Status": self._final_status(confirmed["res_status"], confirmed["res_status"]),
+            "Confirmation Date": confirmed["res_date"].astype(object),
             "Confirmation Method": confirmation_method,
-            "AI Flagged": "Yes" if ai_flagged.get(cxr_id, False) else "No"
+            "AI Flagged": ai_flagged.map({True: "Yes", False: "No"}).astype(object),
         })
-    
-    return case_details
+        return details.to_dict("records")
 
 
 # --- Export Helper Function Logic + Class ---
@@ -493,7 +237,7 @@ class PDFReport_format(FPDF):
             self.cell(0, 10, full_text, ln=1)
 
 # Function to generate AI Presumptive TB Report PDF
-def generate_ai_pdf(report_title, data, filter_info=None, selected_month=None, selected_year=None):
+def generate_ai_pdf(report_title, data, dataset, filter_info=None):
     pdf = PDFReport_format()
     pdf.add_page()
 
@@ -545,7 +289,7 @@ def generate_ai_pdf(report_title, data, filter_info=None, selected_month=None, s
     pdf.cell(0, 10, "AI Performance Analysis", ln=1)
     pdf.set_font("Arial", "", 10)
 
-    metrics = calculate_ai_performance_metrics(selected_month, selected_year)
+    metrics = dataset.ai_performance_metrics()
     if metrics["Total Evaluated"] > 0:
         explanation = (
             f"The AI accuracy rate is calculated based on {metrics['Total Evaluated']} clinically reviewed outcomes "
@@ -564,7 +308,7 @@ def generate_ai_pdf(report_title, data, filter_info=None, selected_month=None, s
     pdf.ln(5)
 
     # Flagged Patient Details Section
-    patient_details = fetch_flagged_patient_details(selected_month, selected_year)
+    patient_details = dataset.flagged_patient_details()
     if patient_details:
         try:
             patient_details.sort(
@@ -792,7 +536,7 @@ def generate_ai_pdf(report_title, data, filter_info=None, selected_month=None, s
     return bytes(pdf.output(dest='S'))
 
 # Function to generate Confirmed TB Cases Report PDF
-def generate_confirmed_pdf(report_title, data, filter_info=None, selected_month=None, selected_year=None):
+def generate_confirmed_pdf(report_title, data, dataset, filter_info=None):
     pdf = PDFReport_format()
     pdf.add_page()
 
@@ -899,7 +643,7 @@ def generate_confirmed_pdf(report_title, data, filter_info=None, selected_month=
         pdf.ln(10)
 
     # Confirmed Cases Details Section
-    case_details = fetch_confirmed_case_details(selected_month, selected_year)
+    case_details = dataset.confirmed_case_details()
     if case_details:
         try:
             case_details.sort(
@@ -1112,56 +856,99 @@ def generate_confirmed_pdf(report_title, data, filter_info=None, selected_month=
 
     return bytes(pdf.output(dest='S'))
 
-# Function to generate AI Presumptive TB Report Excel
-def generate_ai_excel(report_title, data, filter_info=None, selected_month=None, selected_year=None):
-    wb = Workbook()
-    
-    # --- Worksheet 1: Summary ---
-    ws_summary = wb.active
-    ws_summary.title = "Summary"
+# Named styles of the report workbooks, on top of Excel_Export.BASE_STYLES
+STATUS_FILLS = {
+    "positive": "FF9999", "negative": "99FF99", "pending": "FFE699",
+    "missed": "C896FF", "overcalled": "FFD580", "other": "FFFFFF",
+}
+REPORT_EXCEL_STYLES = {
+    "report title": {"font": Font(bold=True, size=16)},
+    "wrapped note": {"font": Font(italic=True, color="808080"), "alignment": Alignment(horizontal="left", wrap_text=True)},
+    "metrics header": {"font": Font(bold=True), "fill": solid_fill("CCCCCC")},
+    "demographics header": {"font": Font(bold=True), "fill": solid_fill("DDDDDD"), "alignment": Alignment(horizontal="center")},
+    # Detail rows, centred, and summary rows, left-aligned, filled by final status
+    **{f"{status} row": {"fill": solid_fill(color), "alignment": Alignment(horizontal="center")}
+       for status, color in STATUS_FILLS.items()},
+    **{f"{status} summary": {"fill": solid_fill(color), "alignment": Alignment(horizontal="left")}
+       for status, color in STATUS_FILLS.items()},
+}
+
+
+# Function to count the age groups, sexes and barangays of the report details
+def demographic_counts(details):
+    age_groups = {"Children (0-14)": 0, "Youth/Young Adults (15-24)": 0, "Adults (25-64)": 0, "Elderly (65+)": 0}
+    sex_counts = {}
+    barangay_counts = {}
+
+    for detail in details:
+        age = detail.get("Age")
+        if age and str(age).isdigit():
+            a = int(age)
+            if a <= 14: age_groups["Children (0-14)"] += 1
+            elif a <= 24: age_groups["Youth/Young Adults (15-24)"] += 1
+            elif a <= 64: age_groups["Adults (25-64)"] += 1
+            else: age_groups["Elderly (65+)"] += 1
+
+        raw_sex = detail.get("Sex", "Unknown").strip().upper()
+        sex = "Female" if raw_sex == "F" else "Male" if raw_sex == "M" else "Unknown"
+        sex_counts[sex] = sex_counts.get(sex, 0) + 1
+
+        barangay = detail.get("Barangay", "Unknown")
+        barangay_counts[barangay] = barangay_counts.get(barangay, 0) + 1
+
+    return [
+        ("Age Group Distribution", age_groups),
+        ("Sex Distribution", {k: sex_counts.get(k, 0) for k in ["Female", "Male", "Unknown"]}),
+        ("Barangay Distribution", dict(sorted(barangay_counts.items(), key=lambda x: (-x[1], x[0].upper())))),
+    ]
 
-    ws_summary.merge_cells('A1:B1')
-    ws_summary['A1'] = "Mandaue City Health Office"
-    ws_summary['A1'].font = Font(bold=True, size=14)
 
-    ws_summary.merge_cells('A2:B2')
-    ws_summary['A2'] = "S.B. Cabahug, Mandaue City, Philippines."
+# Function to write the demographics sheet: the count tables side by side, with a spacer column between them
+def write_demographics_sheet(book, title, filter_info, span, tables, total):
+    titles, headers, body, styles = [], [], [], []
+    for table_title, counts in tables:
+        start = len(titles)
+        titles += [table_title, None, None, None]
+        headers += ["Category", "Count", "Percentage", None]
+        styles += [None, "center", "center", None]
+        for i, (key, count) in enumerate(counts.items()):
+            if i == len(body):
+                body.append([])
+            body[i] += [None] * (start - len(body[i])) + [key, count, f"{(count/total*100):.1f}%"]
+
+    # Widths are fitted to the headers and counts (not the table titles) before any row is written
+    ws = book.sheet(title, fitted_widths([headers] + body))
+    ws.append([title], "title", merge=span)
+    if filter_info:
+        ws.append([filter_info], "italic", merge=span)
+    else:
+        ws.append()
+    ws.append()
+    ws.append(titles, "subtitle")
+    ws.append(headers, "demographics header")
+    for row in body:
+        ws.append(row, styles)
 
-    ws_summary.merge_cells('A3:B3')
-    ws_summary['A3'] = "Call us on: +63 (032) 230 4500 | FB: Mandaue City Public Affairs Office | Email: cmo@mandauecity.gov.ph"
 
-    ws_summary.merge_cells('A5:B5')
-    ws_summary['A5'] = "DeteXTB: AI-Assisted Presumptive Tuberculosis Detection and Mapping System"
-    ws_summary['A5'].font = Font(bold=True, size=12)
+# Function to generate AI Presumptive TB Report Excel
+def generate_ai_excel(report_title, data, dataset, filter_info=None):
+    book = ExcelExport(REPORT_EXCEL_STYLES)
 
-    ws_summary.merge_cells('A7:B7')
-    ws_summary['A7'] = report_title
-    ws_summary['A7'].font = Font(bold=True, size=16)
+    # --- Worksheet 1: Summary ---
+    ws_summary = book.sheet("Summary", [25, 65])
+    ws_summary.letterhead(span=2)
+    ws_summary.append([report_title], "report title", merge=2)
+    ws_summary.append()
 
-    row_start = 9
     if filter_info:
-        ws_summary.merge_cells(f'A{row_start}:B{row_start}')
-        ws_summary[f'A{row_start}'] = filter_info
-        ws_summary[f'A{row_start}'].font = Font(italic=True)
-        row_start += 2
-
-    ws_summary[f'A{row_start}'] = "Summary"
-    ws_summary[f'A{row_start}'].font = Font(bold=True)
+        ws_summary.append([filter_info], "italic", merge=2)
+        ws_summary.append()
 
-    colors = {"Pending": "FFE699", "Positive": "FF9999", "Negative": "99FF99"}
+    ws_summary.append(["Summary"], "bold")
 
-    row = row_start + 1
     for key, value in data.items():
-        ws_summary[f"A{row}"] = key
-        ws_summary[f"B{row}"] = value
-        ws_summary[f"B{row}"].alignment = Alignment(horizontal="left")
-        for status, color_code in colors.items():
-            if status in key:
-                fill = PatternFill(start_color=color_code, end_color=color_code, fill_type="solid")
-                ws_summary[f"A{row}"].fill = fill
-                ws_summary[f"B{row}"].fill = fill
-                break
-        row += 1
+        status = next((status for status in ("Pending", "Positive", "Negative") if status in key), None)
+        ws_summary.append([key, value], f"{status.lower()} summary" if status else [None, "left"])
 
     # Disclaimer
     disclaimer_text = (
@@ -1171,46 +958,29 @@ def generate_ai_excel(report_title, data, filter_info=None, selected_month=None,
     )
 
     import textwrap
-    wrapped_lines = textwrap.wrap(disclaimer_text, width=100)
-    for i, line in enumerate(wrapped_lines):
-        curr_row = row + 2 + i
-        ws_summary.merge_cells(f'A{curr_row}:B{curr_row}')
-        ws_summary[f'A{curr_row}'] = line
-        ws_summary[f'A{curr_row}'].font = Font(italic=True, color="808080")
+    ws_summary.append()
+    ws_summary.append()
+    for line in textwrap.wrap(disclaimer_text, width=100):
+        ws_summary.append([line], "note", merge=2)
 
-    timestamp_row = row + 2 + len(wrapped_lines) + 2
-    ws_summary.merge_cells(f'A{timestamp_row}:B{timestamp_row}')
-    ws_summary[f"A{timestamp_row}"] = f"Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    ws_summary[f"A{timestamp_row}"].font = Font(italic=True)
-
-    ws_summary.column_dimensions['A'].width = 25
-    ws_summary.column_dimensions['B'].width = 65
+    ws_summary.append()
+    ws_summary.append()
+    ws_summary.append([f"Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"], "italic", merge=2)
 
     # --- Worksheet 2: Flagged Patients Log ---
-    ws_patients = wb.create_sheet(title="Flagged Patients Log")
-    ws_patients['A1'] = "Flagged Patients Log"
-    ws_patients['A1'].font = Font(bold=True, size=14)
-    ws_patients.merge_cells('A1:K1')
+    ws_patients = book.sheet("Flagged Patients Log", [6, 30, 8, 8, 20, 3, 15, 18, 3, 20, 18])
+    ws_patients.append(["Flagged Patients Log"], "title", merge=11)
 
     if filter_info:
-        ws_patients['A2'] = filter_info
-        ws_patients['A2'].font = Font(italic=True)
-        ws_patients.merge_cells('A2:K2')
-        header_row = 4
-    else:
-        header_row = 3
+        ws_patients.append([filter_info], "italic", merge=11)
+    ws_patients.append()
 
-    headers = ["#", "Patient ID", "Age", "Sex", "Barangay", "", "AI Flagged Date", "AI Confidence Level", "", "Final Status", "Confirmation Date"]
-    for col_idx, header in enumerate(headers, start=1):
-        cell = ws_patients.cell(row=header_row, column=col_idx)
-        cell.value = header
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal="center")
-        if header.strip() != "":
-            cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    # Blank headers are the spacer columns
+    headers = ["#", "Patient ID", "Age", "Sex", "Barangay", None, "AI Flagged Date", "AI Confidence Level", None, "Final Status", "Confirmation Date"]
+    ws_patients.append(headers, "header")
 
     # Fetch patient data
-    patient_details = fetch_flagged_patient_details(selected_month, selected_year)
+    patient_details = dataset.flagged_patient_details()
     try:
         patient_details.sort(
             key=lambda x: (
@@ -1222,8 +992,7 @@ def generate_ai_excel(report_title, data, filter_info=None, selected_month=None,
     except Exception as e:
         print("Sorting error (AI Excel):", e)
 
-    # Data rows
-    data_row = header_row + 1
+    # Data rows, each filled by its final status
     for i, patient in enumerate(patient_details, start=1):
         ai_date = patient.get("AI Flagged Date")
         if ai_date:
@@ -1241,179 +1010,48 @@ def generate_ai_excel(report_title, data, filter_info=None, selected_month=None,
             i, patient["Patient ID"], patient["Age"], patient["Sex"], patient["Barangay"],
             None, ai_date, confidence, None, patient["Final Status"], confirmation_date
         ]
-        fill_color = ("FF9999" if "Positive" in patient["Final Status"] else
-                      "99FF99" if "Negative" in patient["Final Status"] else "FFE699")
-
-        for col_idx, value in enumerate(row_values, start=1):
-            ws_patients.cell(row=data_row, column=col_idx, value=value)
-            ws_patients.cell(row=data_row, column=col_idx).alignment = Alignment(horizontal="center")
-            if value is not None:
-                ws_patients.cell(row=data_row, column=col_idx).fill = PatternFill(
-                    start_color=fill_color, end_color=fill_color, fill_type="solid"
-                )
-        data_row += 1
-
-    # Column widths
-    widths = [6, 30, 8, 8, 20, 3, 15, 18, 3, 20, 18]
-    for idx, width in enumerate(widths, start=1):
-        ws_patients.column_dimensions[chr(64 + idx)].width = width
+        status = ("positive" if "Positive" in patient["Final Status"] else
+                  "negative" if "Negative" in patient["Final Status"] else "pending")
+        ws_patients.append(row_values, f"{status} row")
 
     # --- Worksheet 3: Flagged Patients Demographics ---
     if patient_details:
-        age_groups = {"Children (0-14)": 0, "Youth/Young Adults (15-24)": 0, "Adults (25-64)": 0, "Elderly (65+)": 0}
-        sex_counts = {}
-        barangay_counts = {}
-
-        # Populate counts
-        for patient in patient_details:
-            age = patient.get("Age")
-            if age and str(age).isdigit():
-                a = int(age)
-                if a <= 14: age_groups["Children (0-14)"] += 1
-                elif a <= 24: age_groups["Youth/Young Adults (15-24)"] += 1
-                elif a <= 64: age_groups["Adults (25-64)"] += 1
-                else: age_groups["Elderly (65+)"] += 1
-
-            raw_sex = patient.get("Sex", "Unknown").strip().upper()
-            sex = "Female" if raw_sex == "F" else "Male" if raw_sex == "M" else "Unknown"
-            sex_counts[sex] = sex_counts.get(sex, 0) + 1
-
-            barangay = patient.get("Barangay", "Unknown")
-            barangay_counts[barangay] = barangay_counts.get(barangay, 0) + 1
-
-        total_patients = len(patient_details)
-        ws_demo = wb.create_sheet(title="Flagged Patients Demographics")
-
-        ws_demo['A1'] = "Flagged Patients Demographics"
-        ws_demo['A1'].font = Font(bold=True, size=14)
-        ws_demo.merge_cells('A1:K1')
-
-        if filter_info:
-            ws_demo['A2'] = filter_info
-            ws_demo['A2'].font = Font(italic=True)
-            ws_demo.merge_cells('A2:K2')
-
-        starting_row = 4
-
-        # Function to write horizontal tables
-        def write_demo_table_horizontal(ws, title, data_dict, start_col, total, start_row):
-            ws.cell(row=start_row, column=start_col, value=title).font = Font(bold=True, size=12)
-            headers = ["Category", "Count", "Percentage"]
-            for i, header in enumerate(headers):
-                cell = ws.cell(row=start_row+1, column=start_col+i, value=header)
-                cell.font = Font(bold=True)
-                cell.fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-                cell.alignment = Alignment(horizontal="center")
-
-            row = start_row + 2
-            for key, count in data_dict.items():
-                ws.cell(row=row, column=start_col, value=key)
-                ws.cell(row=row, column=start_col+1, value=count).alignment = Alignment(horizontal="center")
-                ws.cell(row=row, column=start_col+2, value=f"{(count/total*100):.1f}%").alignment = Alignment(horizontal="center")
-                row += 1
-
-            # Column widths
-            for col_idx in range(start_col, start_col + len(headers)):
-                max_length = 0
-                for r in range(start_row+1, row):
-                    cell_val = ws.cell(row=r, column=col_idx).value
-                    if cell_val is not None:
-                        max_length = max(max_length, len(str(cell_val)))
-                ws.column_dimensions[chr(64 + col_idx)].width = max_length + 5
-
-            return start_col + len(headers) + 1
-
-        # Write tables horizontally
-        col = 1
-        col = write_demo_table_horizontal(ws_demo, "Age Group Distribution", age_groups, col, total_patients, starting_row)
-        sex_ordered = {k: sex_counts.get(k, 0) for k in ["Female", "Male", "Unknown"]}
-        col = write_demo_table_horizontal(ws_demo, "Sex Distribution", sex_ordered, col, total_patients, starting_row)
-        sorted_barangays = dict(sorted(barangay_counts.items(), key=lambda x: (-x[1], x[0].upper())))
-        col = write_demo_table_horizontal(ws_demo, "Barangay Distribution", sorted_barangays, col, total_patients, starting_row)
+        write_demographics_sheet(book, "Flagged Patients Demographics", filter_info, 11,
+                                 demographic_counts(patient_details), len(patient_details))
 
     # --- Worksheet 4: AI Performance Metrics ---
-    ws_metrics = wb.create_sheet(title="AI Performance Metrics")
-    
-    ws_metrics['A1'] = "AI Performance Metrics"
-    ws_metrics['A1'].font = Font(bold=True, size=14)
-    ws_metrics.merge_cells('A1:B1')
-    
+    ws_metrics = book.sheet("AI Performance Metrics", [30, 10])
+    ws_metrics.append(["AI Performance Metrics"], "title", merge=2)
+
     if filter_info:
-        ws_metrics['A2'] = filter_info
-        ws_metrics['A2'].font = Font(italic=True)
-        ws_metrics.merge_cells('A2:B2')
-        metrics_start_row = 4
-    else:
-        metrics_start_row = 3
-    
+        ws_metrics.append([filter_info], "italic", merge=2)
+    ws_metrics.append()
+
     # Performance metrics data
-    metrics = calculate_ai_performance_metrics(selected_month, selected_year)
-    
-    ws_metrics[f'A{metrics_start_row}'] = "Metric"
-    ws_metrics[f'B{metrics_start_row}'] = "Count"
-    ws_metrics[f'A{metrics_start_row}'].font = Font(bold=True)
-    ws_metrics[f'B{metrics_start_row}'].font = Font(bold=True)
-    ws_metrics[f'A{metrics_start_row}'].fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-    ws_metrics[f'B{metrics_start_row}'].fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-    
-    metrics_row = metrics_start_row + 1
-    for metric_name, metric_value in metrics.items():
-        ws_metrics[f'A{metrics_row}'] = metric_name
-        ws_metrics[f'B{metrics_row}'] = metric_value
-        ws_metrics[f'B{metrics_row}'].alignment = Alignment(horizontal="left")
-        metrics_row += 1
-    
-    ws_metrics.column_dimensions['A'].width = 30
-    ws_metrics.column_dimensions['B'].width = 10
+    ws_metrics.append(["Metric", "Count"], "metrics header")
+    for metric_name, metric_value in dataset.ai_performance_metrics().items():
+        ws_metrics.append([metric_name, metric_value], [None, "left"])
 
-    # Save to BytesIO
-    stream = io.BytesIO()
-    wb.save(stream)
-    stream.seek(0)
-    return stream.read()
+    return book.to_bytes()
 
 # Function to generate Confirmed TB Cases Report Excel
-def generate_confirmed_excel(report_title, data, filter_info=None, selected_month=None, selected_year=None):
-    wb = Workbook()
+def generate_confirmed_excel(report_title, data, dataset, filter_info=None):
+    book = ExcelExport(REPORT_EXCEL_STYLES)
 
     # --- Worksheet 1: Summary ---
-    ws_summary = wb.active
-    ws_summary.title = "Summary"
+    ws_summary = book.sheet("Summary", [20, 20, 20, 30])
 
     # Header
-    ws_summary.merge_cells('A1:D1')
-    ws_summary['A1'] = "Mandaue City Health Office"
-    ws_summary['A1'].font = Font(bold=True, size=14)
-
-    ws_summary.merge_cells('A2:D2')
-    ws_summary['A2'] = "S.B. Cabahug, Mandaue City, Philippines."
-
-    ws_summary.merge_cells('A3:D3')
-    ws_summary['A3'] = "Call us on: +63 (032) 230 4500 | FB: Mandaue City Public Affairs Office | Email: cmo@mandauecity.gov.ph"
-
-    ws_summary.merge_cells('A5:D5')
-    ws_summary['A5'] = "DeteXTB: AI-Assisted Presumptive Tuberculosis Detection and Mapping System"
-    ws_summary['A5'].font = Font(bold=True, size=12)
+    ws_summary.letterhead(span=4)
+    ws_summary.append([report_title], "report title", merge=4)
+    ws_summary.append()
 
-    ws_summary.merge_cells('A7:D7')
-    ws_summary['A7'] = report_title
-    ws_summary['A7'].font = Font(bold=True, size=16)
-
-    row_start = 9
     if filter_info:
-        ws_summary.merge_cells(f'A{row_start}:D{row_start}')
-        ws_summary[f'A{row_start}'] = filter_info
-        ws_summary[f'A{row_start}'].font = Font(italic=True)
-        row_start += 2
+        ws_summary.append([filter_info], "italic", merge=4)
+        ws_summary.append()
 
     # Summary table headers
-    headers = ["Total Confirmed", "Total Positive", "Total Negative"]
-    for col_idx, header in enumerate(headers, start=1):
-        cell = ws_summary.cell(row=row_start, column=col_idx)
-        cell.value = header
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center")
+    ws_summary.append(["Total Confirmed", "Total Positive", "Total Negative"], "header")
 
     # Extract counts
     import re
@@ -1436,24 +1074,11 @@ def generate_confirmed_excel(report_title, data, filter_info=None, selected_mont
     positive_display = f"{positive_count} ({pos_percent})"
     negative_display = f"{negative_count} ({neg_percent})"
 
-    data_row = row_start + 1
-    ws_summary[f'A{data_row}'] = total_count
-    ws_summary[f'B{data_row}'] = positive_display
-    ws_summary[f'C{data_row}'] = negative_display
-
     # Color fill
-    if positive_count > 0:
-        ws_summary[f'B{data_row}'].fill = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
-    if negative_count > 0:
-        ws_summary[f'C{data_row}'].fill = PatternFill(start_color="99FF99", end_color="99FF99", fill_type="solid")
-
-    for col in ['A', 'B', 'C', 'D']:
-        ws_summary[f'{col}{data_row}'].alignment = Alignment(horizontal="center")
-
-    ws_summary.column_dimensions['A'].width = 20
-    ws_summary.column_dimensions['B'].width = 20
-    ws_summary.column_dimensions['C'].width = 20
-    ws_summary.column_dimensions['D'].width = 30
+    ws_summary.append(
+        [total_count, positive_display, negative_display],
+        ["center", "positive row" if positive_count > 0 else "center", "negative row" if negative_count > 0 else "center"]
+    )
 
     # Disclaimer
     disclaimer_lines = [
@@ -1461,43 +1086,29 @@ def generate_confirmed_excel(report_title, data, filter_info=None, selected_mont
         "and statistical purposes only. Clinical decisions should always be based on professional medical evaluation."
     ]
 
-    for i, line in enumerate(disclaimer_lines):
-        curr_row = data_row + 3 + i
-        ws_summary.merge_cells(f'A{curr_row}:D{curr_row}')
-        ws_summary[f'A{curr_row}'] = line
-        ws_summary[f'A{curr_row}'].font = Font(italic=True, color="808080")
-        ws_summary[f'A{curr_row}'].alignment = Alignment(horizontal="left", wrap_text=True)
+    ws_summary.append()
+    ws_summary.append()
+    for line in disclaimer_lines:
+        ws_summary.append([line], "wrapped note", merge=4)
 
-    timestamp_row = data_row + 3 + len(disclaimer_lines) + 2
-    ws_summary.merge_cells(f'A{timestamp_row}:D{timestamp_row}')
-    ws_summary[f"A{timestamp_row}"] = f"Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    ws_summary[f"A{timestamp_row}"].font = Font(italic=True)
+    ws_summary.append()
+    ws_summary.append()
+    ws_summary.append([f"Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"], "italic", merge=4)
 
     # --- Worksheet 2: Confirmed Cases Details ---
-    ws_register = wb.create_sheet(title="Confirmed Cases Details")
-    ws_register['A1'] = "Confirmed Cases Details"
-    ws_register['A1'].font = Font(bold=True, size=14)
-    ws_register.merge_cells('A1:L1')
+    ws_register = book.sheet("Confirmed Cases Details", [6, 30, 8, 8, 20, 3, 22, 20, 22, 3, 18])
+    ws_register.append(["Confirmed Cases Details"], "title", merge=12)
 
     if filter_info:
-        ws_register['A2'] = filter_info
-        ws_register['A2'].font = Font(italic=True)
-        ws_register.merge_cells('A2:L2')
-        header_row = 4
-    else:
-        header_row = 3
+        ws_register.append([filter_info], "italic", merge=12)
+    ws_register.append()
 
-    headers = ["#", "Patient ID", "Age", "Sex", "Barangay", "", "Final Status", "Confirmation Date", "Confirmation Method", "", "AI Flagged"]
-    for col_idx, header in enumerate(headers, start=1):
-        cell = ws_register.cell(row=header_row, column=col_idx)
-        cell.value = header
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal="center")
-        if header.strip() != "":
-            cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    # Blank headers are the spacer columns
+    headers = ["#", "Patient ID", "Age", "Sex", "Barangay", None, "Final Status", "Confirmation Date", "Confirmation Method", None, "AI Flagged"]
+    ws_register.append(headers, "header")
 
     # Fetch and sort case details
-    case_details = fetch_confirmed_case_details(selected_month, selected_year) or []
+    case_details = dataset.confirmed_case_details()
 
     try:
         case_details.sort(
@@ -1512,7 +1123,6 @@ def generate_confirmed_excel(report_title, data, filter_info=None, selected_mont
         print("Sorting error (Excel Confirmed Cases):", e)
 
     # Write main table data
-    data_row = header_row + 1
     for i, case in enumerate(case_details, start=1):
         confirmation_date = case.get("Confirmation Date", "")
         if "T" in confirmation_date:
@@ -1520,111 +1130,33 @@ def generate_confirmed_excel(report_title, data, filter_info=None, selected_mont
 
         # None is spacer
         row_values = [
-            i, case.get("Patient ID"), case.get("Age"), case.get("Sex"), case.get("Barangay"), None, 
-            case.get("Final Status"), confirmation_date, 
-            case.get("Confirmation Method"), None, 
+            i, case.get("Patient ID"), case.get("Age"), case.get("Sex"), case.get("Barangay"), None,
+            case.get("Final Status"), confirmation_date,
+            case.get("Confirmation Method"), None,
             case.get("AI Flagged")
         ]
 
+        # Purple: AI missed a positive, amber: AI flagged a negative
         status = str(case.get("Final Status", "")).lower()
         ai_flagged = str(case.get("AI Flagged", "")).lower()
         if "positive" in status and "negative" in ai_flagged:
-            fill_color = "C896FF"
+            fill = "missed"
         elif "negative" in status and "positive" in ai_flagged:
-            fill_color = "FFD580"
+            fill = "overcalled"
         elif "positive" in status:
-            fill_color = "FF9999"
+            fill = "positive"
         elif "negative" in status:
-            fill_color = "99FF99"
+            fill = "negative"
         else:
-            fill_color = "FFFFFF"
-
-        for col_idx, value in enumerate(row_values, start=1):
-            cell = ws_register.cell(row=data_row, column=col_idx, value=value)
-            cell.alignment = Alignment(horizontal="center")
-            if value is not None:
-                cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
-
-        data_row += 1
-
-    column_widths = [6, 30, 8, 8, 20, 3, 22, 20, 22, 3, 18]
-    for col_idx, width in enumerate(column_widths, start=1):
-        ws_register.column_dimensions[chr(64 + col_idx)].width = width
+            fill = "other"
+        ws_register.append(row_values, f"{fill} row")
 
     # --- Worksheet 3: Confirmed Cases Demographics ---
     if case_details:
-        age_groups = {"Children (0-14)": 0, "Youth/Young Adults (15-24)": 0, "Adults (25-64)": 0, "Elderly (65+)": 0}
-        sex_counts = {}
-        barangay_counts = {}
+        write_demographics_sheet(book, "Confirmed Cases Demographics", filter_info, 12,
+                                 demographic_counts(case_details), len(case_details))
 
-        for case in case_details:
-            age = case.get("Age")
-            if age and str(age).isdigit():
-                age_int = int(age)
-                if age_int <= 14: age_groups["Children (0-14)"] += 1
-                elif age_int <= 24: age_groups["Youth/Young Adults (15-24)"] += 1
-                elif age_int <= 64: age_groups["Adults (25-64)"] += 1
-                else: age_groups["Elderly (65+)"] += 1
-
-            raw_sex = case.get("Sex", "Unknown").strip().upper()
-            sex = "Female" if raw_sex == "F" else "Male" if raw_sex == "M" else "Unknown"
-            sex_counts[sex] = sex_counts.get(sex, 0) + 1
-
-            barangay = case.get("Barangay", "Unknown")
-            barangay_counts[barangay] = barangay_counts.get(barangay, 0) + 1
-
-        total_cases = len(case_details)
-        ws_demo = wb.create_sheet(title="Confirmed Cases Demographics")
-        ws_demo['A1'] = "Confirmed Cases Demographics"
-        ws_demo['A1'].font = Font(bold=True, size=14)
-        ws_demo.merge_cells('A1:L1')
-
-        if filter_info:
-            ws_demo['A2'] = filter_info
-            ws_demo['A2'].font = Font(italic=True)
-            ws_demo.merge_cells('A2:L2')
-
-        starting_row = 4 
-
-        def write_demo_table_horizontal(ws, title, data_dict, start_col, total, start_row):
-            ws.cell(row=start_row, column=start_col, value=title).font = Font(bold=True, size=12)
-            headers = ["Category", "Count", "Percentage"]
-            for i, header in enumerate(headers):
-                cell = ws.cell(row=start_row+1, column=start_col+i, value=header)
-                cell.font = Font(bold=True)
-                cell.fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-                cell.alignment = Alignment(horizontal="center")
-
-            row = start_row + 2
-            for key, count in data_dict.items():
-                ws.cell(row=row, column=start_col, value=key)
-                ws.cell(row=row, column=start_col+1, value=count).alignment = Alignment(horizontal="center")
-                ws.cell(row=row, column=start_col+2, value=f"{(count/total*100):.1f}%").alignment = Alignment(horizontal="center")
-                row += 1
-
-            for col_idx in range(start_col, start_col + len(headers)):
-                max_length = 0
-                for r in range(start_row+1, row):
-                    cell_val = ws.cell(row=r, column=col_idx).value
-                    if cell_val is not None:
-                        max_length = max(max_length, len(str(cell_val)))
-                ws.column_dimensions[chr(64 + col_idx)].width = max_length + 5
-
-            return start_col + len(headers) + 1
-
-        # Write tables horizontally
-        col = 1
-        col = write_demo_table_horizontal(ws_demo, "Age Group Distribution", age_groups, col, total_cases, starting_row)
-        sex_ordered = {k: sex_counts.get(k, 0) for k in ["Female", "Male", "Unknown"]}
-        col = write_demo_table_horizontal(ws_demo, "Sex Distribution", sex_ordered, col, total_cases, starting_row)
-        sorted_barangays = dict(sorted(barangay_counts.items(), key=lambda x: (-x[1], x[0].upper())))
-        col = write_demo_table_horizontal(ws_demo, "Barangay Distribution", sorted_barangays, col, total_cases, starting_row)
-
-    # Save to BytesIO
-    stream = io.BytesIO()
-    wb.save(stream)
-    stream.seek(0)
-    return stream.read()
+    return book.to_bytes()
 
 
 # Function to format filter information for reports
@@ -1936,8 +1468,9 @@ def Reports(is_light=True):
     selected_month_presumptive = st.session_state["report_filters_presumptive"]["selected_month_presumptive"]
     selected_year_presumptive = st.session_state["report_filters_presumptive"]["selected_year_presumptive"]
 
-    # Fetch AI report data with filters
-    ai_report_data = fetch_ai_report_data(selected_month_presumptive, selected_year_presumptive)
+    # Fetch the AI report dataset once for the cards and both exports
+    ai_dataset = ReportDataset.build(selected_month_presumptive, selected_year_presumptive)
+    ai_report_data = ai_dataset.ai_report_data()
 
     # Show AI report metrics as styled cards
     st.markdown(f"""
@@ -1960,12 +1493,9 @@ def Reports(is_light=True):
         </div>
     """, unsafe_allow_html=True)
 
-    # Generate PDF/Excel bytes for AI report (using enhanced functions)
+    # Generate PDF bytes for AI report (using enhanced functions); the Excel file is built on request
     filter_info = format_filter_info(selected_month_presumptive, selected_year_presumptive)
-    ai_pdf_bytes = generate_ai_pdf("AI Presumptive TB Report", ai_report_data, filter_info, 
-                                    selected_month_presumptive, selected_year_presumptive)
-    ai_excel_bytes = generate_ai_excel("AI Presumptive TB Report", ai_report_data, filter_info,
-                                        selected_month_presumptive, selected_year_presumptive)
+    ai_pdf_bytes = generate_ai_pdf("AI Presumptive TB Report", ai_report_data, ai_dataset, filter_info)
 
     st.markdown('<div style="height:25px;"></div>', unsafe_allow_html=True)
 
@@ -1974,7 +1504,13 @@ def Reports(is_light=True):
     with col_export_pdf:
         st.download_button("Export PDF", data=ai_pdf_bytes, file_name=f"AI_Presumptive_TB_Report_{today_str}.pdf", mime="application/pdf")
     with col_export_excel:
-        st.download_button("Export Excel", data=ai_excel_bytes, file_name=f"AI_Presumptive_TB_Report_{today_str}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        export_button(
+            "Export Excel",
+            lambda: generate_ai_excel("AI Presumptive TB Report", ai_report_data, ai_dataset, filter_info),
+            file_name=f"AI_Presumptive_TB_Report_{today_str}.xlsx",
+            key="ai_report_excel",
+            source=(filter_info, ai_dataset.fingerprint),
+        )
 
 
     st.markdown('<div style="height:35px;"></div>', unsafe_allow_html=True)
@@ -2042,8 +1578,12 @@ def Reports(is_light=True):
     selected_month_confirmed = st.session_state["report_filters_confirmed"]["selected_month_confirmed"]
     selected_year_confirmed = st.session_state["report_filters_confirmed"]["selected_year_confirmed"]
 
-    # Fetch confirmed TB cases data with filters
-    confirmed_cases_data = fetch_confirmed_cases_data(selected_month_confirmed, selected_year_confirmed)
+    # Fetch the confirmed TB cases dataset, reusing the AI report's when both filters match
+    if (selected_month_confirmed, selected_year_confirmed) == (selected_month_presumptive, selected_year_presumptive):
+        confirmed_dataset = ai_dataset
+    else:
+        confirmed_dataset = ReportDataset.build(selected_month_confirmed, selected_year_confirmed)
+    confirmed_cases_data = confirmed_dataset.confirmed_cases_data()
 
     # Show Confirmed cases as styled cards
     st.markdown(f"""
@@ -2066,12 +1606,9 @@ def Reports(is_light=True):
         </div>
     """, unsafe_allow_html=True)
 
-    # Generate PDF/Excel bytes for Confirmed TB Cases report (using enhanced functions)
+    # Generate PDF bytes for Confirmed TB Cases report (using enhanced functions); the Excel file is built on request
     filter_info = format_filter_info(selected_month_confirmed, selected_year_confirmed)
-    cases_pdf = generate_confirmed_pdf("Confirmed TB Cases Report", confirmed_cases_data, filter_info,
-                                        selected_month_confirmed, selected_year_confirmed)
-    cases_excel_bytes = generate_confirmed_excel("Confirmed TB Cases Report", confirmed_cases_data, filter_info,
-                                                  selected_month_confirmed, selected_year_confirmed)
+    cases_pdf = generate_confirmed_pdf("Confirmed TB Cases Report", confirmed_cases_data, confirmed_dataset, filter_info)
 
     st.markdown('<div style="height:25px;"></div>', unsafe_allow_html=True)
 
@@ -2080,4 +1617,10 @@ def Reports(is_light=True):
     with col_export_pdf:
         st.download_button("Export PDF", data=cases_pdf, file_name=f"Confirmed_TB_Cases_Report_{today_str}.pdf", mime="application/pdf")
     with col_export_excel:
-        st.download_button("Export Excel", data=cases_excel_bytes, file_name=f"Confirmed_TB_Cases_Report_{today_str}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
\ No newline at end of file
+        export_button(
+            "Export Excel",
+            lambda: generate_confirmed_excel("Confirmed TB Cases Report", confirmed_cases_data, confirmed_dataset, filter_info),
+            file_name=f"Confirmed_TB_Cases_Report_{today_str}.xlsx",
+            key="confirmed_report_excel",
+            source=(filter_info, confirmed_dataset.fingerprint),
+        )
\ No newline at end of file
@@ -0,0 +1,404 @@
+# Bulk_Screening.py
+
+import streamlit as st
+import io
+import os
+import re
+import time
+import zipfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from PIL import Image
+from Supabase import supabase, SUPABASE_URL
+from Repository import fetch_patient_names, invalidate_tables
+from Inference import classify_batch
+from Xray import IMG_SIZE, preprocess_xray, assess_xray
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# Images are validated and classified this many at a time so only one
+# chunk of 512x512 tensors is held in memory during a screening run
+BULK_BATCH_SIZE = int(os.getenv("DETEXTB_BULK_BATCH_SIZE", "16"))
+BULK_WORKERS = int(os.getenv("DETEXTB_BULK_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# File names such as "PT-2025-0612-093015.png" are mapped to that patient automatically
+PT_ID_PATTERN = re.compile(r"PT-\d{4}-\d{4}-\d{6}")
+
+UNMAPPED = "— Not mapped —"
+
+
+def is_image_member(member):
+    """Whether a ZIP entry is an X-ray to screen: an image file that is not a directory or a macOS resource fork."""
+    if member.is_dir() or not member.filename.lower().endswith(IMAGE_EXTENSIONS):
+        return False
+    return not os.path.basename(member.filename).startswith(".")
+
+
+def iter_uploaded_images(uploaded_files):
+    """Yield (name, bytes) for every image upload and every image inside an uploaded ZIP, one at a time."""
+    for uploaded in uploaded_files:
+        if uploaded.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(uploaded) as archive:
+                for member in archive.infolist():
+                    if is_image_member(member):
+                        yield member.filename, archive.read(member)
+        elif uploaded.name.lower().endswith(IMAGE_EXTENSIONS):
+            yield uploaded.name, uploaded.getvalue()
+
+
+def count_uploaded_images(uploaded_files):
+    total = 0
+    for uploaded in uploaded_files:
+        if uploaded.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(uploaded) as archive:
+                total += sum(1 for member in archive.infolist() if is_image_member(member))
+            uploaded.seek(0)
+        elif uploaded.name.lower().endswith(IMAGE_EXTENSIONS):
+            total += 1
+    return total
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def check_image(named_image, out):
+    """Decode one upload, run both X-ray plausibility checks and preprocess it into `out` for the model."""
+    name, data = named_image
+    try:
+        verdict = assess_xray(Image.open(io.BytesIO(data)))
+        if verdict["strict"]:
+            xray_check = "Valid"
+        elif verdict["relaxed"]:
+            xray_check = "Deviates"
+        else:
+            xray_check = "Rejected"
+        xray_array = preprocess_xray(io.BytesIO(data), out) if xray_check != "Rejected" else None
+    except Exception:
+        xray_check, xray_array = "Unreadable", None
+
+    return {"name": name, "bytes": data, "xray_check": xray_check, "xray_array": xray_array}
+
+
+def screen_images(named_images, on_progress=None):
+    """Validate in parallel and classify in batches; returns one row per image without tensors."""
+    rows = []
+    # One preallocated batch buffer is reused for every chunk; each image is resized into its own slot
+    batch_buffer = np.empty((BULK_BATCH_SIZE, IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=BULK_WORKERS) as pool:
+        for chunk in chunked(named_images, BULK_BATCH_SIZE):
+            checked = list(pool.map(check_image, chunk, [batch_buffer[i:i + 1] for i in range(len(chunk))]))
+            analyzable = [item for item in checked if item["xray_array"] is not None]
+            results = classify_batch([item["xray_array"] for item in analyzable], batch_size=BULK_BATCH_SIZE)
+            for item, (label, confidence) in zip(analyzable, results):
+                item["label"], item["confidence"] = label, confidence
+
+            for item in checked:
+                pt_match = PT_ID_PATTERN.search(os.path.basename(item["name"]))
+                rows.append({
+                    "name": item["name"],
+                    "bytes": item["bytes"],
+                    "xray_check": item["xray_check"],
+                    "label": item.get("label", ""),
+                    "confidence": item.get("confidence"),
+                    "pt_id": pt_match.group(0) if pt_match else None,
+                })
+
+            if on_progress:
+                on_progress(len(rows))
+    return rows
+
+
+def fetch_patient_options():
+    options = {}
+    for patient in fetch_patient_names():
+        full_name = f"{patient.fname} {patient.mname or ''} {patient.lname}".split()
+        options[patient.pt_id] = {
+            "label": f"{patient.pt_id} — {' '.join(full_name)}",
+            "storage_name": "_".join(full_name).upper(),
+        }
+    return options
+
+
+def save_bulk_results(rows, patients, user_id):
+    """
+        Upload the mapped X-rays, then write CHEST_XRAY_Table and RESULT_Table
+        rows in one insert each. If any step fails, the uploads and X-ray rows
+        already written are removed again before the error is re-raised.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    cxr_rows = []
+    row_by_path = {}
+    uploaded_paths = []
+    cxr_ids = []
+
+    try:
+        for index, row in enumerate(rows):
+            storage_path = f"patient_{row['pt_id']}/{patients[row['pt_id']]['storage_name']}_{timestamp}_{index + 1}.png"
+            supabase.storage.from_("xray-uploads").upload(
+                storage_path,
+                row["bytes"],
+                {"content-type": "image/png"}
+            )
+            uploaded_paths.append(storage_path)
+            public_url = f"{SUPABASE_URL}/storage/v1/object/public/xray-uploads/{storage_path}"
+            row_by_path[public_url] = row
+            cxr_rows.append({
+                "CXR_FILE_PATH": public_url,
+                "CXR_UPL_DATE": datetime.now().isoformat(),
+                "PT_ID": row["pt_id"],
+                "USER_ID": user_id
+            })
+
+        cxr_res = supabase.table("CHEST_XRAY_Table").insert(cxr_rows).execute()
+        cxr_ids = [cxr["CXR_ID"] for cxr in cxr_res.data]
+
+        result_rows = []
+        for cxr in cxr_res.data:
+            row = row_by_path[cxr["CXR_FILE_PATH"]]
+            result_rows.append({
+                "CXR_ID": cxr["CXR_ID"],
+                "RES_PRESUMPTIVE": row["label"],
+                "RES_CONF_SCORE": row["confidence"] / 100,
+                "RES_DATE": datetime.now().isoformat(),
+                "RES_STATUS": "Pending"
+            })
+
+        supabase.table("RESULT_Table").insert(result_rows).execute()
+    except Exception:
+        # Roll back what was written so no X-ray is left without its result
+        if cxr_ids:
+            try:
+                supabase.table("CHEST_XRAY_Table").delete().in_("CXR_ID", cxr_ids).execute()
+            except Exception as e:
+                print("Bulk screening cleanup error (CHEST_XRAY_Table):", e)
+        if uploaded_paths:
+            try:
+                supabase.storage.from_("xray-uploads").remove(uploaded_paths)
+            except Exception as e:
+                print("Bulk screening cleanup error (xray-uploads):", e)
+        raise
+
+    invalidate_tables("CHEST_XRAY_Table", "RESULT_Table")
+    return len(result_rows)
+
+
+def BulkScreening(is_light=True):
+    if "light_mode" not in st.session_state:
+        st.session_state["light_mode"] = True
+
+    if is_light is None:
+        is_light = st.session_state["light_mode"]
+
+    # --- Theme-based color variables ---
+    bg_color = "white" if is_light else "#0e0e0e"
+    text_color = "black" if is_light else "white"
+    header_color = "#1c1c1c" if is_light else "white"
+    card_bg = "#f0f0f5" if is_light else "#1c1c1c"
+    button_color = "#d32f2f"
+    button_hover = "#f3a5a5"
+
+    notification_container = st.empty()
+
+    def show_notification(message, type="info", duration=4):
+        icon = {
+            "success": "✅",
+            "error": "❌",
+            "info": "ℹ️",
+            "warning": "⚠️"
+        }.get(type, "")
+
+        with notification_container:
+            st.markdown(f"""
+            <div class="notification-container">
+                <div class="notification notification-{type}">
+                    <span class="notification-icon">{icon}</span> {message}
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+            time.sleep(duration)
+            notification_container.empty()
+
+    st.markdown(f"""
+    <style>
+    html, body, [class*="css"] {{
+        background-color: {bg_color} !important;
+        color: {text_color} !important;
+        font-family: 'Arial', sans-serif;
+    }}
+
+    [data-testid="stAppViewContainer"], [data-testid="stAppViewContainer"] > .main {{
+        background-color: {bg_color} !important;
+        color: {text_color} !important;
+    }}
+
+    label {{
+        color: {text_color} !important;
+        font-weight: 600;
+    }}
+
+    h1, h2, h3, h4, h5, h6 {{ color: {header_color} !important; }}
+
+    .block-container div[data-testid="stButton"] > button,
+    div[data-testid="stDialog"] div[data-testid="stButton"] > button {{
+        background-color: {button_color} !important;
+        color: white !important;
+        border: none !important;
+        border-radius: 25px !important;
+        padding: 0.5em 1.5em !important;
+        font-weight: bold !important;
+    }}
+
+    .block-container div[data-testid="stButton"] > button:hover,
+    div[data-testid="stDialog"] div[data-testid="stButton"] > button:hover {{
+        background-color: {button_hover} !important;
+    }}
+
+    .upload-xray-container {{
+        background-color: {card_bg};
+        padding: 10px;
+        border-radius: 15px;
+        color: {text_color};
+    }}
+
+    .notification-container {{
+        position: fixed;
+        top: 30px;
+        left: 60%;
+        transform: translateX(-50%);
+        width: 400px;
+        z-index: 1000;
+    }}
+
+    .notification {{
+        padding: 8px 12px;
+        border-radius: 4px;
+        font-size: 0.85rem;
+        display: flex;
+        align-items: center;
+        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+    }}
+
+    .notification-icon {{ margin-right: 8px; }}
+    .notification-success {{ background-color: #e8f5e9 !important; color: #000000 !important; }}
+    .notification-error {{ background-color: #ffebee !important; color: #000000 !important; }}
+    .notification-info {{ background-color: #e3f2fd !important; color: #000000 !important; }}
+    .notification-warning {{ background-color: #fff3e0 !important; color: #000000 !important; }}
+    </style>
+    """, unsafe_allow_html=True)
+
+    st.markdown("<h4 style='margin-bottom: 15px;'>Bulk X-ray Screening</h4>", unsafe_allow_html=True)
+    st.markdown("""
+        <div class="upload-xray-container">
+            <p style="margin: 10px;">Upload several chest X-rays or a ZIP of X-rays from a screening drive.
+            Review the presumptive results, map each X-ray to a registered patient, then save.</p>
+        </div>
+    """, unsafe_allow_html=True)
+
+    uploaded_files = st.file_uploader("", type=["zip", "png", "jpg", "jpeg", "bmp"],
+                                      accept_multiple_files=True, key="bulk_xray_uploader")
+
+    if uploaded_files and st.button("Run Screening", key="bulk_run"):
+        progress = st.progress(0.0, text="Analyzing X-rays...")
+        expected = count_uploaded_images(uploaded_files)
+
+        def on_progress(done):
+            progress.progress(min(1.0, done / max(expected, 1)), text=f"Analyzed {done} of {expected} X-rays...")
+
+        try:
+            st.session_state["bulk_screening_rows"] = screen_images(iter_uploaded_images(uploaded_files), on_progress)
+        except Exception as e:
+            show_notification(f"Error processing uploads: {e}", "error")
+        progress.empty()
+
+    rows = st.session_state.get("bulk_screening_rows")
+    if not rows:
+        return
+
+    try:
+        patients = fetch_patient_options()
+    except Exception as e:
+        show_notification(f"Error loading patients: {e}", "error")
+        return
+
+    patient_labels = [UNMAPPED] + [patient["label"] for patient in patients.values()]
+    label_to_pt_id = {patient["label"]: pt_id for pt_id, patient in patients.items()}
+
+    table = [{
+        "Save": row["xray_check"] in ("Valid", "Deviates"),
+        "File": row["name"],
+        "X-ray Check": row["xray_check"],
+        "Presumptive TB": row["label"],
+        "AI Confidence": f"{row['confidence']}%" if row["confidence"] is not None else "",
+        "Patient": patients[row["pt_id"]]["label"] if row["pt_id"] in patients else UNMAPPED,
+    } for row in rows]
+
+    counts = {check: sum(1 for row in rows if row["xray_check"] == check) for check in ("Valid", "Deviates", "Rejected", "Unreadable")}
+    positives = sum(1 for row in rows if row["label"] == "Positive")
+    st.markdown(
+        f"<div style='text-align: center; font-weight: 700; margin: 10px 0;'>"
+        f"{len(rows)} X-rays · {counts['Valid']} valid · {counts['Deviates']} deviating · "
+        f"{counts['Rejected'] + counts['Unreadable']} rejected · {positives} presumptive positive</div>",
+        unsafe_allow_html=True
+    )
+
+    edited = st.data_editor(
+        table,
+        key="bulk_screening_table",
+        hide_index=True,
+        use_container_width=True,
+        disabled=["File", "X-ray Check", "Presumptive TB", "AI Confidence"],
+        column_config={
+            "Save": st.column_config.CheckboxColumn("Save", width="small"),
+            "Patient": st.column_config.SelectboxColumn("Patient", options=patient_labels, required=True),
+        },
+    )
+
+    to_save = []
+    for row, edited_row in zip(rows, edited):
+        pt_id = label_to_pt_id.get(edited_row["Patient"])
+        if edited_row["Save"] and pt_id and row["label"]:
+            to_save.append({**row, "pt_id": pt_id})
+
+    clear_col, save_col = st.columns([10, 2])
+    if clear_col.button("Clear", key="bulk_clear"):
+        st.session_state.pop("bulk_screening_rows", None)
+        st.session_state.pop("bulk_screening_table", None)
+        st.rerun()
+
+    if save_col.button(f"Save {len(to_save)} Results", key="bulk_save", disabled=not to_save):
+        st.session_state["bulk_save_prompt"] = True
+
+    if st.session_state.get("bulk_save_prompt"):
+        @st.dialog("Confirm Bulk Save", width="small")
+        def confirm_bulk_save_dialog():
+            st.write(f"Save {len(to_save)} X-rays and their presumptive results to the mapped patients' records?")
+
+            confirm_col, spacer, cancel_col = st.columns([1, 3.5, 1])
+
+            with confirm_col:
+                if st.button("Yes", key="bulk_confirm_yes"):
+                    st.session_state["bulk_save_prompt"] = False
+                    try:
+                        saved = save_bulk_results(to_save, patients, st.session_state.get("USER_ID"))
+                        st.session_state.pop("bulk_screening_rows", None)
+                        st.session_state.pop("bulk_screening_table", None)
+                        show_notification(f"{saved} screening results successfully saved.", "success")
+                    except Exception as e:
+                        show_notification(f"Failed to save screening results: {e}", "error")
+                    st.rerun()
+
+            with cancel_col:
+                if st.button("No", key="bulk_confirm_no"):
+                    st.session_state["bulk_save_prompt"] = False
+                    st.rerun()
+
+        confirm_bulk_save_dialog()
@@ -4,6 +4,7 @@ import streamlit as st
 import time
 from datetime import datetime, timedelta
 from Supabase import supabase  # Your Supabase client
+from Repository import count_rows, fetch_ai_metrics, fetch_recent_uploads, gather
 
 def Dashboard(is_light=True):
     # --- Session State Initialization ---
@@ -172,122 +173,60 @@ def Dashboard(is_light=True):
             # fallback
             return "Receptionist"
 
-    # Function to normalize DX_STATUS values
-    def normalize_dx_status(dx_status):
-        if not dx_status:
-            return None
-        dx_status = str(dx_status).strip().lower()
-        if "confirmed positive" in dx_status:
-            return "positive"
-        elif "confirmed negative" in dx_status:
-            return "negative"
-        elif dx_status == "pending":
-            return "pending"
-        return None
-
     # Function to fetch Dashboard Data ---
     def fetch_dashboard_data():
         try:
-            # 1. Total Registered Patients 
-            patient_res = supabase.table("PATIENT_Table") \
-                .select("count", count="exact") \
-                .execute()
-            total_patients = patient_res.count or 0
-
-            # 2. Total Pending Results
-            pending_res = supabase.table("RESULT_Table") \
-                .select("count", count="exact") \
-                .eq("RES_STATUS", "Pending") \
-                .execute()
-            total_pending = pending_res.count or 0
-
-            # 3. Recent X-ray Uploads (latest 5 by upload date)
-            results = supabase.table("CHEST_XRAY_Table") \
-                .select("""
-                    CXR_ID,
-                    CXR_UPL_DATE,
-                    PT_ID,
-                    PATIENT_Table(PT_FNAME, PT_MNAME, PT_LNAME),
-                    RESULT_Table(RES_PRESUMPTIVE, RES_CONF_SCORE, RES_STATUS)
-                """) \
-                .order("CXR_UPL_DATE", desc=True) \
-                .limit(5) \
-                .execute()
+            # Sent together; the page waits for the slowest query instead of their sum
+            total_patients, total_pending, recent_uploads, metrics = gather(
+                # 1. Total Registered Patients
+                count_rows.aio("PATIENT_Table"),
+                # 2. Total Pending Results
+                count_rows.aio("RESULT_Table", "RES_STATUS", "Pending"),
+                # 3. Recent X-ray Uploads (latest 5 by upload date)
+                fetch_recent_uploads.aio(limit=5),
+                # 4. AI metrics for the accuracy rate
+                fetch_ai_metrics.aio(),
+            )
 
             recent_cases = []
-            for entry in results.data:
-                patient = entry.get("PATIENT_Table", {})
-                result_list = entry.get("RESULT_Table", [])
-                
-                # Handle the result - take first item if exists, or empty dict
-                result = result_list[0] if result_list and isinstance(result_list, list) else {}
-
-                full_name = " ".join(filter(None, [
-                    patient.get("PT_FNAME", ""),
-                    patient.get("PT_MNAME", ""),
-                    patient.get("PT_LNAME", "")
-                ]))
-
-                ai_pred = result.get("RES_PRESUMPTIVE", "Unknown")
-                conf = result.get("RES_CONF_SCORE", 0)
+            for upload in recent_uploads:
+                ai_pred = upload.presumptive or "Unknown"
                 try:
-                    confidence = int(float(conf) * 100)
+                    confidence = int(float(upload.conf_score or 0) * 100)
                 except:
                     confidence = 0
                 ai_result = f"{ai_pred} ({confidence}%)"
 
                 recent_cases.append({
-                    "pt_id": entry.get("PT_ID", "Unknown"),
-                    "name": full_name.strip(),
-                    "updated": entry.get("CXR_UPL_DATE", "")[:10],
+                    "pt_id": upload.pt_id or "Unknown",
+                    "name": upload.full_name,
+                    "updated": (upload.upl_date or "")[:10],
                     "ai_result": ai_result,
-                    "status": result.get("RES_STATUS", "Unknown")
+                    "status": upload.res_status or "Unknown"
                 })
 
-            return total_patients, total_pending, recent_cases
+            return total_patients, total_pending, recent_cases, metrics
 
         except Exception as e:
             show_notification("Failed to fetch dashboard data.", "warning")
             print(e)
-            return 0, 0, []
+            return 0, 0, [], None
 
 
-    # Function to fetch AI Accuracy Rate
-    def fetch_ai_accuracy_rate():
+    # Function to compute the AI Accuracy Rate
+    def fetch_ai_accuracy_rate(metrics):
         try:
-            ai_results_resp = supabase.table("RESULT_Table").select("CXR_ID", "RES_PRESUMPTIVE").execute()
-            ai_results = ai_results_resp.data or []
+            # Aggregated in Postgres (sql/ai_metrics.sql) instead of downloading every result
+            if metrics is None:
+                return "Error"
 
-            if not ai_results:
+            if not metrics.total_results:
                 return "No Data"
 
-            cxr_ids = [item["CXR_ID"] for item in ai_results]
-
-            dx_resp = supabase.table("DIAGNOSIS_Table") \
-                .select("CXR_ID", "DX_STATUS") \
-                .in_("CXR_ID", cxr_ids) \
-                .execute()
-            diagnosis_list = dx_resp.data or []
-
-            diagnosis_dict = {item["CXR_ID"]: normalize_dx_status(item["DX_STATUS"]) for item in diagnosis_list}
-
-            correct = 0
-            evaluated = 0
-
-            for ai_item in ai_results:
-                cxr_id = ai_item["CXR_ID"]
-                ai_pred = str(ai_item.get("RES_PRESUMPTIVE", "")).strip().lower()
-                dx_status = diagnosis_dict.get(cxr_id)
-
-                if dx_status and dx_status != "pending":
-                    evaluated += 1
-                    if ai_pred == dx_status:
-                        correct += 1
-
-            if evaluated == 0:
+            if metrics.evaluated == 0:
                 return "No Confirmed Cases"
             else:
-                accuracy_percent = (correct / evaluated) * 100
+                accuracy_percent = (metrics.correct / metrics.evaluated) * 100
                 return f"{int(round(accuracy_percent))}%"
         except Exception as e:
             show_notification("Failed to fetch AI accuracy rate.", "warning")
@@ -297,8 +236,8 @@ def Dashboard(is_light=True):
 
 
     # --- Fetch All Dashboard Info ---
-    total_patients, total_pending, recent_cases = fetch_dashboard_data()
-    ai_accuracy = fetch_ai_accuracy_rate()
+    total_patients, total_pending, recent_cases, ai_metrics = fetch_dashboard_data()
+    ai_accuracy = fetch_ai_accuracy_rate(ai_metrics)
     username = get_current_username()
 
     # --- Custom CSS ---
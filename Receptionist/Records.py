@@ -2,14 +2,12 @@
 
 import streamlit as st
 import io
-import numpy as np
 import re
 import uuid
 import time
 import requests
 from datetime import datetime, date
 from PIL import Image, ImageOps
-from skimage import filters
 from io import BytesIO
 from fpdf import FPDF
 from PIL import Image as PILImage
@@ -17,13 +15,11 @@ import tempfile
 import os
 from streamlit_image_zoom import image_zoom
 from Supabase import supabase
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image as keras_image
+from Repository import PREFETCH_CASE_PAGES, fetch_case_page, fetch_oldest_case_date, invalidate_tables
+from Inference import classify_xray_bytes
+from Xray import preprocess_xray, assess_xray
 
 
-IMG_SIZE = (512, 512)
-model = st.session_state.model
-
 
 class PDFReport_format(FPDF):
     def __init__(self, orientation='P', unit='mm', format=None):
@@ -284,95 +280,55 @@ def Records(is_light=True):
         is_light = st.session_state["light_mode"]
 
 
+    # Load the current page of cases, filtered and paginated on the server
     def fetch_cases():
         try:
-            result = (
-                supabase.table("RESULT_Table")
-                .select("""
-                    RES_DATE,
-                    RES_PRESUMPTIVE,
-                    RES_CONF_SCORE,
-                    RES_STATUS,
-                    CHEST_XRAY_Table(
-                        PT_ID,
-                        PATIENT_Table(
-                            PT_FNAME,
-                            PT_MNAME,
-                            PT_LNAME,
-                            PT_SEX,
-                            PT_AGE,
-                            PT_DOB,
-                            PT_PHONE,
-                            PT_HOUSENO,
-                            PT_STREET,
-                            PT_BRGY,
-                            PT_CITY
-                        )
-                    )
-                """)
-                .order("RES_DATE", desc=True)
-                .limit(1000)
-                .execute()
+            page = fetch_case_page(
+                case_filters(),
+                st.session_state.records_page_num,
+                cases_per_page,
+                cursors=st.session_state.setdefault("records_page_cursors", {}),
+                prefetch=PREFETCH_CASE_PAGES,
             )
-
-            seen_patients = set()
             latest_cases = []
 
-            for entry in result.data:
-                patient_data = entry["CHEST_XRAY_Table"]["PATIENT_Table"]
-                pt_id = entry["CHEST_XRAY_Table"]["PT_ID"]
-
-                if pt_id in seen_patients:
-                    continue  
-
-                seen_patients.add(pt_id)
-                full_name = f"{patient_data['PT_FNAME']} {patient_data['PT_MNAME']} {patient_data['PT_LNAME']}".strip()
-                confidence_percent = f"{int(float(entry['RES_CONF_SCORE']) * 100)}%"
-                address_parts = [
-                    patient_data.get('PT_HOUSENO', ''),
-                    patient_data.get('PT_STREET', ''),
-                    patient_data.get('PT_BRGY', ''),
-                    patient_data.get('PT_CITY', '')
-                ]
-                full_address = ', '.join([part.strip() for part in address_parts if part and part.strip()])
-
+            # Latest case per patient
+            for case in page.cases:
                 latest_cases.append({
-                    "pt_id": pt_id,
-                    "name": full_name,
-                    "date": entry["RES_DATE"],
-                    "result": entry["RES_PRESUMPTIVE"],
-                    "confidence": confidence_percent,
-                    "diagnosis": entry["RES_STATUS"],
-                    "age": patient_data.get("PT_AGE", "N/A"),
-                    "sex": patient_data.get("PT_SEX", "N/A"),
-                    "phone": patient_data.get("PT_PHONE", "N/A"),
-                    "address": full_address,
+                    "pt_id": case.pt_id,
+                    "name": case.full_name,
+                    "date": case.res_date,
+                    "result": case.presumptive,
+                    "confidence": case.confidence_percent,
+                    "diagnosis": case.res_status,
+                    "age": case.age,
+                    "sex": case.sex,
+                    "phone": case.phone,
+                    "address": case.address,
  
-                    "PATIENT_FNAME": patient_data.get("PT_FNAME", ""),
-                    "PATIENT_MNAME": patient_data.get("PT_MNAME", ""),
-                    "PATIENT_LNAME": patient_data.get("PT_LNAME", ""),
-                    "PATIENT_SEX": patient_data.get("PT_SEX",""),
-                    "PATIENT_AGE": patient_data.get("PT_AGE", ""),
-                    "PATIENT_DOB": patient_data.get("PT_DOB", "2000-01-01"),
-                    "PATIENT_HOUSENO": patient_data.get("PT_HOUSENO", ""),
-                    "PATIENT_STREET": patient_data.get("PT_STREET", ""),
-                    "PATIENT_BARANGAY": patient_data.get("PT_BRGY", ""),
-                    "PATIENT_CITY": patient_data.get("PT_CITY", ""),
-                    "PATIENT_PHONE": patient_data.get("PT_PHONE", ""),
-                    "PATIENT_COUNTRY":patient_data.get("PT_COUNTRY", ""),
-                    "PATIENT_PROVINCE": patient_data.get("PT_PROVINCE", ""),
+                    "PATIENT_FNAME": case.fname,
+                    "PATIENT_MNAME": case.mname,
+                    "PATIENT_LNAME": case.lname,
+                    "PATIENT_SEX": case.sex,
+                    "PATIENT_AGE": case.age,
+                    "PATIENT_DOB": case.dob,
+                    "PATIENT_HOUSENO": case.house_no,
+                    "PATIENT_STREET": case.street,
+                    "PATIENT_BARANGAY": case.brgy,
+                    "PATIENT_CITY": case.city,
+                    "PATIENT_PHONE": case.phone,
+                    "PATIENT_COUNTRY": "",
+                    "PATIENT_PROVINCE": "",
                 })
 
-            return latest_cases
+            return latest_cases, page.total
 
         except Exception as e:
             show_notification(f"Error loading patient results: {e}", "error")
-            return []
-
-    cases = fetch_cases()
+            return [], 0
 
-    all_dates = [datetime.fromisoformat(c["date"]).date() for c in cases]
-    oldest_date = min(all_dates) if all_dates else date.today()
+    oldest_case_date = fetch_oldest_case_date()
+    oldest_date = datetime.fromisoformat(oldest_case_date).date() if oldest_case_date else date.today()
 
     # ---------------- Reset Trigger Handler ----------------
     if "reset_triggered" not in st.session_state:
@@ -403,9 +359,6 @@ def Records(is_light=True):
     if "records_date_to" not in st.session_state:
         st.session_state["records_date_to"] = date.today()
 
-    if "diagnoses" not in st.session_state:
-        st.session_state["diagnoses"] = {f"diagnosis_{i}": case["diagnosis"] for i, case in enumerate(cases)}
-
     if "records_page_num" not in st.session_state:
         st.session_state["records_page_num"] = 1
 
@@ -418,26 +371,16 @@ def Records(is_light=True):
 
     cases_per_page = 10
 
-    def apply_filters():
-        filtered = cases
-        query = st.session_state["search_bar"].strip().lower()
-        if query:
-            filtered = [c for c in filtered if query in c["name"].lower()]
-
-        if st.session_state["records_status_filter"] != "All":
-            filtered = [c for c in filtered if c["diagnosis"] == st.session_state["records_status_filter"]]
-
-        if st.session_state["records_presumptive_filter"] != "All":
-            target = "Positive" if st.session_state["records_presumptive_filter"] == "Positive" else "Negative"
-            filtered = [c for c in filtered if c["result"] == target]
-
-        if st.session_state["records_date_from"]:
-            filtered = [c for c in filtered if datetime.fromisoformat(c["date"]).date() >= st.session_state["records_date_from"]]
-
-        if st.session_state["records_date_to"]:
-            filtered = [c for c in filtered if datetime.fromisoformat(c["date"]).date() <= st.session_state["records_date_to"]]
-
-        return filtered
+    def case_filters():
+        status = st.session_state["records_status_filter"]
+        presumptive = st.session_state["records_presumptive_filter"]
+        return {
+            "name": st.session_state["search_bar"].strip() or None,
+            "status": None if status == "All" else status,
+            "presumptive": None if presumptive == "All" else presumptive,
+            "date_from": st.session_state["records_date_from"],
+            "date_to": st.session_state["records_date_to"],
+        }
 
     def pagination_controls(position, total_pages):
         col1, col2, col3 = st.columns([1, 7, 1])
@@ -454,119 +397,9 @@ def Records(is_light=True):
                     st.session_state.records_page_num += 1
                     st.rerun()
 
-    # Valid chest x-ray validation (stricter)
-    def is_xray_like(img):
-        """
-            Stricter heuristic to check if an image looks like a chest X-ray.
-            - Must be grayscale-like (R≈G≈B)
-            - Must have sufficient contrast and detail
-            - Must have rib-like edge density
-            - Must have near-square aspect ratio
-            - Must have brighter center (lungs) than edges
-        """
-        # Convert to NumPy array (RGB)
-        img_array = np.array(img)
-
-        # Channel similarity check
-        r, g, b = img_array[..., 0], img_array[..., 1], img_array[..., 2]
-        mean_diff = (np.abs(r - g) + np.abs(r - b) + np.abs(g - b)).mean()
-
-        # Convert to grayscale
-        gray = np.mean(img_array, axis=-1)
-
-        # Aspect ratio filter
-        h, w = gray.shape
-        aspect_ratio = w / h
-        if not (0.7 <= aspect_ratio <= 1.3):
-            return False
-
-        # Contrast and entropy
-        intensity_range = gray.max() - gray.min()
-        contrast_std = gray.std()
-        hist, _ = np.histogram(gray, bins=256, range=(0, 255), density=True)
-        hist += 1e-8
-        entropy = -np.sum(hist * np.log2(hist))
-
-        # Edge density (rib cage usually creates many edges)
-        edges = filters.sobel(gray)
-        edge_density = (edges > 0.05).mean()
-
-        # Center brightness
-        h_mid, w_mid = h // 2, w // 2
-        center_region = gray[h_mid-50:h_mid+50, w_mid-50:w_mid+50]
-        center_brightness = np.mean(center_region)
-
-        # Decision rules
-        is_grayscale = mean_diff < 8
-        has_contrast = intensity_range > 80
-        has_detail = entropy > 5.0 and contrast_std > 40
-        rib_like_edges = edge_density > 0.1
-        bright_center = center_brightness > np.mean(gray)  # lungs lighter than edges
-
-        return all([is_grayscale, has_contrast, has_detail, rib_like_edges, bright_center])
-
-    # Valid chest x-ray validation (lighter)
-    def is_xray_like_relaxed(img):
-        """
-            Relaxed heuristic to allow more chest X-ray images that might fail strict checks.
-            Thresholds and ranges are looser compared to is_xray_like.
-        """
-        # Convert to NumPy array (RGB)
-        img_array = np.array(img)
-
-        # Channel similarity check
-        r, g, b = img_array[..., 0], img_array[..., 1], img_array[..., 2]
-        mean_diff = (np.abs(r - g) + np.abs(r - b) + np.abs(g - b)).mean()
-
-        # Convert to grayscale
-        gray = np.mean(img_array, axis=-1)
-
-        # Aspect ratio filter (wider range)
-        h, w = gray.shape
-        aspect_ratio = w / h
-        if not (0.6 <= aspect_ratio <= 1.4):
-            return False
-
-        # Contrast and entropy (lower thresholds)
-        intensity_range = gray.max() - gray.min()
-        contrast_std = gray.std()
-        hist, _ = np.histogram(gray, bins=256, range=(0, 255), density=True)
-        hist += 1e-8
-        entropy = -np.sum(hist * np.log2(hist))
-
-        # Edge density (rib cage)
-        edges = filters.sobel(gray)
-        edge_density = (edges > 0.05).mean()
-
-        # Center brightness
-        h_mid, w_mid = h // 2, w // 2
-        center_region = gray[h_mid-50:h_mid+50, w_mid-50:w_mid+50]
-        center_brightness = np.mean(center_region)
-
-        # Relaxed decision rules
-        is_grayscale = mean_diff < 15            # relaxed from 8
-        has_contrast = intensity_range > 50      # relaxed from 80
-        has_detail = entropy > 4.0 and contrast_std > 30  # relaxed from 5.0 and 40
-        rib_like_edges = edge_density > 0.05     # relaxed from 0.1
-        bright_center = center_brightness >= np.mean(gray)  # allow equal
-
-        return all([is_grayscale, has_contrast, has_detail, rib_like_edges, bright_center])
-
-    # Preprocess X-ray for prediction
-    def preprocess_xray(uploaded_file):
-        img = Image.open(uploaded_file).convert('RGB')
-        img = img.resize(IMG_SIZE)
-        img_array = keras_image.img_to_array(img) / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
-        return img_array
-
     # Predict TB using model
     def predict_tb(uploaded_file):
-        xray_array = preprocess_xray(uploaded_file)
-        preds = model.predict(xray_array)[0][0]
-        confidence = int((preds if preds > 0.5 else 1 - preds)* 100)
-        label = "Positive" if preds > 0.5 else "Negative"
-        return label, confidence
+        return classify_xray_bytes(uploaded_file.getvalue(), preprocess_xray)
 
     # Store x-ray
     def save_xray_to_supabase(patient_id, image_bytes, file_name, ai_result, show_notification, is_light=True):
@@ -642,6 +475,9 @@ def Records(is_light=True):
         except Exception as e:
             show_notification(f"Error saving X-ray data: {str(e)}", "error", is_light=is_light)
             return False
+
+        finally:
+            invalidate_tables("CHEST_XRAY_Table", "RESULT_Table")
       
 
     # ------------------- Layout -------------------
@@ -1322,12 +1158,12 @@ def Records(is_light=True):
                     st.session_state["records_last_uploaded_file_name"] = records_uploaded.name
 
                 try:
-                    img = Image.open(records_uploaded).convert("RGB")
+                    xray_check = assess_xray(Image.open(records_uploaded))
 
                     # Validate before prediction with strict check
-                    if not is_xray_like(img):
+                    if not xray_check["strict"]:
                         # If fails strict check, try relaxed check with warning
-                        if is_xray_like_relaxed(img):
+                        if xray_check["relaxed"]:
                             if not st.session_state.get("records_xray_warning_shown", False):
                                 show_notification("This image deviates from standard appearance but may still represent a valid chest X-ray. Please proceed with careful analysis.", "warning")
                                 st.session_state.records_xray_warning_shown = True
@@ -1834,7 +1670,13 @@ def Records(is_light=True):
                 
 
         # --- Display Filtered Results ---
-        filtered_cases = apply_filters()
+        cases_to_display, filtered_total = fetch_cases()
+        total_pages = (filtered_total - 1) // cases_per_page + 1
+
+        # Step back if the page no longer exists (fewer matches than when it was opened)
+        if filtered_total and st.session_state.records_page_num > total_pages:
+            st.session_state.records_page_num = total_pages
+            cases_to_display, filtered_total = fetch_cases()
         
         # Determine if any filters are active
         filters_active = (
@@ -1867,7 +1709,7 @@ def Records(is_light=True):
                     margin-top: 10px;       
                 ">
                     <span style="margin-right: -2px;"></span>
-                    Filtered Cases: {len(filtered_cases)}
+                    Filtered Cases: {filtered_total}
                 </div>
                 """, unsafe_allow_html=True)
             else:
@@ -1888,16 +1730,10 @@ def Records(is_light=True):
                     margin-top: 10px;
                 ">
                     <span style="margin-right: -2px;"></span>
-                    Total Cases: {len(cases)}
+                    Total Cases: {filtered_total}
                 </div>
                 """, unsafe_allow_html=True)
 
-        total_pages = (len(filtered_cases) - 1) // cases_per_page + 1
-        current_page = st.session_state.records_page_num
-        start_idx = (current_page - 1) * cases_per_page
-        end_idx = start_idx + cases_per_page
-        cases_to_display = filtered_cases[start_idx:end_idx]
-
         if not cases_to_display:
             st.markdown("<div style='text-align: center; padding: 2rem; font-weight: bold;'>No matching records have been found.</div>", unsafe_allow_html=True)
             return
@@ -1913,10 +1749,7 @@ def Records(is_light=True):
             col5.markdown(f"<div style='text-align: left; font-weight: bold;margin-bottom: 20px;'>Status</div>", unsafe_allow_html=True)
             col6.markdown(f"<div style='text-align: left; font-weight: bold;margin-bottom: 20px;'>Action</div>", unsafe_allow_html=True)
 
-        current_page = st.session_state.records_page_num
-        start_idx = (current_page - 1) * cases_per_page
-        end_idx = start_idx + cases_per_page
-        cases_to_display = filtered_cases[start_idx:end_idx]
+        start_idx = (st.session_state.records_page_num - 1) * cases_per_page
 
         for i, case in enumerate(cases_to_display, start=start_idx):
             cols = st.columns([2, 2, 2, 2, 2, 2])
@@ -2344,6 +2177,7 @@ def Records(is_light=True):
                                     "PT_BRGY": st.session_state.rec_barangay.strip(),
                                     "PT_UPDATED_AT": datetime.now().isoformat()
                                 }).eq("PT_ID", patient_id).execute()
+                                invalidate_tables("PATIENT_Table")
 
                                 # Refresh updated data
                                 updated_patient = supabase.table("PATIENT_Table").select("*").eq("PT_ID", patient_id).single().execute().data
@@ -2404,6 +2238,7 @@ def Records(is_light=True):
                                                         update_data["MAP_LANG"] = lng
                                                     
                                                     supabase.table("HEATMAP_Table").update(update_data).eq("DX_ID", dx_id).execute()
+                                    invalidate_tables("HEATMAP_Table")
                                 
                                 st.session_state["edit_patient_mode"] = False
                                 st.session_state.pop("form_prefilled", None)
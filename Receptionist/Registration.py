@@ -2,22 +2,17 @@
 
 import streamlit as st
 import io
-import numpy as np
 import re
 import uuid
 import time
 from datetime import datetime, date
 from PIL import Image, ImageOps
-from skimage import filters
 from Supabase import supabase
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image as keras_image
+from Repository import find_duplicate_patients, invalidate_tables
+from Inference import submit_analysis, analysis_status
+from Xray import preprocess_xray, assess_xray
 
 
-IMG_SIZE = (512, 512)
-
-model = st.session_state.model
-
 # --- Constants Initialization ---
 
 # Incidence Rate -> Incidence Rate = (Number of New Cases / Population) * Multiplier
@@ -70,119 +65,13 @@ def calculate_age(reg_dob):
     today = date.today()
     return today.year - reg_dob.year - ((today.month, today.day) < (reg_dob.month, reg_dob.day))
 
-# Valid chest x-ray validation (stricter)
-def is_xray_like(img):
-    """
-        Stricter heuristic to check if an image looks like a chest X-ray.
-        - Must be grayscale-like (R≈G≈B)
-        - Must have sufficient contrast and detail
-        - Must have rib-like edge density
-        - Must have near-square aspect ratio
-        - Must have brighter center (lungs) than edges
-    """
-    # Convert to NumPy array (RGB)
-    img_array = np.array(img)
-
-    # Channel similarity check
-    r, g, b = img_array[..., 0], img_array[..., 1], img_array[..., 2]
-    mean_diff = (np.abs(r - g) + np.abs(r - b) + np.abs(g - b)).mean()
-
-    # Convert to grayscale
-    gray = np.mean(img_array, axis=-1)
-
-    # Aspect ratio filter
-    h, w = gray.shape
-    aspect_ratio = w / h
-    if not (0.7 <= aspect_ratio <= 1.3):
-        return False
-
-    # Contrast and entropy
-    intensity_range = gray.max() - gray.min()
-    contrast_std = gray.std()
-    hist, _ = np.histogram(gray, bins=256, range=(0, 255), density=True)
-    hist += 1e-8
-    entropy = -np.sum(hist * np.log2(hist))
-
-    # Edge density (rib cage usually creates many edges)
-    edges = filters.sobel(gray)
-    edge_density = (edges > 0.05).mean()
-
-    # Center brightness
-    h_mid, w_mid = h // 2, w // 2
-    center_region = gray[h_mid-50:h_mid+50, w_mid-50:w_mid+50]
-    center_brightness = np.mean(center_region)
-
-    # Decision rules
-    is_grayscale = mean_diff < 8
-    has_contrast = intensity_range > 80
-    has_detail = entropy > 5.0 and contrast_std > 40
-    rib_like_edges = edge_density > 0.1
-    bright_center = center_brightness > np.mean(gray)  # lungs lighter than edges
-
-    return all([is_grayscale, has_contrast, has_detail, rib_like_edges, bright_center])
-
-# Valid chest x-ray validation (lighter)
-def is_xray_like_relaxed(img):
-    """
-        Relaxed heuristic to allow more chest X-ray images that might fail strict checks.
-        Thresholds and ranges are looser compared to is_xray_like.
-    """
-    # Convert to NumPy array (RGB)
-    img_array = np.array(img)
-
-    # Channel similarity check
-    r, g, b = img_array[..., 0], img_array[..., 1], img_array[..., 2]
-    mean_diff = (np.abs(r - g) + np.abs(r - b) + np.abs(g - b)).mean()
-
-    # Convert to grayscale
-    gray = np.mean(img_array, axis=-1)
-
-    # Aspect ratio filter (wider range)
-    h, w = gray.shape
-    aspect_ratio = w / h
-    if not (0.6 <= aspect_ratio <= 1.4):
-         return False
-
-    # Contrast and entropy (lower thresholds)
-    intensity_range = gray.max() - gray.min()
-    contrast_std = gray.std()
-    hist, _ = np.histogram(gray, bins=256, range=(0, 255), density=True)
-    hist += 1e-8
-    entropy = -np.sum(hist * np.log2(hist))
-
-    # Edge density (rib cage)
-    edges = filters.sobel(gray)
-    edge_density = (edges > 0.05).mean()
-
-    # Center brightness
-    h_mid, w_mid = h // 2, w // 2
-    center_region = gray[h_mid-50:h_mid+50, w_mid-50:w_mid+50]
-    center_brightness = np.mean(center_region)
-
-    # Relaxed decision rules
-    is_grayscale = mean_diff < 15            # relaxed from 8
-    has_contrast = intensity_range > 50      # relaxed from 80
-    has_detail = entropy > 4.0 and contrast_std > 30  # relaxed from 5.0 and 40
-    rib_like_edges = edge_density > 0.05     # relaxed from 0.1
-    bright_center = center_brightness >= np.mean(gray)  # allow equal
-
-    return all([is_grayscale, has_contrast, has_detail, rib_like_edges, bright_center])
-
-# Preprocess X-ray for prediction
-def preprocess_xray(uploaded_file):
-    img = Image.open(uploaded_file).convert('RGB')
-    img = img.resize(IMG_SIZE)
-    img_array = keras_image.img_to_array(img) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
-
-# Predict TB using model
-def predict_tb(uploaded_file):
-    xray_array = preprocess_xray(uploaded_file)
-    preds = model.predict(xray_array)[0][0]
-    confidence = int((preds if preds > 0.5 else 1 - preds)* 100)
-    label = "Positive" if preds > 0.5 else "Negative"
-    return label, confidence
+# Seconds between checks on a running X-ray analysis in step 3
+ANALYSIS_POLL_INTERVAL = 0.5
+
+# Start TB analysis in the background; the same upload reuses its running job
+def start_tb_analysis(image_bytes):
+    st.session_state["registration_analysis_job"] = submit_analysis(image_bytes, preprocess_xray)
+    return st.session_state["registration_analysis_job"]
 
 def format_name(name):
     return name.strip().title() if name else ""
@@ -314,7 +203,7 @@ def save_to_supabase(show_notification, is_light=True):
             "reg_first_name", "reg_middle_name", "last_name", "reg_sex", "reg_dob", "reg_phone",
             "reg_street", "reg_house", "reg_barangay", "PATIENT_ID", "CXR_ID",
             "uploaded_file", "registration_uploaded_file_bytes", "registration_uploaded_file_name",
-            "registration_AI_RESULT", "step", "confirm_save", "save_prompt"
+            "registration_AI_RESULT", "registration_analysis_job", "step", "confirm_save", "save_prompt"
         ]
         for key in keys_to_clear:
             st.session_state.pop(key, None)
@@ -325,6 +214,9 @@ def save_to_supabase(show_notification, is_light=True):
 
     except Exception as e:
         show_notification(f"Failed to save record: {e}", "error", is_light=is_light)
+    finally:
+        # Runs before st.rerun() takes effect, so the lists show the new record
+        invalidate_tables("PATIENT_Table", "CHEST_XRAY_Table", "RESULT_Table")
 
 
 def Registration(is_light=True):
@@ -810,38 +702,17 @@ def Registration(is_light=True):
 
             if dob:
                 try:
-                    # 6.1 Full match: First + Middle + Last + DOB
-                    full_query = (
-                        supabase.table("PATIENT_Table")
-                        .select("PT_ID")
-                        .ilike("PT_FNAME", fname)
-                        .ilike("PT_LNAME", lname)
-                        .eq("PT_DOB", dob)
-                    )
-
-                    # Only include middle name in full match if it's > 1 char (not an initial)
-                    if mname and len(mname.replace(".", "")) > 1:
-                        full_query = full_query.ilike("PT_MNAME", mname)
-                    else:
-                        full_query = full_query.ilike("PT_MNAME", "")  # Treat blank as blank
+                    # Exact, near (different middle name) and similar-sounding matches in one lookup
+                    matches = find_duplicate_patients(fname, mname, lname, dob)
+                    kinds = {match.match for match in matches}
 
-                    full_result = full_query.execute()
-
-                    if full_result.data:
+                    if "exact" in kinds:
                         errors.append("⚠️ A patient with the same full name and date of birth already exists.")
-                    else:
-                        # 6.2 Near match: First + Last + DOB (ignore middle name)
-                        near_match_query = (
-                            supabase.table("PATIENT_Table")
-                            .select("PT_ID, PT_FNAME, PT_MNAME, PT_LNAME")
-                            .ilike("PT_FNAME", fname)
-                            .ilike("PT_LNAME", lname)
-                            .eq("PT_DOB", dob)
-                        )
-
-                        near_result = near_match_query.execute()
-                        if near_result.data:
-                            warnings.append("⚠ Possible duplicate: Same first, last name and birth date, but different middle name.")
+                    elif "near" in kinds:
+                        warnings.append("⚠ Possible duplicate: Same first, last name and birth date, but different middle name.")
+                    for match in matches:
+                        if match.match == "similar":
+                            warnings.append(f"⚠ Possible duplicate: {match.full_name} has the same birth date and a similar-sounding name.")
 
                 except Exception as e:
                     errors.append(f"Error checking for duplicate patient: {e}")
@@ -1025,6 +896,10 @@ def Registration(is_light=True):
         if "registration_xray_warning_shown" not in st.session_state:
             st.session_state.registration_xray_warning_shown = False
 
+        # Analysis that failed in step 3 sends the receptionist back here
+        if st.session_state.get("registration_analysis_error"):
+            show_notification(f"X-ray analysis failed: {st.session_state.pop('registration_analysis_error')}. Please try again.", "error")
+
         # File uploader
         registration_uploaded = st.file_uploader("", type=["png", "jpg", "jpeg", "bmp"], 
                                     key="registration_xray_uploader_step2")
@@ -1034,6 +909,7 @@ def Registration(is_light=True):
             st.session_state.registration_xray_uploaded = False
             st.session_state.registration_xray_warning_shown = False
             st.session_state.pop("registration_uploaded_file_bytes", None)
+            st.session_state.pop("registration_analysis_job", None)
 
         # When a file is uploaded
         if registration_uploaded:
@@ -1043,33 +919,37 @@ def Registration(is_light=True):
                 st.session_state["registration_last_uploaded_file_name"] = registration_uploaded.name
 
             try:
-                img = Image.open(registration_uploaded).convert("RGB")
+                xray_check = assess_xray(Image.open(registration_uploaded))
 
                 # Strict validation
-                if is_xray_like(img):
+                if xray_check["strict"]:
                     st.session_state.registration_xray_uploaded = True
                     st.session_state.registration_uploaded_file_bytes = registration_uploaded.getvalue()
                     st.session_state.registration_xray_warning_shown = False
+                    start_tb_analysis(st.session_state.registration_uploaded_file_bytes)
                 else:
                     # Relaxed validation with warning
-                    if is_xray_like_relaxed(img):
+                    if xray_check["relaxed"]:
                         if not st.session_state.registration_xray_warning_shown:
                             show_notification("This image deviates from standard appearance but may still represent a valid chest X-ray. Please proceed with careful analysis.", "warning")
                             st.session_state.registration_xray_warning_shown = True
                         st.session_state.registration_xray_uploaded = True
                         st.session_state.registration_uploaded_file_bytes = registration_uploaded.getvalue()
+                        start_tb_analysis(st.session_state.registration_uploaded_file_bytes)
                     else:
                         # If the image fails to fit in the validations
                         show_notification("This image does not meet the criteria for a valid chest X-ray. Please upload a different image.", "error")
                         st.session_state.registration_xray_uploaded = False
                         st.session_state.registration_xray_warning_shown = False
                         st.session_state.pop("registration_uploaded_file_bytes", None)
+                        st.session_state.pop("registration_analysis_job", None)
 
             except Exception as e:
                 show_notification(f"Error processing image: {e}", "error")
                 st.session_state.registration_xray_uploaded = False
                 st.session_state.registration_xray_warning_shown = False
                 st.session_state.pop("registration_uploaded_file_bytes", None)
+                st.session_state.pop("registration_analysis_job", None)
 
         # Back and Next buttons
         back_col, next_col = st.columns([11, 1])
@@ -1102,7 +982,7 @@ def Registration(is_light=True):
             </div>
         """, unsafe_allow_html=True)
 
-        # --- Only analyze the first time ---
+        # --- Analysis was started in step 2; poll for it without blocking the page ---
         if st.session_state.get("registration_analyze_triggered"):
             if "registration_uploaded_file_bytes" in st.session_state and st.session_state.registration_uploaded_file_bytes:
                 spinner_html = """
@@ -1132,13 +1012,34 @@ def Registration(is_light=True):
                 }
                 </style>
                 """
-                st.markdown(spinner_html, unsafe_allow_html=True)
 
-                uploaded_file = io.BytesIO(st.session_state.registration_uploaded_file_bytes)
-                label, confidence = predict_tb(uploaded_file)
-                st.session_state["registration_AI_RESULT"] = {"label": label, "confidence": confidence}
-                st.session_state["registration_analyze_triggered"] = False
-                st.rerun()       
+                # Reuses the job from step 2 (or starts one when step 2 was skipped)
+                job_id = start_tb_analysis(st.session_state.registration_uploaded_file_bytes)
+
+                @st.fragment(run_every=ANALYSIS_POLL_INTERVAL)
+                def analysis_progress():
+                    job = analysis_status(job_id)
+                    if job["status"] == "done":
+                        label, confidence = job["result"]
+                        st.session_state["registration_AI_RESULT"] = {"label": label, "confidence": confidence}
+                        st.session_state["registration_analyze_triggered"] = False
+                        st.rerun()
+                    elif job["status"] in ("failed", "unknown"):
+                        st.session_state["registration_analysis_error"] = job["error"] or "the analysis was interrupted"
+                        st.session_state["registration_analyze_triggered"] = False
+                        st.session_state.pop("registration_analysis_job", None)
+                        st.session_state.step = 2
+                        st.rerun()
+
+                    st.markdown(spinner_html, unsafe_allow_html=True)
+
+                analysis_progress()
+
+                back_col, _ = st.columns([11, 1])
+                if back_col.button("Back", key="step3_back_analyzing"):
+                    st.session_state.step = 1
+                    st.rerun()
+                return
 
         # --- After analysis ---
         label, confidence = st.session_state.registration_AI_RESULT.values()
@@ -1243,6 +1144,7 @@ def Registration(is_light=True):
                     st.session_state.pop("registration_uploaded_file_bytes", None)
                     st.session_state.pop("registration_uploaded_file_name", None)
                     st.session_state.pop("registration_AI_RESULT", None)
+                    st.session_state.pop("registration_analysis_job", None)
                     st.session_state["registration_xray_uploaded"] = False
                     st.session_state.step = 2
                     st.rerun()
@@ -1,7 +1,7 @@
 # Results.py
 
 import streamlit as st
-from Supabase import supabase
+from Repository import PREFETCH_CASE_PAGES, fetch_case_page, fetch_oldest_case_date
 from datetime import datetime
 from datetime import date
 import time
@@ -14,62 +14,37 @@ def Results(is_light=True):
     if is_light is None:
         is_light = st.session_state["light_mode"]
 
+    # Load the current page of cases, filtered and paginated on the server
     def fetch_cases():
         try:
-            result = (
-                supabase.table("RESULT_Table")
-                .select("""
-                    RES_DATE,
-                    RES_PRESUMPTIVE,
-                    RES_CONF_SCORE,
-                    RES_STATUS,
-                    CHEST_XRAY_Table(
-                        PT_ID,
-                        PATIENT_Table(
-                            PT_FNAME,
-                            PT_MNAME,
-                            PT_LNAME
-                        )
-                    )
-                """)
-                .order("RES_DATE", desc=True)
-                .limit(1000)
-                .execute()
+            page = fetch_case_page(
+                case_filters(),
+                st.session_state.results_page_num,
+                cases_per_page,
+                cursors=st.session_state.setdefault("results_page_cursors", {}),
+                prefetch=PREFETCH_CASE_PAGES,
             )
-
-            seen_patients = set()
             latest_cases = []
 
-            for entry in result.data:
-                patient_data = entry["CHEST_XRAY_Table"]["PATIENT_Table"]
-                pt_id = entry["CHEST_XRAY_Table"]["PT_ID"]
-
-                if pt_id in seen_patients:
-                    continue  # already added latest case for this patient
-
-                seen_patients.add(pt_id)
-                full_name = f"{patient_data['PT_FNAME']} {patient_data['PT_MNAME']} {patient_data['PT_LNAME']}".strip()
-                confidence_percent = f"{int(float(entry['RES_CONF_SCORE']) * 100)}%"
-
+            # Latest case per patient
+            for case in page.cases:
                 latest_cases.append({
-                    "pt_id": pt_id,
-                    "name": full_name,
-                    "date": entry["RES_DATE"],
-                    "result": entry["RES_PRESUMPTIVE"],
-                    "confidence": confidence_percent,
-                    "diagnosis": entry["RES_STATUS"]
+                    "pt_id": case.pt_id,
+                    "name": case.full_name,
+                    "date": case.res_date,
+                    "result": case.presumptive,
+                    "confidence": case.confidence_percent,
+                    "diagnosis": case.res_status
                 })
 
-            return latest_cases
+            return latest_cases, page.total
 
         except Exception as e:
             show_notification(f"Error loading patient results: {e}", "error")
-            return []
+            return [], 0
 
-    cases = fetch_cases()
-
-    all_dates = [datetime.fromisoformat(c["date"]).date() for c in cases]
-    oldest_date = min(all_dates) if all_dates else date.today()
+    oldest_case_date = fetch_oldest_case_date()
+    oldest_date = datetime.fromisoformat(oldest_case_date).date() if oldest_case_date else date.today()
 
     # ---------------- Reset Trigger Handler ----------------
     if "reset_triggered" not in st.session_state:
@@ -101,34 +76,21 @@ def Results(is_light=True):
     if "results_date_to" not in st.session_state:
         st.session_state["results_date_to"] = date.today()
 
-    if "diagnoses" not in st.session_state:
-        st.session_state["diagnoses"] = {f"diagnosis_{i}": case["diagnosis"] for i, case in enumerate(cases)}
-
     if "results_page_num" not in st.session_state:
         st.session_state["results_page_num"] = 1
 
     cases_per_page = 10
 
-    def apply_filters():
-        filtered = cases
-        query = st.session_state["search_bar"].strip().lower()
-        if query:
-            filtered = [c for c in filtered if query in c["name"].lower()]
-
-        if st.session_state["results_status_filter"] != "All":
-            filtered = [c for c in filtered if c["diagnosis"] == st.session_state["results_status_filter"]]
-
-        if st.session_state["results_presumptive_filter"] != "All":
-            target = "Positive" if st.session_state["results_presumptive_filter"] == "Positive" else "Negative"
-            filtered = [c for c in filtered if c["result"] == target]
-
-        if st.session_state["results_date_from"]:
-            filtered = [c for c in filtered if datetime.fromisoformat(c["date"]).date() >= st.session_state["results_date_from"]]
-
-        if st.session_state["results_date_to"]:
-            filtered = [c for c in filtered if datetime.fromisoformat(c["date"]).date() <= st.session_state["results_date_to"]]
-
-        return filtered
+    def case_filters():
+        status = st.session_state["results_status_filter"]
+        presumptive = st.session_state["results_presumptive_filter"]
+        return {
+            "name": st.session_state["search_bar"].strip() or None,
+            "status": None if status == "All" else status,
+            "presumptive": None if presumptive == "All" else presumptive,
+            "date_from": st.session_state["results_date_from"],
+            "date_to": st.session_state["results_date_to"],
+        }
 
     def pagination_controls(position, total_pages):
         col1, col2, col3 = st.columns([1, 7, 1])
@@ -499,7 +461,13 @@ def Results(is_light=True):
             
             
     # --- Display Filtered Results ---
-    filtered_cases = apply_filters()
+    cases_to_display, filtered_total = fetch_cases()
+    total_pages = (filtered_total - 1) // cases_per_page + 1
+
+    # Step back if the page no longer exists (fewer matches than when it was opened)
+    if filtered_total and st.session_state.results_page_num > total_pages:
+        st.session_state.results_page_num = total_pages
+        cases_to_display, filtered_total = fetch_cases()
 
     # Determine if any filters are active
     filters_active = (
@@ -532,7 +500,7 @@ def Results(is_light=True):
                 margin-top: 10px;       
             ">
                 <span style="margin-right: -2px;"></span>
-                Filtered Cases: {len(filtered_cases)}
+                Filtered Cases: {filtered_total}
             </div>
             """, unsafe_allow_html=True)
         else:
@@ -553,16 +521,10 @@ def Results(is_light=True):
                 margin-top: 10px;
             ">
                 <span style="margin-right: -2px;"></span>
-                Total Cases: {len(cases)}
+                Total Cases: {filtered_total}
             </div>
             """, unsafe_allow_html=True)
     
-    total_pages = (len(filtered_cases) - 1) // cases_per_page + 1
-    current_page = st.session_state.results_page_num
-    start_idx = (current_page - 1) * cases_per_page
-    end_idx = start_idx + cases_per_page
-    cases_to_display = filtered_cases[start_idx:end_idx]
-
     with st.container():
         if not cases_to_display:
             st.markdown(
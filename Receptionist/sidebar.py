@@ -11,11 +11,16 @@ def main():  # Wrap your sidebar layout in a function
         st.stop()
     
     from Receptionist.Registration import Registration
+    from Receptionist.Bulk_Screening import BulkScreening
     from Receptionist.Records import Records
     from Receptionist.Results import Results
     from Receptionist.Account import Account
     from Receptionist.Dashboard import Dashboard
     from Login import Login
+    from Inference import warm_up
+
+    # Receptionists run inference, so start loading the model before the first upload
+    warm_up()
 
     if not st.session_state.get("authenticated"):
         st.session_state.page = "Login"
@@ -164,6 +169,7 @@ def main():  # Wrap your sidebar layout in a function
         /* Default sidebar buttons style */
         .st-key-dashboard button, 
         .st-key-reg button,
+        .st-key-screening button,
         .st-key-result button,
         .st-key-record button,
         .st-key-account button,
@@ -229,6 +235,7 @@ def main():  # Wrap your sidebar layout in a function
                 st.session_state.page = "Dashboard"
 
         nav_button_with_icon("Registration", "../images/registration.png", "reg")
+        nav_button_with_icon("Bulk Screening", "../images/registration.png", "screening")
         nav_button_with_icon("Results", "../images/results.png", "result")
         nav_button_with_icon("Records", "../images/records.png", "record")
 
@@ -331,6 +338,7 @@ def main():  # Wrap your sidebar layout in a function
     page_key_map = {
         "Dashboard": "dashboard",
         "Registration": "reg",
+        "Bulk Screening": "screening",
         "Results": "result",
         "Records": "record",
     }
@@ -354,6 +362,7 @@ def main():  # Wrap your sidebar layout in a function
         /* Shared hover style for all buttons */
         .st-key-dashboard button:hover,
         .st-key-reg button:hover,
+        .st-key-screening button:hover,
         .st-key-result button:hover,
         .st-key-record button:hover {{
             {shared_style}
@@ -375,6 +384,8 @@ def main():  # Wrap your sidebar layout in a function
         Dashboard(is_light=is_light)
     elif st.session_state.page == "Registration":
         Registration(is_light=is_light)
+    elif st.session_state.page == "Bulk Screening":
+        BulkScreening(is_light=is_light)
     elif st.session_state.page == "Results":
         Results(is_light=is_light)
     elif st.session_state.page == "Records":
@@ -0,0 +1,822 @@
+# Repository.py
+#
+# Named, parameterised queries over the shared Supabase client. Pages call these
+# instead of building supabase.table(...) chains inline, and every query goes
+# through run_query, which times it, counts the rows it returned and can serve a
+# cached copy, so a hot query is optimised here once for every page using it.
+#
+# Cached reads name the tables they depend on; code that writes to a table calls
+# invalidate_tables(...) afterwards so the next rerun reads the new rows.
+#
+# Queries a page issues together are written as coroutines on the async client
+# (@blocking); called normally they block as before, and gather() awaits
+# several of them concurrently on the shared event loop of Supabase.py.
+
+import asyncio
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from Supabase import supabase, get_async_supabase, run_async
+
+# --- Query Instrumentation ---
+# Queries slower than this are logged to the server console
+SLOW_QUERY_MS = float(os.getenv("DETEXTB_SLOW_QUERY_MS", "500"))
+# Default lifetime of cached query results in seconds; 0 disables caching
+QUERY_CACHE_TTL = float(os.getenv("DETEXTB_QUERY_CACHE_TTL", "0"))
+# Lifetime of the list reads pages repeat on every rerun (cases, patients, reports).
+# Writes made through the app invalidate them immediately; the TTL bounds how long
+# changes made elsewhere (another process, the Supabase dashboard) can go unseen.
+READ_CACHE_TTL = float(os.getenv("DETEXTB_READ_CACHE_TTL", "300"))
+# Most cached results kept; the least recently used are evicted first
+QUERY_CACHE_SIZE = int(os.getenv("DETEXTB_QUERY_CACHE_SIZE", "256"))
+
+_query_stats = {}
+_query_cache = OrderedDict()
+# Bumped by invalidate_tables, so a read that raced a write is not cached
+_table_versions = {}
+_query_lock = threading.Lock()
+# Set by use_local_database to answer RPCs from the SQLite stand-in (Local_Database.py)
+_local_database = None
+
+
+class QueryResult(NamedTuple):
+    data: list
+    count: Optional[int]
+
+
+def _begin_query(name, key, ttl, tables):
+    """Count a call of the named query; returns (fresh cached result or None, current versions of `tables`)."""
+    with _query_lock:
+        stats = _query_stats.setdefault(name, {"calls": 0, "cache_hits": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        cached = _query_cache.get(key)
+        if ttl and cached is not None and time.monotonic() - cached[0] < ttl:
+            _query_cache.move_to_end(key)
+            stats["cache_hits"] += 1
+            return cached[1], None
+        return None, [_table_versions.get(table, 0) for table in tables]
+
+
+def _finish_query(name, key, ttl, tables, versions, response, start):
+    """Record the timing of a query sent at `start` and cache its result."""
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    result = QueryResult(response.data or [], getattr(response, "count", None))
+
+    with _query_lock:
+        stats = _query_stats[name]
+        stats["rows"] += len(result.data)
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if ttl and versions == [_table_versions.get(table, 0) for table in tables]:
+            _query_cache[key] = (time.monotonic(), result, frozenset(tables))
+            _query_cache.move_to_end(key)
+            while len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        print(f"🐢 Slow query {name}: {elapsed_ms:.0f} ms, {len(result.data)} rows")
+    return result
+
+
+def run_query(name, build, params=(), ttl=None, tables=()):
+    """
+        Execute the PostgREST query returned by build() as the named query.
+        `params` identifies the call for caching; results are reused for `ttl`
+        seconds (QUERY_CACHE_TTL when None) or until one of `tables` is
+        passed to invalidate_tables.
+    """
+    ttl = QUERY_CACHE_TTL if ttl is None else ttl
+    key = (name, params)
+    cached, versions = _begin_query(name, key, ttl, tables)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    response = build().execute()
+    return _finish_query(name, key, ttl, tables, versions, response, start)
+
+
+async def run_query_async(name, build, params=(), ttl=None, tables=()):
+    """
+        run_query on the shared event loop: build(client) is given the async
+        client, and other queries proceed while this one waits on Supabase.
+        Shares the cache and statistics of run_query.
+    """
+    ttl = QUERY_CACHE_TTL if ttl is None else ttl
+    key = (name, params)
+    cached, versions = _begin_query(name, key, ttl, tables)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    response = build(await get_async_supabase()).execute()
+    if inspect.isawaitable(response):  # the SQLite stand-in answers synchronously
+        response = await response
+    return _finish_query(name, key, ttl, tables, versions, response, start)
+
+
+def blocking(fetch):
+    """
+        Make the coroutine function `fetch` a plain call for page code. The
+        coroutine stays available as fetch.aio for gather().
+    """
+    @functools.wraps(fetch)
+    def call(*args, **kwargs):
+        return run_async(fetch(*args, **kwargs))
+    call.aio = fetch
+    return call
+
+
+def gather(*coroutines):
+    """
+        Await independent queries concurrently and return their results in
+        order, so the page waits for the slowest rather than their sum:
+
+            confirmed, recent = gather(count_rows.aio(...), fetch_recent_diagnoses.aio(limit=5))
+    """
+    async def all_of():
+        return await asyncio.gather(*coroutines)
+    return run_async(all_of())
+
+
+def use_local_database(database):
+    """Route call_rpc to a Local_Database.LocalDatabase (None restores Supabase)."""
+    global _local_database
+    _local_database = database
+    clear_query_cache()
+
+
+def call_rpc(name, params, ttl=None, tables=()):
+    """Run a Postgres function from sql/ as a named query."""
+    def build():
+        return (_local_database or supabase).rpc(name, params)
+    return run_query(f"rpc:{name}", build, params=tuple(sorted(params.items())), ttl=ttl, tables=tables)
+
+
+async def call_rpc_async(name, params, ttl=None, tables=()):
+    """call_rpc on the async client."""
+    def build(client):
+        return (_local_database or client).rpc(name, params)
+    return await run_query_async(f"rpc:{name}", build, params=tuple(sorted(params.items())), ttl=ttl, tables=tables)
+
+
+def query_report():
+    """Per-query call counts, cache hits, rows and timings, slowest in total first."""
+    with _query_lock:
+        report = [{"query": name, **stats, "avg_ms": stats["total_ms"] / max(1, stats["calls"] - stats["cache_hits"])}
+                  for name, stats in _query_stats.items()]
+    return sorted(report, key=lambda row: row["total_ms"], reverse=True)
+
+
+def clear_query_cache(name=None):
+    with _query_lock:
+        for key in [key for key in _query_cache if name is None or key[0] == name]:
+            del _query_cache[key]
+
+
+def invalidate_tables(*tables):
+    """Drop the cached results of every query reading one of `tables`; call after writing to them."""
+    with _query_lock:
+        for table in tables:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+        for key in [key for key, entry in _query_cache.items() if entry[2].intersection(tables)]:
+            del _query_cache[key]
+
+
+class RoundTrips:
+    """
+        Counts the HTTP requests the Supabase client sends while active,
+        including queries still written inline in the pages:
+
+            with RoundTrips() as trips:
+                Dashboard()
+            print(trips.count, trips.paths)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.paths = []
+
+    def _on_request(self, request):
+        self.count += 1
+        self.paths.append(request.url.path.rsplit("/", 1)[-1])
+
+    async def _on_async_request(self, request):
+        self._on_request(request)
+
+    def _hooks(self):
+        async def async_hooks():
+            return (await get_async_supabase()).postgrest.session.event_hooks["request"]
+        return [
+            (supabase.postgrest.session.event_hooks["request"], self._on_request),
+            (run_async(async_hooks()), self._on_async_request),
+        ]
+
+    def __enter__(self):
+        for hooks, hook in self._hooks():
+            hooks.append(hook)
+        return self
+
+    def __exit__(self, *exc):
+        for hooks, hook in self._hooks():
+            hooks.remove(hook)
+
+
+# --- Period Windows ---
+def period_bounds(year=None, month=None):
+    """
+        Half-open [start, end) ISO bounds of `year`, or of `month` within it;
+        (None, None) when no year is given. `month` may be None or "All".
+    """
+    month = None if month == "All" else month
+    if year is None:
+        if month is not None:
+            raise ValueError("A month filter needs a year.")
+        return None, None
+    if month is None:
+        return datetime(year, 1, 1).isoformat(), datetime(year + 1, 1, 1).isoformat()
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return datetime(year, month, 1).isoformat(), end.isoformat()
+
+
+def in_period(query, column, year=None, month=None):
+    """Restrict a PostgREST query to rows whose `column` falls in the period, on the server."""
+    start, end = period_bounds(year, month)
+    if start is None:
+        return query
+    return query.gte(column, start).lt(column, end)
+
+
+# --- Row Types ---
+class CaseRow(NamedTuple):
+    """One RESULT_Table row joined to its CHEST_XRAY_Table and PATIENT_Table rows."""
+    res_id: int
+    res_date: str
+    presumptive: str
+    conf_score: float
+    res_status: str
+    cxr_id: int
+    cxr_file_path: Optional[str]
+    pt_id: int
+    fname: str
+    mname: Optional[str]
+    lname: str
+    sex: Optional[str]
+    age: Optional[int]
+    dob: Optional[str]
+    phone: Optional[str]
+    house_no: Optional[str]
+    street: Optional[str]
+    brgy: Optional[str]
+    city: Optional[str]
+
+    @property
+    def full_name(self):
+        return f"{self.fname} {self.mname} {self.lname}".strip()
+
+    @property
+    def confidence_percent(self):
+        return f"{int(float(self.conf_score) * 100)}%"
+
+    @property
+    def address(self):
+        parts = [self.house_no, self.street, self.brgy, self.city]
+        return ", ".join(part.strip() for part in parts if part and part.strip())
+
+
+class RecentDiagnosisRow(NamedTuple):
+    """One DIAGNOSIS_Table row with its patient and AI result, for the dashboards."""
+    pt_id: int
+    fname: str
+    mname: Optional[str]
+    lname: str
+    presumptive: str
+    conf_score: float
+    dx_status: str
+    dx_updated_at: str
+
+    @property
+    def full_name(self):
+        return f"{self.fname} {self.mname} {self.lname}".strip()
+
+
+class RecentUploadRow(NamedTuple):
+    """One CHEST_XRAY_Table row with its patient and AI result, for the Receptionist dashboard."""
+    cxr_id: int
+    pt_id: Optional[int]
+    fname: Optional[str]
+    mname: Optional[str]
+    lname: Optional[str]
+    presumptive: Optional[str]
+    conf_score: Optional[float]
+    res_status: Optional[str]
+    upl_date: Optional[str]
+
+    @property
+    def full_name(self):
+        return " ".join(filter(None, [self.fname, self.mname, self.lname]))
+
+
+class AIMetrics(NamedTuple):
+    """One row of the ai_performance_metrics function (sql/ai_metrics.sql); rates are percentages or None."""
+    period_year: Optional[int] = None
+    period_month: Optional[int] = None
+    total_results: int = 0
+    flagged_patients: int = 0
+    pending_confirmations: int = 0
+    tp: int = 0
+    tn: int = 0
+    fp: int = 0
+    fn: int = 0
+    evaluated: int = 0
+    correct: int = 0
+    accuracy: Optional[float] = None
+    sensitivity: Optional[float] = None
+    specificity: Optional[float] = None
+
+
+class ReportRow(NamedTuple):
+    """One RESULT_Table row with its patient and latest diagnosis, for the Manager reports."""
+    cxr_id: int
+    res_date: Optional[str]
+    presumptive: Optional[str]
+    conf_score: Optional[float]
+    res_status: Optional[str]
+    pt_id: Optional[int]
+    age: Optional[int]
+    sex: Optional[str]
+    brgy: Optional[str]
+    dx_status: Optional[str]
+    dx_notes: Optional[str]
+    dx_updated_at: Optional[str]
+
+
+class PatientName(NamedTuple):
+    pt_id: int
+    fname: str
+    mname: Optional[str]
+    lname: str
+
+
+class HeatmapCell(NamedTuple):
+    """Confirmed cases of one barangay × month × age group × sex, with their mean coordinates."""
+    brgy: str
+    year: int
+    month: int
+    age_group: str
+    sex: str
+    cases: int
+    lat: Optional[float]
+    lng: Optional[float]
+
+
+class DuplicatePatient(NamedTuple):
+    """An existing patient matching a registration; match is "exact", "near" or "similar"."""
+    pt_id: int
+    fname: str
+    mname: Optional[str]
+    lname: str
+    match: str
+
+    @property
+    def full_name(self):
+        return " ".join(part for part in (self.fname, self.mname, self.lname) if part)
+
+
+class DatasetRow(NamedTuple):
+    file_path: str
+    label: str
+
+
+# --- Cases (latest result per patient, see sql/case_pages.sql and sql/patient_search.sql) ---
+CASE_TABLES = ("RESULT_Table", "CHEST_XRAY_Table", "PATIENT_Table")
+# Whether the list pages fetch the following page in the background (needs READ_CACHE_TTL > 0)
+PREFETCH_CASE_PAGES = os.getenv("DETEXTB_PREFETCH_CASE_PAGES", "1") == "1"
+
+CASE_COLUMNS = (
+    "RES_ID, RES_DATE, RES_PRESUMPTIVE, RES_CONF_SCORE, RES_STATUS, CXR_ID, CXR_FILE_PATH, "
+    "PT_ID, PT_FNAME, PT_MNAME, PT_LNAME, PT_SEX, PT_AGE, PT_DOB, PT_PHONE, PT_HOUSENO, PT_STREET, PT_BRGY, PT_CITY"
+)
+
+# Case filters compared for equality on the server: filter name → latest_patient_cases column
+CASE_EQUALITY_FILTERS = {
+    "status": "RES_STATUS",
+    "presumptive": "RES_PRESUMPTIVE",
+    "barangay": "PT_BRGY",
+    "sex": "PT_SEX",
+    "age": "PT_AGE",
+}
+
+
+class CasePage(NamedTuple):
+    """One page of a case list; next_cursor is None on the last page."""
+    cases: list
+    total: int
+    next_cursor: Optional[tuple]
+
+
+def _case_row(entry):
+    return CaseRow(
+        res_id=entry["RES_ID"],
+        res_date=entry["RES_DATE"],
+        presumptive=entry["RES_PRESUMPTIVE"],
+        conf_score=entry["RES_CONF_SCORE"],
+        res_status=entry["RES_STATUS"],
+        cxr_id=entry["CXR_ID"],
+        cxr_file_path=entry.get("CXR_FILE_PATH"),
+        pt_id=entry["PT_ID"],
+        fname=entry.get("PT_FNAME"),
+        mname=entry.get("PT_MNAME"),
+        lname=entry.get("PT_LNAME"),
+        sex=entry.get("PT_SEX"),
+        age=entry.get("PT_AGE"),
+        dob=entry.get("PT_DOB"),
+        phone=entry.get("PT_PHONE"),
+        house_no=entry.get("PT_HOUSENO"),
+        street=entry.get("PT_STREET"),
+        brgy=entry.get("PT_BRGY"),
+        city=entry.get("PT_CITY"),
+    )
+
+
+def _filter_cases(query, filters):
+    """
+        Apply the list filters other than the name search: the
+        CASE_EQUALITY_FILTERS and "date_from" / "date_to" (inclusive dates).
+    """
+    for name, column in CASE_EQUALITY_FILTERS.items():
+        if filters.get(name) is not None:
+            query = query.eq(column, filters[name])
+    if filters.get("date_from"):
+        query = query.gte("RES_DATE", datetime.combine(filters["date_from"], datetime.min.time()).isoformat())
+    if filters.get("date_to"):
+        query = query.lt("RES_DATE", (datetime.combine(filters["date_to"], datetime.min.time()) + timedelta(days=1)).isoformat())
+    return query
+
+
+def _fetch_case_page_after(filters, cursor, page_size):
+    """One page of cases starting after the (RES_DATE, RES_ID) `cursor` (None for the first page)."""
+    def build():
+        query = supabase.table("latest_patient_cases").select(CASE_COLUMNS, count="exact")
+        query = _filter_cases(query, dict(filters))
+        if cursor is not None:
+            res_date, res_id = cursor
+            query = query.or_(f'RES_DATE.lt."{res_date}",and(RES_DATE.eq."{res_date}",RES_ID.lt.{res_id})')
+        # One extra row tells whether another page follows
+        return query.order("RES_DATE", desc=True).order("RES_ID", desc=True).limit(page_size + 1)
+
+    result = run_query(
+        "fetch_case_page",
+        build,
+        params=(filters, cursor, page_size),
+        ttl=READ_CACHE_TTL,
+        tables=CASE_TABLES,
+    )
+    cases = [_case_row(entry) for entry in result.data[:page_size]]
+    next_cursor = (cases[-1].res_date, cases[-1].res_id) if len(result.data) > page_size else None
+    return CasePage(cases, result.count or 0, next_cursor)
+
+
+def _fetch_case_search_page(filters, page_num, page_size):
+    """
+        Page `page_num` of the cases whose patient name matches filters["name"]
+        (search_patient_cases), best match first. Ranked results are paged by
+        offset; next_cursor is the following page number.
+    """
+    other_filters = {name: value for name, value in filters if name != "name"}
+
+    def build():
+        query = supabase.rpc("search_patient_cases", {"p_query": dict(filters)["name"]}, count="exact")
+        query = _filter_cases(query, other_filters)
+        start = (page_num - 1) * page_size
+        return (query.order("SEARCH_RANK", desc=True).order("RES_DATE", desc=True).order("RES_ID", desc=True)
+                .range(start, start + page_size))
+
+    result = run_query(
+        "search_patient_cases",
+        build,
+        params=(filters, page_num, page_size),
+        ttl=READ_CACHE_TTL,
+        tables=CASE_TABLES,
+    )
+    cases = [_case_row(entry) for entry in result.data[:page_size]]
+    return CasePage(cases, result.count or 0, page_num + 1 if len(result.data) > page_size else None)
+
+
+def fetch_case_page(filters=None, page_num=1, page_size=10, cursors=None, prefetch=False):
+    """
+        Page `page_num` of the latest case per patient, newest first, matching
+        `filters` (see _filter_cases); with a "name" filter, the patient search
+        results instead, best match first. `cursors` is a dict the caller keeps
+        between calls (e.g. in st.session_state) recording where each visited
+        page starts; an unvisited page is reached by walking forward from the
+        nearest known one. With `prefetch`, the next page is loaded into the
+        query cache in the background.
+    """
+    filters = tuple(sorted((name, value) for name, value in (filters or {}).items() if value is not None))
+    if dict(filters).get("name"):
+        page = _fetch_case_search_page(filters, page_num, page_size)
+        if prefetch and page.next_cursor is not None:
+            threading.Thread(target=_fetch_case_search_page, args=(filters, page_num + 1, page_size), daemon=True).start()
+        return page
+
+    cursors = {} if cursors is None else cursors
+    # Page boundaries move when cases are written, so cursors from before a write are not reused
+    with _query_lock:
+        key = (filters, page_size, tuple(_table_versions.get(table, 0) for table in CASE_TABLES))
+
+    start = max(page for page in range(1, page_num + 1) if page == 1 or (key, page) in cursors)
+    page = _fetch_case_page_after(filters, cursors.get((key, start)), page_size)
+    while True:
+        if page.next_cursor is not None:
+            cursors[(key, start + 1)] = page.next_cursor
+        if start == page_num or page.next_cursor is None:
+            break
+        start += 1
+        page = _fetch_case_page_after(filters, page.next_cursor, page_size)
+
+    if prefetch and page.next_cursor is not None:
+        threading.Thread(target=_fetch_case_page_after, args=(filters, page.next_cursor, page_size), daemon=True).start()
+    return page
+
+
+def fetch_oldest_case_date():
+    """RES_DATE of the oldest case in the lists, or None when there are none."""
+    result = run_query(
+        "fetch_oldest_case_date",
+        lambda: supabase.table("latest_patient_cases").select("RES_DATE").order("RES_DATE").limit(1),
+        ttl=READ_CACHE_TTL,
+        tables=CASE_TABLES,
+    )
+    return result.data[0]["RES_DATE"] if result.data else None
+
+
+@blocking
+async def count_rows(table, column=None, value=None):
+    """Exact number of `table` rows (where `column` equals `value`), without fetching them."""
+    def build(client):
+        query = client.table(table).select(column or "*", count="exact", head=True)
+        return query if column is None else query.eq(column, value)
+
+    result = await run_query_async(
+        f"count_{table}_{column or 'all'}",
+        build,
+        params=(value,),
+        ttl=READ_CACHE_TTL,
+        tables=(table,),
+    )
+    return result.count or 0
+
+
+# --- Diagnoses ---
+RECENT_DIAGNOSIS_COLUMNS = """
+    DX_STATUS,
+    DX_UPDATED_AT,
+    CHEST_XRAY_Table!inner(
+        PT_ID,
+        PATIENT_Table!inner(PT_FNAME, PT_MNAME, PT_LNAME),
+        RESULT_Table!inner(RES_PRESUMPTIVE, RES_CONF_SCORE)
+    )
+"""
+
+
+@blocking
+async def fetch_recent_diagnoses(limit=5):
+    """
+        Latest updated diagnoses that have a patient and an AI result, joined
+        in a single request (previously two extra round trips per diagnosis).
+    """
+    result = await run_query_async(
+        "fetch_recent_diagnoses",
+        lambda client: client.table("DIAGNOSIS_Table").select(RECENT_DIAGNOSIS_COLUMNS)
+        .order("DX_UPDATED_AT", desc=True).limit(limit),
+        params=(limit,),
+        ttl=READ_CACHE_TTL,
+        tables=CASE_TABLES + ("DIAGNOSIS_Table",),
+    )
+
+    rows = []
+    for diag in result.data:
+        cxr = diag["CHEST_XRAY_Table"]
+        patient = cxr["PATIENT_Table"]
+        # A reverse embed comes back as a list unless CXR_ID is unique in RESULT_Table
+        ai_result = cxr["RESULT_Table"][0] if isinstance(cxr["RESULT_Table"], list) else cxr["RESULT_Table"]
+        rows.append(RecentDiagnosisRow(
+            pt_id=cxr["PT_ID"],
+            fname=patient["PT_FNAME"],
+            mname=patient.get("PT_MNAME"),
+            lname=patient["PT_LNAME"],
+            presumptive=ai_result["RES_PRESUMPTIVE"],
+            conf_score=ai_result.get("RES_CONF_SCORE") or 0,
+            dx_status=diag["DX_STATUS"],
+            dx_updated_at=diag["DX_UPDATED_AT"],
+        ))
+    return rows
+
+
+# --- X-ray Uploads ---
+RECENT_UPLOAD_COLUMNS = """
+    CXR_ID,
+    CXR_UPL_DATE,
+    PT_ID,
+    PATIENT_Table(PT_FNAME, PT_MNAME, PT_LNAME),
+    RESULT_Table(RES_PRESUMPTIVE, RES_CONF_SCORE, RES_STATUS)
+"""
+
+
+@blocking
+async def fetch_recent_uploads(limit=5):
+    """Latest uploaded X-rays with their patient and AI result, in a single request."""
+    result = await run_query_async(
+        "fetch_recent_uploads",
+        lambda client: client.table("CHEST_XRAY_Table").select(RECENT_UPLOAD_COLUMNS)
+        .order("CXR_UPL_DATE", desc=True).limit(limit),
+        params=(limit,),
+        ttl=READ_CACHE_TTL,
+        tables=CASE_TABLES,
+    )
+
+    rows = []
+    for entry in result.data:
+        patient = entry.get("PATIENT_Table") or {}
+        ai_results = entry.get("RESULT_Table") or []
+        # A reverse embed comes back as a list unless CXR_ID is unique in RESULT_Table
+        ai_result = (ai_results[0] if ai_results else {}) if isinstance(ai_results, list) else ai_results
+        rows.append(RecentUploadRow(
+            cxr_id=entry["CXR_ID"],
+            pt_id=entry.get("PT_ID"),
+            fname=patient.get("PT_FNAME"),
+            mname=patient.get("PT_MNAME"),
+            lname=patient.get("PT_LNAME"),
+            presumptive=ai_result.get("RES_PRESUMPTIVE"),
+            conf_score=ai_result.get("RES_CONF_SCORE"),
+            res_status=ai_result.get("RES_STATUS"),
+            upl_date=entry.get("CXR_UPL_DATE"),
+        ))
+    return rows
+
+
+# --- Reports (RESULT_Table → CHEST_XRAY_Table → PATIENT_Table / DIAGNOSIS_Table) ---
+REPORT_COLUMNS = """
+    CXR_ID,
+    RES_DATE,
+    RES_PRESUMPTIVE,
+    RES_CONF_SCORE,
+    RES_STATUS,
+    CHEST_XRAY_Table(
+        PT_ID,
+        PATIENT_Table(PT_AGE, PT_SEX, PT_BRGY),
+        DIAGNOSIS_Table(DX_STATUS, DX_NOTES, DX_UPDATED_AT)
+    )
+"""
+
+
+@blocking
+async def fetch_report_rows(year=None, month=None):
+    """
+        Every AI result dated in the period with the patient fields and the
+        latest diagnosis the report exports need, in a single request.
+    """
+    month = None if month == "All" else month
+    result = await run_query_async(
+        "fetch_report_rows",
+        lambda client: in_period(client.table("RESULT_Table").select(REPORT_COLUMNS), "RES_DATE", year, month),
+        params=(year, month),
+        ttl=READ_CACHE_TTL,
+        tables=CASE_TABLES + ("DIAGNOSIS_Table",),
+    )
+
+    rows = []
+    for entry in result.data:
+        cxr = entry.get("CHEST_XRAY_Table") or {}
+        patient = cxr.get("PATIENT_Table") or {}
+        diagnoses = cxr.get("DIAGNOSIS_Table") or []
+        if isinstance(diagnoses, dict):
+            diagnoses = [diagnoses]
+        # Same rule as the ai_result_outcomes view: the most recently updated diagnosis wins
+        diagnosis = max(diagnoses, key=lambda dx: dx.get("DX_UPDATED_AT") or "", default={})
+        rows.append(ReportRow(
+            cxr_id=entry["CXR_ID"],
+            res_date=entry.get("RES_DATE"),
+            presumptive=entry.get("RES_PRESUMPTIVE"),
+            conf_score=entry.get("RES_CONF_SCORE"),
+            res_status=entry.get("RES_STATUS"),
+            pt_id=cxr.get("PT_ID"),
+            age=patient.get("PT_AGE"),
+            sex=patient.get("PT_SEX"),
+            brgy=patient.get("PT_BRGY"),
+            dx_status=diagnosis.get("DX_STATUS"),
+            dx_notes=diagnosis.get("DX_NOTES"),
+            dx_updated_at=diagnosis.get("DX_UPDATED_AT"),
+        ))
+    return rows
+
+
+# --- AI Metrics (aggregated in Postgres, see sql/ai_metrics.sql) ---
+@blocking
+async def fetch_ai_metrics(year=None, month=None, by_month=False):
+    """
+        Confusion matrix, accuracy, sensitivity and specificity of the AI
+        results dated in `year` / `month` (None or "All" for every period).
+        Returns one AIMetrics, or a list with one per year/month when by_month.
+    """
+    month = None if month == "All" else month
+    result = await call_rpc_async(
+        "ai_performance_metrics", {"p_year": year, "p_month": month, "p_by_month": by_month},
+        ttl=READ_CACHE_TTL, tables=CASE_TABLES + ("DIAGNOSIS_Table",),
+    )
+    rows = [AIMetrics(**{field: row[field] for field in AIMetrics._fields}) for row in result.data]
+    if by_month:
+        return rows
+    return rows[0] if rows else AIMetrics(period_year=year, period_month=month)
+
+
+# --- Heatmap (confirmed case counts, see sql/heatmap_cube.sql) ---
+def fetch_heatmap_cells(year, month=None, barangay=None, age_group=None, sex=None):
+    """
+        Non-empty cells of the confirmed case cube in `year` (and `month`),
+        restricted to one barangay, age group or sex when given ("All" or None
+        for every value). At most a few hundred rows, whatever the case volume.
+    """
+    filters = {"MAP_MONTH": month, "MAP_BRGY": barangay, "MAP_AGE_GROUP": age_group, "MAP_SEX": sex}
+    filters = tuple((column, value) for column, value in filters.items() if value not in (None, "All"))
+
+    def build():
+        query = supabase.table("heatmap_case_cube").select("*").eq("MAP_YEAR", year)
+        for column, value in filters:
+            query = query.eq(column, value)
+        return query.order("MAP_BRGY")
+
+    result = run_query(
+        "fetch_heatmap_cells",
+        build,
+        params=(year, filters),
+        ttl=READ_CACHE_TTL,
+        tables=("HEATMAP_Table", "DIAGNOSIS_Table"),
+    )
+    return [HeatmapCell(row["MAP_BRGY"], row["MAP_YEAR"], row["MAP_MONTH"], row["MAP_AGE_GROUP"], row["MAP_SEX"],
+                        row["CASES"], row.get("MAP_LAT"), row.get("MAP_LANG")) for row in result.data]
+
+
+# --- Patients ---
+# PostgREST returns at most this many rows per request (its default max-rows)
+PATIENT_PAGE_SIZE = 1000
+
+
+def fetch_patient_names(page_size=PATIENT_PAGE_SIZE):
+    """Every patient's ID and name by last name, read page by page so none is cut off at the row limit."""
+    patients = []
+    start = 0
+    while True:
+        result = run_query(
+            "fetch_patient_names",
+            lambda: (supabase.table("PATIENT_Table").select("PT_ID, PT_FNAME, PT_MNAME, PT_LNAME")
+                     .order("PT_LNAME").order("PT_ID").range(start, start + page_size - 1)),
+            params=(start, page_size),
+            ttl=READ_CACHE_TTL,
+            tables=("PATIENT_Table",),
+        )
+        patients += [PatientName(row["PT_ID"], row["PT_FNAME"], row.get("PT_MNAME"), row["PT_LNAME"]) for row in result.data]
+        if len(result.data) < page_size:
+            return patients
+        start += page_size
+
+
+def find_duplicate_patients(fname, mname, lname, dob):
+    """
+        Patients born on `dob` whose names match or sound like the given ones
+        (see sql/patient_duplicates.sql), exact matches first.
+    """
+    result = call_rpc(
+        "find_duplicate_patients",
+        {"p_fname": fname, "p_mname": mname or "", "p_lname": lname, "p_dob": str(dob)},
+        ttl=0,  # registration must see patients saved moments ago
+    )
+    return [DuplicatePatient(row["PT_ID"], row["PT_FNAME"], row.get("PT_MNAME"), row["PT_LNAME"], row["MATCH"])
+            for row in result.data]
+
+
+# --- Users ---
+def get_user_by(column, value):
+    """The full USER_Table row whose `column` equals `value`, or None."""
+    result = run_query(
+        f"get_user_by_{column}",
+        lambda: supabase.table("USER_Table").select("*").eq(column, value),
+        params=(value,),
+        ttl=0,  # login and password reset must always see the current row
+    )
+    return result.data[0] if result.data else None
+
+
+# --- Dataset ---
+def fetch_dataset_labels():
+    result = run_query(
+        "fetch_dataset_labels",
+        lambda: supabase.table("DATASET_Table").select("DATA_FILE_PATH, DATA_LABEL"),
+    )
+    return [DatasetRow(row["DATA_FILE_PATH"], row["DATA_LABEL"]) for row in result.data]
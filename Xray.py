@@ -0,0 +1,297 @@
+# Xray.py
+#
+# Image handling shared by Registration, Records and Bulk Screening.
+#   python Xray.py benchmark          time/memory of preprocess_xray vs the previous pipeline
+#   python Xray.py validate [DIR]     assess_xray vs the previous validators on sample images
+
+import numpy as np
+from PIL import Image
+from skimage import filters
+
+IMG_SIZE = (512, 512)
+
+# Plausibility features are computed on the image shrunk to this fixed size
+# (smaller images are analysed as they are)
+ANALYSIS_SIZE = (512, 512)
+# Half-width, in original pixels, of the centre patch compared with the mean brightness
+CENTER_HALF_WIDTH = 50
+
+# (strict, relaxed) thresholds for every plausibility rule
+XRAY_THRESHOLDS = {
+    "aspect_ratio": ((0.7, 1.3), (0.6, 1.4)),
+    "max_mean_diff": (8, 15),
+    "min_intensity_range": (80, 50),
+    "min_entropy": (5.0, 4.0),
+    "min_contrast_std": (40, 30),
+    "min_edge_density": (0.1, 0.05),
+}
+
+# Large images are first shrunk with Image.reduce (box filter) until they are
+# within this factor of IMG_SIZE, then resampled with bicubic as before
+REDUCING_GAP = 3.0
+
+
+def preprocess_xray(uploaded_file, out=None):
+    """
+        Decode an upload into the (1, 512, 512, 3) float32 model input.
+        JPEGs are decoded in draft mode at the smallest 1/2, 1/4 or 1/8 scale
+        that is still at least 512x512, and the resized pixels are scaled
+        straight into `out` (allocated when not given) without float64 copies.
+    """
+    if out is None:
+        out = np.empty((1, IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32)
+
+    img = Image.open(uploaded_file)
+    img.draft("RGB", IMG_SIZE)
+    img = img.convert("RGB")
+    if img.size != IMG_SIZE:
+        img = img.resize(IMG_SIZE, Image.BICUBIC, reducing_gap=REDUCING_GAP)
+
+    pixels = np.frombuffer(img.tobytes(), dtype=np.uint8).reshape(IMG_SIZE[1], IMG_SIZE[0], 3)
+    np.divide(pixels, np.float32(255.0), out=out.reshape(IMG_SIZE[1], IMG_SIZE[0], 3))
+    return out
+
+
+def xray_features(img):
+    """
+        Compute every chest X-ray plausibility feature in one pass over a
+        fixed-size downsampled copy of the image. Only the aspect ratio and the
+        size of the centre patch come from the original dimensions.
+    """
+    width, height = img.size
+    img.draft("RGB", ANALYSIS_SIZE)
+    img = img.convert("RGB")
+    if img.width > ANALYSIS_SIZE[0] or img.height > ANALYSIS_SIZE[1]:
+        img = img.resize(ANALYSIS_SIZE, Image.BOX)
+    rgb = np.asarray(img, dtype=np.int16)
+
+    # Channel similarity (int16 so r - g cannot wrap around)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    mean_diff = (np.abs(r - g) + np.abs(r - b) + np.abs(g - b)).mean()
+
+    gray = rgb.mean(axis=-1)
+    mean_brightness = gray.mean()
+
+    hist, _ = np.histogram(gray, bins=256, range=(0, 255), density=True)
+    hist += 1e-8
+    entropy = -np.sum(hist * np.log2(hist))
+
+    # Edge density (rib cage usually creates many edges)
+    edge_density = (filters.sobel(gray) > 0.05).mean()
+
+    # Centre patch scaled from original pixels to the analysis grid
+    rows, cols = gray.shape
+    half_h = max(1, round(CENTER_HALF_WIDTH * rows / height))
+    half_w = max(1, round(CENTER_HALF_WIDTH * cols / width))
+    center_region = gray[rows // 2 - half_h:rows // 2 + half_h, cols // 2 - half_w:cols // 2 + half_w]
+
+    return {
+        "aspect_ratio": width / height,
+        "mean_diff": float(mean_diff),
+        "intensity_range": float(gray.max() - gray.min()),
+        "contrast_std": float(gray.std()),
+        "entropy": float(entropy),
+        "edge_density": float(edge_density),
+        "center_brightness": float(center_region.mean()),
+        "mean_brightness": float(mean_brightness),
+    }
+
+
+def assess_xray(img):
+    """
+        Check whether an image looks like a chest X-ray, returning
+        {"features": ..., "strict": bool, "relaxed": bool} from a single pass.
+        - Must be grayscale-like (R≈G≈B)
+        - Must have sufficient contrast and detail
+        - Must have rib-like edge density
+        - Must have near-square aspect ratio
+        - Must have brighter center (lungs) than edges
+        The relaxed verdict uses looser thresholds and allows an equally bright center.
+    """
+    features = xray_features(img)
+    verdicts = []
+    for level in (0, 1):
+        low, high = XRAY_THRESHOLDS["aspect_ratio"][level]
+        bright_center = (features["center_brightness"] > features["mean_brightness"] if level == 0
+                         else features["center_brightness"] >= features["mean_brightness"])
+        verdicts.append(all([
+            low <= features["aspect_ratio"] <= high,
+            features["mean_diff"] < XRAY_THRESHOLDS["max_mean_diff"][level],
+            features["intensity_range"] > XRAY_THRESHOLDS["min_intensity_range"][level],
+            features["entropy"] > XRAY_THRESHOLDS["min_entropy"][level],
+            features["contrast_std"] > XRAY_THRESHOLDS["min_contrast_std"][level],
+            features["edge_density"] > XRAY_THRESHOLDS["min_edge_density"][level],
+            bright_center,
+        ]))
+
+    return {"features": features, "strict": verdicts[0], "relaxed": verdicts[1]}
+
+
+def _peak_rss_kb():
+    # VmHWM starts fresh in a spawned process, unlike ru_maxrss which survives exec
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _benchmark_worker(pipeline, data, repeats, results):
+    import io
+    import time
+
+    fn = preprocess_xray if pipeline == "fast" else _legacy_preprocess_xray
+    baseline = _peak_rss_kb()
+    result = fn(io.BytesIO(data))
+    peak_kb = _peak_rss_kb() - baseline
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(io.BytesIO(data))
+    results.put((result, (time.perf_counter() - start) / repeats, peak_kb))
+
+
+def _legacy_preprocess_xray(uploaded_file):
+    img = Image.open(uploaded_file).convert("RGB")
+    img = img.resize(IMG_SIZE)
+    img_array = np.asarray(img, dtype=np.float32) / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def _legacy_is_xray_like(img, relaxed=False):
+    # The previous full-resolution is_xray_like / is_xray_like_relaxed, kept for `validate`
+    img_array = np.array(img)
+    r, g, b = img_array[..., 0], img_array[..., 1], img_array[..., 2]
+    mean_diff = (np.abs(r - g) + np.abs(r - b) + np.abs(g - b)).mean()
+    gray = np.mean(img_array, axis=-1)
+
+    h, w = gray.shape
+    low, high = XRAY_THRESHOLDS["aspect_ratio"][relaxed]
+    if not (low <= w / h <= high):
+        return False
+
+    hist, _ = np.histogram(gray, bins=256, range=(0, 255), density=True)
+    hist += 1e-8
+    entropy = -np.sum(hist * np.log2(hist))
+    edge_density = (filters.sobel(gray) > 0.05).mean()
+    h_mid, w_mid = h // 2, w // 2
+    center_brightness = np.mean(gray[h_mid-50:h_mid+50, w_mid-50:w_mid+50])
+
+    return all([
+        mean_diff < XRAY_THRESHOLDS["max_mean_diff"][relaxed],
+        gray.max() - gray.min() > XRAY_THRESHOLDS["min_intensity_range"][relaxed],
+        entropy > XRAY_THRESHOLDS["min_entropy"][relaxed] and gray.std() > XRAY_THRESHOLDS["min_contrast_std"][relaxed],
+        edge_density > XRAY_THRESHOLDS["min_edge_density"][relaxed],
+        center_brightness >= np.mean(gray) if relaxed else center_brightness > np.mean(gray),
+    ])
+
+
+if __name__ == "__main__":
+    import argparse
+    import io
+    import multiprocessing
+    import os
+    import time
+
+    def synthetic_xray(size, fmt):
+        width, height = size
+        yy, xx = np.mgrid[0:height, 0:width]
+        ribs = 128 + 60 * np.sin(yy / 25.0) * np.exp(-((xx - width / 2) / (width / 3)) ** 2)
+        noise = np.random.default_rng(0).normal(0, 10, (height, width))
+        gray = np.clip(ribs + noise, 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(gray).convert("RGB").save(buffer, fmt, quality=90)
+        return buffer.getvalue()
+
+    def synthetic_chest(size, seed=0, body=150, ribs=60, noise=12):
+        # Bright central body with horizontal rib bands, fading towards the borders
+        width, height = size
+        yy, xx = np.mgrid[0:height, 0:width]
+        falloff = np.exp(-((xx - width / 2) / (width / 2.5)) ** 2 - ((yy - height / 2) / (height / 2.5)) ** 2)
+        gray = 30 + (body + ribs * np.sin(yy / (height / 40))) * falloff
+        gray += np.random.default_rng(seed).normal(0, noise, (height, width))
+        return np.clip(gray, 0, 255).astype(np.uint8)
+
+    def synthetic_samples():
+        # Chest-like images that pass both checks, only the relaxed one, or neither, plus obvious non-X-rays
+        rng = np.random.default_rng(1)
+        arrays = {f"chest {w}x{h}": synthetic_chest((w, h), seed)
+                  for seed, (w, h) in enumerate([(512, 512), (1024, 1024), (2000, 1800), (3000, 3000)])}
+        arrays.update({
+            "chest 1400x1000 (wide)": synthetic_chest((1400, 1000)),
+            "chest 2000x1000 (too wide)": synthetic_chest((2000, 1000)),
+            "chest faint": synthetic_chest((1200, 1200), body=110, ribs=40, noise=8),
+            "chest very faint": synthetic_chest((1200, 1200), body=60, ribs=20, noise=4),
+            "flat grey": np.full((800, 800), 128, np.uint8),
+            "colour noise": rng.integers(0, 256, (900, 1200, 3), dtype=np.uint8),
+        })
+        samples = {}
+        for name, array in arrays.items():
+            buffer = io.BytesIO()
+            Image.fromarray(array).convert("RGB").save(buffer, "PNG")
+            samples[name] = buffer.getvalue()
+        return samples
+
+    def measure(pipeline, data, repeats=5):
+        # Fresh process per run so the peak RSS (including Pillow's decode buffers) is this pipeline's own.
+        # Linux only: reads VmHWM from /proc
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=_benchmark_worker, args=(pipeline, data, repeats, results))
+        process.start()
+        result = results.get()
+        process.join()
+        return result
+
+    def benchmark():
+        print(f"{'image':<22}{'pipeline':<10}{'ms/image':>10}{'peak MB':>10}{'max |Δ|':>10}")
+        for size in [(1024, 1024), (4000, 3000), (6000, 4500)]:
+            for fmt in ("JPEG", "PNG"):
+                data = synthetic_xray(size, fmt)
+                reference, legacy_time, legacy_peak = measure("legacy", data)
+                fast, fast_time, fast_peak = measure("fast", data)
+                label = f"{size[0]}x{size[1]} {fmt}"
+                print(f"{label:<22}{'legacy':<10}{legacy_time * 1000:>10.1f}{legacy_peak / 1024:>10.1f}{'':>10}")
+                print(f"{'':<22}{'fast':<10}{fast_time * 1000:>10.1f}{fast_peak / 1024:>10.1f}"
+                      f"{np.abs(fast - reference).max():>10.4f}")
+
+    def validate(directory=None):
+        if directory:
+            samples = {}
+            for name in sorted(os.listdir(directory)):
+                if name.lower().endswith((".png", ".jpg", ".jpeg")):
+                    with open(os.path.join(directory, name), "rb") as f:
+                        samples[name] = f.read()
+        else:
+            samples = synthetic_samples()
+
+        print(f"{'image':<28}{'legacy':>16}{'assess_xray':>16}{'legacy ms':>11}{'new ms':>9}")
+        mismatches = 0
+        for name, data in samples.items():
+            start = time.perf_counter()
+            img = Image.open(io.BytesIO(data)).convert("RGB")
+            legacy = (_legacy_is_xray_like(img), _legacy_is_xray_like(img, relaxed=True))
+            legacy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            verdict = assess_xray(Image.open(io.BytesIO(data)))
+            new_time = time.perf_counter() - start
+
+            new = (verdict["strict"], verdict["relaxed"])
+            mismatches += legacy != new
+            print(f"{name[:27]:<28}{str(legacy):>16}{str(new):>16}{legacy_time * 1000:>11.1f}{new_time * 1000:>9.1f}"
+                  f"{'' if legacy == new else '  <- differs'}")
+        print(f"{len(samples) - mismatches}/{len(samples)} verdicts match")
+        return mismatches == 0
+
+    parser = argparse.ArgumentParser(description="Benchmark and regression-check the X-ray image pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("benchmark", help="preprocess_xray time/memory against the previous pipeline")
+    validate_parser = subparsers.add_parser("validate", help="assess_xray verdicts against the previous validators")
+    validate_parser.add_argument("directory", nargs="?", help="folder of sample images (default: synthetic set)")
+
+    args = parser.parse_args()
+    if args.command == "benchmark":
+        benchmark()
+    else:
+        raise SystemExit(0 if validate(args.directory) else 1)
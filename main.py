@@ -1,21 +1,11 @@
 # main.py
 
 import streamlit as st
-import tensorflow as tf
-import os
-import gdown
 
 st.set_page_config(page_title="DeteXTB", layout="wide")
 
-# --- Model Download & Load ---
-MODEL_FILE = "deteXTB_final_mandaue_model.keras"
-MODEL_URL = "https://drive.google.com/uc?id=19Qi6uLhoTAz6QrH9cQC9oRR9rkSe5T91"
-
-if not os.path.exists(MODEL_FILE):
-    gdown.download(MODEL_URL, MODEL_FILE, quiet=False)
-
-if "model" not in st.session_state:
-    st.session_state.model = tf.keras.models.load_model(MODEL_FILE)
+# The TB model is not loaded here: Inference.py imports TensorFlow and loads the
+# model on first use, and the receptionist sidebar warms it up in the background
 
 # --- Auth and Theme Defaults ---
 if "authenticated" not in st.session_state:
@@ -0,0 +1,99 @@
+-- ai_metrics.sql
+--
+-- AI accuracy metrics computed inside Postgres, so the Dashboard and Reports no
+-- longer download RESULT_Table and send every CXR_ID back in an in_() filter.
+-- Apply in the Supabase SQL editor (or psql); re-running it is safe.
+--
+-- Local_Database.py mirrors these definitions in SQLite for offline checks;
+-- keep the two in step.
+
+-- One row per AI result with its outcome: the latest diagnosis of the X-ray,
+-- normalised to positive / negative / pending (NULL when unrecognised).
+create or replace view ai_result_outcomes as
+with latest_diagnosis as (
+    select
+        "CXR_ID",
+        "DX_STATUS",
+        row_number() over (partition by "CXR_ID" order by "DX_UPDATED_AT" desc nulls last) as recency
+    from "DIAGNOSIS_Table"
+)
+select
+    r."RES_ID",
+    r."CXR_ID",
+    x."PT_ID",
+    extract(year from r."RES_DATE"::timestamp)::int as res_year,
+    extract(month from r."RES_DATE"::timestamp)::int as res_month,
+    lower(trim(r."RES_PRESUMPTIVE")) as predicted,
+    case
+        when lower(d."DX_STATUS") like '%confirmed positive%' then 'positive'
+        when lower(d."DX_STATUS") like '%confirmed negative%' then 'negative'
+        when lower(trim(d."DX_STATUS")) = 'pending' then 'pending'
+    end as confirmed,
+    d."CXR_ID" is null as undiagnosed
+from "RESULT_Table" r
+left join "CHEST_XRAY_Table" x on x."CXR_ID" = r."CXR_ID"
+left join latest_diagnosis d on d."CXR_ID" = r."CXR_ID" and d.recency = 1;
+
+
+-- Confusion matrix and rates for one period (p_year / p_month NULL = all),
+-- or one row per year/month of that period when p_by_month is true.
+-- Rates are percentages rounded to 2 places, NULL when undefined.
+create or replace function ai_performance_metrics(
+    p_year int default null,
+    p_month int default null,
+    p_by_month boolean default false
+)
+returns table (
+    period_year int,
+    period_month int,
+    total_results bigint,
+    flagged_patients bigint,
+    pending_confirmations bigint,
+    tp bigint,
+    tn bigint,
+    fp bigint,
+    fn bigint,
+    evaluated bigint,
+    correct bigint,
+    accuracy numeric,
+    sensitivity numeric,
+    specificity numeric
+)
+language sql
+stable
+as $$
+    with counts as (
+        select
+            case when p_by_month then res_year else p_year end as period_year,
+            case when p_by_month then res_month else p_month end as period_month,
+            count(*) as total_results,
+            count(distinct "PT_ID") filter (where predicted = 'positive') as flagged_patients,
+            count(*) filter (where predicted = 'positive' and (undiagnosed or confirmed = 'pending')) as pending_confirmations,
+            count(*) filter (where predicted = 'positive' and confirmed = 'positive') as tp,
+            count(*) filter (where predicted = 'negative' and confirmed = 'negative') as tn,
+            count(*) filter (where predicted = 'positive' and confirmed = 'negative') as fp,
+            count(*) filter (where predicted = 'negative' and confirmed = 'positive') as fn,
+            count(*) filter (where confirmed in ('positive', 'negative')) as evaluated,
+            count(*) filter (where confirmed in ('positive', 'negative') and predicted = confirmed) as correct
+        from ai_result_outcomes
+        where (p_year is null or res_year = p_year)
+          and (p_month is null or res_month = p_month)
+        group by 1, 2
+    )
+    select
+        period_year,
+        period_month,
+        total_results,
+        flagged_patients,
+        pending_confirmations,
+        tp, tn, fp, fn,
+        evaluated,
+        correct,
+        round(100.0 * correct / nullif(evaluated, 0), 2) as accuracy,
+        round(100.0 * tp / nullif(tp + fn, 0), 2) as sensitivity,
+        round(100.0 * tn / nullif(tn + fp, 0), 2) as specificity
+    from counts
+    order by period_year, period_month;
+$$;
+
+grant execute on function ai_performance_metrics(int, int, boolean) to anon, authenticated;
@@ -0,0 +1,111 @@
+-- case_pages.sql
+--
+-- Latest AI result per patient, kept in a small indexed table so the Records,
+-- Results and Manage Cases lists page through it by keyset on ("RES_DATE",
+-- "RES_ID") instead of downloading the newest 1000 results and de-duplicating
+-- them in Python. Apply in the Supabase SQL editor (or psql); re-running it is
+-- safe and rebuilds latest_patient_result from RESULT_Table. It also drops the
+-- patient search built on latest_patient_cases, so re-apply patient_search.sql
+-- after it.
+
+drop function if exists search_patient_cases(text);
+drop view if exists patient_case_matches;
+drop view if exists latest_patient_cases;
+drop table if exists latest_patient_result;
+
+create index if not exists result_table_cxr_id on "RESULT_Table" ("CXR_ID");
+create index if not exists chest_xray_table_pt_id on "CHEST_XRAY_Table" ("PT_ID");
+
+-- One row per patient: the key of their most recent result
+create table latest_patient_result as
+select distinct on (x."PT_ID")
+    x."PT_ID",
+    r."RES_ID",
+    r."RES_DATE"
+from "RESULT_Table" r
+join "CHEST_XRAY_Table" x on x."CXR_ID" = r."CXR_ID"
+where r."RES_DATE" is not null
+order by x."PT_ID", r."RES_DATE" desc, r."RES_ID" desc;
+
+alter table latest_patient_result add primary key ("PT_ID");
+-- Serves the list order and the keyset condition of every page
+create index latest_patient_result_keyset on latest_patient_result ("RES_DATE" desc, "RES_ID" desc);
+
+
+-- Recompute the patient's row whenever one of their results is written
+create or replace function refresh_latest_patient_result()
+returns trigger
+language plpgsql
+security definer
+as $$
+declare
+    v_cxr_id "RESULT_Table"."CXR_ID"%type;
+    v_pt_id "CHEST_XRAY_Table"."PT_ID"%type;
+begin
+    if tg_op = 'DELETE' then
+        v_cxr_id := old."CXR_ID";
+    else
+        v_cxr_id := new."CXR_ID";
+    end if;
+
+    select "PT_ID" into v_pt_id from "CHEST_XRAY_Table" where "CXR_ID" = v_cxr_id;
+    if v_pt_id is null then
+        return null;
+    end if;
+
+    -- An upsert, so concurrent writes for the same patient do not collide on the key
+    insert into latest_patient_result ("PT_ID", "RES_ID", "RES_DATE")
+    select x."PT_ID", r."RES_ID", r."RES_DATE"
+    from "RESULT_Table" r
+    join "CHEST_XRAY_Table" x on x."CXR_ID" = r."CXR_ID"
+    where x."PT_ID" = v_pt_id and r."RES_DATE" is not null
+    order by r."RES_DATE" desc, r."RES_ID" desc
+    limit 1
+    on conflict ("PT_ID") do update
+    set "RES_ID" = excluded."RES_ID", "RES_DATE" = excluded."RES_DATE";
+
+    -- The patient's last dated result is gone
+    if not found then
+        delete from latest_patient_result where "PT_ID" = v_pt_id;
+    end if;
+
+    return null;
+end;
+$$;
+
+drop trigger if exists refresh_latest_patient_result on "RESULT_Table";
+create trigger refresh_latest_patient_result
+after insert or delete or update of "RES_DATE", "CXR_ID" on "RESULT_Table"
+for each row execute function refresh_latest_patient_result();
+
+
+-- The list rows: latest result, X-ray and patient. "RES_DATE" / "RES_ID" come
+-- from latest_patient_result so ordering and keyset filters use its index.
+create view latest_patient_cases as
+select
+    l."RES_ID",
+    l."RES_DATE",
+    r."RES_PRESUMPTIVE",
+    r."RES_CONF_SCORE",
+    r."RES_STATUS",
+    x."CXR_ID",
+    x."CXR_FILE_PATH",
+    p."PT_ID",
+    p."PT_FNAME",
+    p."PT_MNAME",
+    p."PT_LNAME",
+    p."PT_SEX",
+    p."PT_AGE",
+    p."PT_DOB",
+    p."PT_PHONE",
+    p."PT_HOUSENO",
+    p."PT_STREET",
+    p."PT_BRGY",
+    p."PT_CITY",
+    concat_ws(' ', p."PT_FNAME", p."PT_MNAME", p."PT_LNAME") as "PT_FULL_NAME"
+from latest_patient_result l
+join "RESULT_Table" r on r."RES_ID" = l."RES_ID"
+join "CHEST_XRAY_Table" x on x."CXR_ID" = r."CXR_ID"
+join "PATIENT_Table" p on p."PT_ID" = l."PT_ID";
+
+grant select on latest_patient_cases to anon, authenticated;
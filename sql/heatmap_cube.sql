@@ -0,0 +1,150 @@
+-- heatmap_cube.sql
+--
+-- Confirmed TB cases counted by barangay, year, month, age group and sex, kept
+-- up to date by triggers so the Heatmap reads a few hundred aggregate rows
+-- instead of every HEATMAP_Table row of the year with its diagnosis. Apply in
+-- the Supabase SQL editor (or psql); re-running it is safe and rebuilds the
+-- cube from HEATMAP_Table.
+
+drop table if exists heatmap_case_cube;
+
+create index if not exists heatmap_table_brgy on "HEATMAP_Table" ("MAP_BRGY");
+create index if not exists heatmap_table_dx_id on "HEATMAP_Table" ("DX_ID");
+
+-- One row per non-empty cell; "MAP_LAT" / "MAP_LANG" are the mean coordinates
+-- of its cases (the barangay's, as Manage Cases places them)
+create table heatmap_case_cube (
+    "MAP_BRGY" text not null,
+    "MAP_YEAR" int not null,
+    "MAP_MONTH" int not null,
+    "MAP_AGE_GROUP" text not null,
+    "MAP_SEX" text not null,
+    "CASES" int not null,
+    "MAP_LAT" double precision,
+    "MAP_LANG" double precision,
+    primary key ("MAP_YEAR", "MAP_MONTH", "MAP_BRGY", "MAP_AGE_GROUP", "MAP_SEX")
+);
+
+
+-- HEATMAP_Table rows of confirmed positive diagnoses with their cube key
+create or replace view heatmap_confirmed_cases as
+select
+    coalesce(h."MAP_BRGY", 'Unknown') as "MAP_BRGY",
+    extract(year from h."MAP_GENERATED_AT"::timestamp)::int as "MAP_YEAR",
+    extract(month from h."MAP_GENERATED_AT"::timestamp)::int as "MAP_MONTH",
+    coalesce(h."MAP_AGE_GROUP", 'Unknown') as "MAP_AGE_GROUP",
+    coalesce(h."MAP_SEX", 'Unknown') as "MAP_SEX",
+    h."MAP_LAT",
+    h."MAP_LANG"
+from "HEATMAP_Table" h
+join "DIAGNOSIS_Table" d on d."DX_ID" = h."DX_ID"
+where d."DX_STATUS" = 'Confirmed Positive'
+  and h."MAP_GENERATED_AT" is not null;
+
+insert into heatmap_case_cube
+select "MAP_BRGY", "MAP_YEAR", "MAP_MONTH", "MAP_AGE_GROUP", "MAP_SEX", count(*), avg("MAP_LAT"), avg("MAP_LANG")
+from heatmap_confirmed_cases
+group by 1, 2, 3, 4, 5;
+
+
+-- Recount the cube cell a HEATMAP_Table row falls in
+create or replace function refresh_heatmap_case_cube_cell(
+    p_brgy text,
+    p_generated_at text,
+    p_age_group text,
+    p_sex text
+)
+returns void
+language plpgsql
+security definer
+as $$
+declare
+    v_brgy text := coalesce(p_brgy, 'Unknown');
+    v_year int := extract(year from p_generated_at::timestamp)::int;
+    v_month int := extract(month from p_generated_at::timestamp)::int;
+    v_age_group text := coalesce(p_age_group, 'Unknown');
+    v_sex text := coalesce(p_sex, 'Unknown');
+begin
+    if p_generated_at is null then
+        return;
+    end if;
+
+    -- Serialize writers of the same cell until commit: a second writer waits here,
+    -- and its recount below then sees the first one's committed rows (READ
+    -- COMMITTED takes a new snapshot per statement), so neither count is lost
+    perform pg_advisory_xact_lock(hashtext(concat_ws('|', 'heatmap_case_cube', v_brgy, v_year, v_month, v_age_group, v_sex)));
+
+    insert into heatmap_case_cube
+    select v_brgy, v_year, v_month, v_age_group, v_sex, count(*), avg("MAP_LAT"), avg("MAP_LANG")
+    from heatmap_confirmed_cases
+    where "MAP_BRGY" = v_brgy and "MAP_YEAR" = v_year and "MAP_MONTH" = v_month
+      and "MAP_AGE_GROUP" = v_age_group and "MAP_SEX" = v_sex
+    having count(*) > 0
+    on conflict ("MAP_YEAR", "MAP_MONTH", "MAP_BRGY", "MAP_AGE_GROUP", "MAP_SEX") do update
+    set "CASES" = excluded."CASES", "MAP_LAT" = excluded."MAP_LAT", "MAP_LANG" = excluded."MAP_LANG";
+
+    -- The cell's last case is gone
+    if not found then
+        delete from heatmap_case_cube
+        where "MAP_YEAR" = v_year and "MAP_MONTH" = v_month and "MAP_BRGY" = v_brgy
+          and "MAP_AGE_GROUP" = v_age_group and "MAP_SEX" = v_sex;
+    end if;
+end;
+$$;
+
+
+-- A heatmap entry was added, moved (barangay, age group, sex, date) or removed
+create or replace function refresh_heatmap_case_cube()
+returns trigger
+language plpgsql
+security definer
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform refresh_heatmap_case_cube_cell(
+            old."MAP_BRGY", old."MAP_GENERATED_AT"::text, old."MAP_AGE_GROUP", old."MAP_SEX"
+        );
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform refresh_heatmap_case_cube_cell(
+            new."MAP_BRGY", new."MAP_GENERATED_AT"::text, new."MAP_AGE_GROUP", new."MAP_SEX"
+        );
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists refresh_heatmap_case_cube on "HEATMAP_Table";
+create trigger refresh_heatmap_case_cube
+after insert or delete or update on "HEATMAP_Table"
+for each row execute function refresh_heatmap_case_cube();
+
+
+-- A diagnosis changed status: its heatmap entries enter or leave the cube
+create or replace function refresh_heatmap_case_cube_for_diagnosis()
+returns trigger
+language plpgsql
+security definer
+as $$
+declare
+    v_entry record;
+begin
+    for v_entry in
+        select "MAP_BRGY", "MAP_GENERATED_AT"::text as generated_at, "MAP_AGE_GROUP", "MAP_SEX"
+        from "HEATMAP_Table"
+        where "DX_ID" = old."DX_ID"
+    loop
+        perform refresh_heatmap_case_cube_cell(
+            v_entry."MAP_BRGY", v_entry.generated_at, v_entry."MAP_AGE_GROUP", v_entry."MAP_SEX"
+        );
+    end loop;
+    return null;
+end;
+$$;
+
+drop trigger if exists refresh_heatmap_case_cube on "DIAGNOSIS_Table";
+create trigger refresh_heatmap_case_cube
+after delete or update of "DX_STATUS" on "DIAGNOSIS_Table"
+for each row execute function refresh_heatmap_case_cube_for_diagnosis();
+
+grant select on heatmap_case_cube to anon, authenticated;
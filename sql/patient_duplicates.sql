@@ -0,0 +1,94 @@
+-- patient_duplicates.sql
+--
+-- Duplicate-patient check for registration: one indexed lookup on date of
+-- birth and phonetic name keys that returns exact, near and similar-sounding
+-- matches together (previously two sequential ilike scans of PATIENT_Table).
+-- Apply in the Supabase SQL editor (or psql); re-running it is safe.
+--
+-- Local_Database.py mirrors these definitions in SQLite (the key functions
+-- are re-implemented in Python there); keep the two in step.
+
+-- Letters only, lower-cased: "De La Cruz" and "Dela Cruz" share a key
+create or replace function patient_name_key(p_name text)
+returns text
+language sql
+immutable
+parallel safe
+as $$
+    select regexp_replace(translate(lower(coalesce(p_name, '')), 'ñ', 'n'), '[^a-z]', '', 'g');
+$$;
+
+-- Folds spelling variants common in Filipino names so they compare equal:
+-- ph/f/p (Felipe, Pelipe), v/b (Vicente, Bicente), c/k/q, z/s, y/i, e/i and
+-- o/u (Rosario, Rusario), a silent h after a letter (Jhon, John) and doubled
+-- letters (Janette, Janete).
+create or replace function patient_phonetic_key(p_name text)
+returns text
+language sql
+immutable
+parallel safe
+as $$
+    select regexp_replace(
+        translate(
+            regexp_replace(
+                replace(replace(replace(patient_name_key(p_name), 'ph', 'f'), 'ck', 'k'), 'ny', 'n'),
+                '(.)h', '\1', 'g'
+            ),
+            'cqzvfyeo', 'kksbpiiu'
+        ),
+        '(.)\1+', '\1', 'g'
+    );
+$$;
+
+create index if not exists patient_table_duplicate_key on "PATIENT_Table"
+    ("PT_DOB", patient_phonetic_key("PT_LNAME"), patient_phonetic_key("PT_FNAME"));
+
+
+-- Patients born on p_dob whose first and last names sound like the given
+-- ones, classified as
+--   exact   same first, middle and last name (a blank or one-letter middle
+--           name only matches a blank one)
+--   near    same first and last name, different middle name
+--   similar names differ only by the variants patient_phonetic_key folds
+create or replace function find_duplicate_patients(
+    p_fname text,
+    p_mname text,
+    p_lname text,
+    p_dob "PATIENT_Table"."PT_DOB"%type
+)
+returns table (
+    "PT_ID" "PATIENT_Table"."PT_ID"%type,
+    "PT_FNAME" text,
+    "PT_MNAME" text,
+    "PT_LNAME" text,
+    "MATCH" text
+)
+language sql
+stable
+as $$
+    select "PT_ID", "PT_FNAME", "PT_MNAME", "PT_LNAME", "MATCH"
+    from (
+        select
+            p."PT_ID",
+            p."PT_FNAME"::text as "PT_FNAME",
+            p."PT_MNAME"::text as "PT_MNAME",
+            p."PT_LNAME"::text as "PT_LNAME",
+            case
+                when patient_name_key(p."PT_FNAME") <> patient_name_key(p_fname)
+                  or patient_name_key(p."PT_LNAME") <> patient_name_key(p_lname) then 'similar'
+                when patient_name_key(p."PT_MNAME") = case
+                    when length(patient_name_key(p_mname)) > 1 then patient_name_key(p_mname)
+                    else ''
+                end then 'exact'
+                else 'near'
+            end as "MATCH"
+        from "PATIENT_Table" p
+        where p."PT_DOB" = p_dob
+          and patient_phonetic_key(p."PT_LNAME") = patient_phonetic_key(p_lname)
+          and patient_phonetic_key(p."PT_FNAME") = patient_phonetic_key(p_fname)
+    ) matches
+    order by case "MATCH" when 'exact' then 0 when 'near' then 1 else 2 end
+    limit 20;
+$$;
+
+grant execute on function find_duplicate_patients to anon, authenticated;
@@ -0,0 +1,69 @@
+-- patient_search.sql
+--
+-- Patient name search for the case lists (Records, Results, Manage Cases),
+-- served from a trigram index instead of a substring scan over the rows the
+-- page happened to download. Needs case_pages.sql applied first. Apply in the
+-- Supabase SQL editor (or psql); re-running it is safe.
+
+create extension if not exists pg_trgm;
+
+-- Lower-cased "first middle last"; immutable so it can be indexed
+create or replace function patient_search_name(p_fname text, p_mname text, p_lname text)
+returns text
+language sql
+immutable
+parallel safe
+as $$
+    select lower(coalesce(p_fname, '') || ' ' || coalesce(p_mname, '') || ' ' || coalesce(p_lname, ''));
+$$;
+
+create index if not exists patient_table_search_name on "PATIENT_Table"
+using gin (patient_search_name("PT_FNAME", "PT_MNAME", "PT_LNAME") gin_trgm_ops);
+
+
+-- Row type of search_patient_cases: a latest_patient_cases row and its rank
+drop function if exists search_patient_cases(text);
+drop view if exists patient_case_matches;
+create view patient_case_matches as
+select c.*, null::real as "SEARCH_RANK"
+from latest_patient_cases c
+where false;
+
+
+-- Latest case of every patient whose name contains p_query or fuzzily matches
+-- it (pg_trgm word similarity, e.g. "jon dela cruz" finds "John De La Cruz").
+-- "SEARCH_RANK" orders a match at the start of a name part first, then any
+-- other substring, then fuzzy matches, each by similarity. PostgREST filters,
+-- ordering and range() apply to the result.
+create or replace function search_patient_cases(p_query text)
+returns setof patient_case_matches
+language sql
+stable
+as $$
+    with query as (
+        select lower(trim(p_query)) as q
+    ), pattern as (
+        -- q with the LIKE wildcards escaped, so "%" or "_" match only themselves
+        select q, replace(replace(replace(q, '\', '\\'), '%', '\%'), '_', '\_') as q_like
+        from query
+    )
+    select
+        c.*,
+        (
+            case
+                when (' ' || patient_search_name(c."PT_FNAME", c."PT_MNAME", c."PT_LNAME")) like '% ' || q_like || '%' then 2
+                when patient_search_name(c."PT_FNAME", c."PT_MNAME", c."PT_LNAME") like '%' || q_like || '%' then 1
+                else 0
+            end
+            + word_similarity(q, patient_search_name(c."PT_FNAME", c."PT_MNAME", c."PT_LNAME"))
+        )::real as "SEARCH_RANK"
+    from latest_patient_cases c, pattern
+    where q <> ''
+      and (
+          patient_search_name(c."PT_FNAME", c."PT_MNAME", c."PT_LNAME") like '%' || q_like || '%'
+          or q <% patient_search_name(c."PT_FNAME", c."PT_MNAME", c."PT_LNAME")
+      );
+$$;
+
+grant select on patient_case_matches to anon, authenticated;
+grant execute on function search_patient_cases(text) to anon, authenticated;